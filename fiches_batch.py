@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Gros lots en ligne de commande, avec journal de reprise.
+
+    python fiches_batch.py run ENTRÉES… --out DOSSIER [--config "footer_size=10"]
+    python fiches_batch.py resume DOSSIER [--retry-failed]
+
+run convertit chaque .docx (les dossiers sont parcourus récursivement) vers
+DOSSIER, en reproduisant l'arborescence de chaque dossier d'entrée. Le journal
+DOSSIER/.fiches_batch.jsonl reçoit d'abord le plan du lot (réglages,
+légende, liste entrée → sortie), puis une ligne par fiche terminée : empreinte
+de l'entrée, empreinte de la sortie, ou erreur. Chaque ligne est écrite et
+synchronisée (fsync) après la sortie qu'elle décrit ; un arrêt brutal perd
+au plus les conversions en cours.
+
+resume relit le journal et ne reconvertit que ce qui manque : une fiche déjà
+faite est sautée si son entrée n'a pas changé et si sa sortie est présente
+avec l'empreinte notée (sinon elle est refaite). Les échecs ne sont retentés
+qu'avec --retry-failed. Le lot reste lié à ses réglages et à sa légende :
+si la légende a changé, la reprise est refusée.
+
+Avec --index FICHIER, le texte relevé pendant la conversion alimente un index
+plein texte (fiches_index), cherchable dès la fin du lot.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from dataclasses import asdict, dataclass, field, fields, replace
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import fiches_metrics as metrics
+from fiches_index import FicheIndex
+from fiches_engine import (
+    FicheText,
+    ProcessingConfig,
+    _find_asset,
+    cleaned_filename,
+    config_fingerprint,
+    process_bytes,
+    unique_names,
+)
+
+JOURNAL_NAME = ".fiches_batch.jsonl"
+JOURNAL_VERSION = 1
+
+@dataclass
+class BatchReport:
+    """Bilan d'un passage (run ou resume)."""
+    total: int = 0
+    converted: int = 0
+    verified: int = 0            # déjà faites, sortie vérifiée par empreinte
+    failed: List[str] = field(default_factory=list)
+    skipped_failures: int = 0    # échecs d'un passage précédent, non retentés
+
+def _sha1_file(path: str) -> Optional[str]:
+    h = hashlib.sha1()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+# ───────────────────────── Conversion (processus worker) ────────────
+def _convert(args: Tuple[str, str, ProcessingConfig, Optional[bytes], bool]
+             ) -> Tuple[str, Optional[str], Optional[str], Optional[FicheText], dict]:
+    """
+    Convertit src vers dst ; renvoie (empreinte entrée, empreinte sortie,
+    erreur, texte pour l'index si demandé, métriques).
+    """
+    src, dst, cfg, legend_bytes, want_text = args
+    # Déjà dans un worker du pool : jamais de second pool de processus imbriqué
+    cfg = replace(cfg, pass_executor="thread")
+    try:
+        with open(src, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return "", None, f"lecture impossible : {e}", None, metrics.drain()
+    in_sha1 = hashlib.sha1(data).hexdigest()
+    text = FicheText() if want_text else None
+    try:
+        out = process_bytes(data, legend_bytes=legend_bytes, config=cfg, text_sink=text)
+    except Exception as e:
+        return in_sha1, None, str(e) or type(e).__name__, None, metrics.drain()
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".part"
+    with open(tmp, "wb") as f:
+        f.write(out)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    return in_sha1, hashlib.sha1(out).hexdigest(), None, text, metrics.drain()
+
+# ───────────────────────── Journal ──────────────────────────────────
+class Journal:
+    """Journal JSONL en ajout seul ; chaque ligne est durable avant le retour de write()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+    @staticmethod
+    def read(path: str) -> List[dict]:
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Dernière ligne tronquée par l'arrêt : la fiche sera refaite
+                    break
+        return records
+
+def collect_inputs(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """(chemin absolu, chemin de sortie relatif) de chaque .docx, sorties sans collision."""
+    items: List[Tuple[str, str]] = []
+    for top in paths:
+        top = os.path.abspath(top)
+        if os.path.isfile(top):
+            found = [(top, os.path.basename(top))]
+        else:
+            found = []
+            for dirpath, dirnames, filenames in os.walk(top):
+                dirnames.sort()
+                for n in sorted(filenames):
+                    if n.lower().endswith(".docx") and not n.startswith(("~$", ".")):
+                        path = os.path.join(dirpath, n)
+                        found.append((path, os.path.relpath(path, top)))
+        items.extend(found)
+    outs = unique_names(os.path.join(os.path.dirname(rel), cleaned_filename(os.path.basename(rel)))
+                        for _, rel in items)
+    return [(path, out) for (path, _), out in zip(items, outs)]
+
+# ───────────────────────── Exécution ────────────────────────────────
+def _execute(out_dir: str, plan: dict, journal: Journal, cfg: ProcessingConfig,
+             legend_bytes: Optional[bytes], done: Dict[str, dict], retry_failed: bool,
+             workers: Optional[int]) -> BatchReport:
+    index = FicheIndex(plan["index"]) if plan.get("index") else None
+    report = BatchReport(total=len(plan["items"]))
+    todo: List[Tuple[str, str]] = []
+    for src, out_rel in plan["items"]:
+        prev = done.get(src)
+        if prev is not None and prev["type"] == "failed" and not retry_failed:
+            report.skipped_failures += 1
+            report.failed.append(f"{src} : {prev['error']}")
+            continue
+        if prev is not None and prev["type"] == "done":
+            # Vérification par empreintes : entrée inchangée, sortie intacte
+            if (_sha1_file(src) == prev["input_sha1"]
+                    and _sha1_file(os.path.join(out_dir, out_rel)) == prev["output_sha1"]):
+                report.verified += 1
+                continue
+        todo.append((src, out_rel))
+
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+    queue = list(reversed(todo))
+    # Un worker tué (mémoire…) casse tout le pool : chaque fiche en cours a
+    # droit à une seconde tentative, celle qui casse encore est notée en échec.
+    crashes: Dict[str, int] = {}
+    try:
+        while queue or pending:
+            # Au plus deux fiches en attente par worker : mémoire bornée sur un gros lot
+            while queue and len(pending) < 2 * workers:
+                src, out_rel = queue.pop()
+                fut = pool.submit(_convert, (src, os.path.join(out_dir, out_rel), cfg, legend_bytes,
+                                             index is not None))
+                pending[fut] = (src, out_rel)
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for fut in finished:
+                src, out_rel = pending.pop(fut)
+                try:
+                    in_sha1, out_sha1, error, text, delta = fut.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    crashes[src] = crashes.get(src, 0) + 1
+                    if crashes[src] < 2:
+                        queue.append((src, out_rel))
+                        continue
+                    in_sha1, out_sha1, error, text, delta = "", None, f"worker interrompu : {e}", None, None
+                metrics.merge(delta)
+                if error is None:
+                    if index is not None and text is not None and text.body:
+                        # Indexée avant d'être journalisée : une reprise ne peut pas l'oublier.
+                        # Texte vide : fiche déjà tamponnée, son entrée d'index reste valable.
+                        index.add(out_rel, text)
+                    journal.write({"type": "done", "input": src, "output": out_rel,
+                                   "input_sha1": in_sha1, "output_sha1": out_sha1, "at": time.time()})
+                    report.converted += 1
+                else:
+                    journal.write({"type": "failed", "input": src, "error": error, "at": time.time()})
+                    report.failed.append(f"{src} : {error}")
+            if broken:
+                # Les autres fiches en cours ont sombré avec le pool : remises en file
+                queue.extend(pending.values())
+                pending.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if index is not None:
+            index.close()
+    return report
+
+def run_batch(inputs: Iterable[str], out_dir: str, config: Optional[ProcessingConfig] = None,
+              legend_path: Optional[str] = None, workers: Optional[int] = None,
+              index_path: Optional[str] = None) -> BatchReport:
+    """Nouveau lot : écrit le plan dans le journal puis convertit."""
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    journal_path = os.path.join(out_dir, JOURNAL_NAME)
+    if os.path.exists(journal_path):
+        raise ValueError(f"{journal_path} existe déjà : utiliser resume pour reprendre ce lot")
+    cfg = config or ProcessingConfig()
+    legend_bytes = _read_legend(legend_path)
+    plan = {
+        "type": "plan",
+        "version": JOURNAL_VERSION,
+        "config": asdict(cfg),
+        "legend": os.path.abspath(legend_path) if legend_path else None,
+        "index": os.path.abspath(index_path) if index_path else None,
+        "fingerprint": config_fingerprint(cfg, legend_bytes),
+        "items": collect_inputs(inputs),
+        "at": time.time(),
+    }
+    journal = Journal(journal_path)
+    try:
+        journal.write(plan)
+        return _execute(out_dir, plan, journal, cfg, legend_bytes, {}, False, workers)
+    finally:
+        journal.close()
+
+def resume_batch(out_dir: str, retry_failed: bool = False, workers: Optional[int] = None) -> BatchReport:
+    """Reprend le lot journalisé dans out_dir là où il s'est arrêté."""
+    out_dir = os.path.abspath(out_dir)
+    journal_path = os.path.join(out_dir, JOURNAL_NAME)
+    records = Journal.read(journal_path)
+    if not records or records[0].get("type") != "plan" or records[0].get("version") != JOURNAL_VERSION:
+        raise ValueError(f"{journal_path} : journal sans plan de lot lisible")
+    plan = records[0]
+    known = {f.name for f in fields(ProcessingConfig)}
+    cfg = ProcessingConfig(**{k: v for k, v in plan["config"].items() if k in known})
+    legend_bytes = _read_legend(plan["legend"])
+    if config_fingerprint(cfg, legend_bytes) != plan["fingerprint"]:
+        raise ValueError("la légende a changé depuis le début du lot : reprise refusée")
+    # Dernier état connu de chaque entrée
+    done = {r["input"]: r for r in records[1:] if r.get("type") in ("done", "failed")}
+    journal = Journal(journal_path)
+    try:
+        return _execute(out_dir, plan, journal, cfg, legend_bytes, done, retry_failed, workers)
+    finally:
+        journal.close()
+
+def _read_legend(path: Optional[str]) -> Optional[bytes]:
+    path = path or _find_asset(["Legende.png"])
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+def main(argv: Optional[List[str]] = None):
+    # Import tardif : le service n'est utile ici que pour lire --config
+    from fiches_service import config_from_query
+
+    parser = argparse.ArgumentParser(description="Conversion de gros lots avec journal de reprise")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="nouveau lot")
+    p_run.add_argument("inputs", nargs="+", help="fichiers .docx ou dossiers")
+    p_run.add_argument("--out", required=True, help="dossier de sortie (reçoit aussi le journal)")
+    p_run.add_argument("--config", default="", help="réglages au format query string (footer_size=10&…)")
+    p_run.add_argument("--legend", default=None, help="image de légende (défaut : assets/Legende.png)")
+    p_run.add_argument("--index", default=None, help="index plein texte à alimenter (fiches_index)")
+    p_resume = sub.add_parser("resume", help="reprendre un lot interrompu")
+    p_resume.add_argument("out", help="dossier de sortie du lot")
+    p_resume.add_argument("--retry-failed", action="store_true", help="retenter aussi les fiches en échec")
+    for p in (p_run, p_resume):
+        p.add_argument("--workers", type=int, default=None, help="processus de conversion (défaut : un par cœur)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "run":
+            report = run_batch(args.inputs, args.out, config_from_query(args.config, remote=False), args.legend,
+                               args.workers, args.index)
+        else:
+            report = resume_batch(args.out, args.retry_failed, args.workers)
+    except (ValueError, OSError, RuntimeError) as e:
+        raise SystemExit(str(e))
+    print(f"{report.total} fiches : {report.converted} converties, {report.verified} déjà faites (vérifiées), "
+          f"{len(report.failed)} en échec")
+    for line in report.failed:
+        print(f"  ⚠️ {line}", file=sys.stderr)
+    if report.failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3812 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur d'harmonisation des fiches DOCX, sans interface.
+
+Importable seul (workers, scripts, tests) : aucun effet de bord à l'import,
+Pillow n'est chargé qu'au premier calcul d'empreinte d'image.
+"""
+import io
+import zipfile
+import re
+import os
+import sys
+import inspect
+import unicodedata
+import hashlib
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from dataclasses import dataclass, asdict, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr, unescape
+from typing import Callable, Dict, Tuple, List, Optional, Set, Iterable
+
+import fiches_metrics as metrics
+from fiches_xml import SubElement, adopt, findall, fromstring, parents, tostring
+
+log = logging.getLogger(__name__)
+
+# ───────────────────────── Espaces de noms ─────────────────────────
+W   = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+WP  = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+A   = "http://schemas.openxmlformats.org/drawingml/2006/main"
+PIC = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+R   = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+P_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+WPS = "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
+VML_NS = "urn:schemas-microsoft-com:vml"
+
+NS = {"w": W, "wp": WP, "a": A, "pic": PIC, "r": R, "wps": WPS, "v": VML_NS}
+for k, v in NS.items():
+    ET.register_namespace(k, v)
+
+# ───────────────────────── Règles/constantes ───────────────────────
+# Paires d'années à transformer vers 2025 - 2026 (espaces / tirets flexibles)
+YEAR_PAT = re.compile(
+    r"(?:(?:2023|2024)"
+    r"[\u00A0\u2007\u202F\s]*[\-\u2010\u2011\u2012\u2013\u2014\u2212][\u00A0\u2007\u202F\s]*"
+    r"(?:2024|2025))"
+)
+# Remplacement standardisé
+REPL = "2025 - 2026"
+# Version du moteur inscrite dans le tampon d'idempotence des fiches produites
+ENGINE_VERSION = "2025.2"
+# Mentions d'actualisation à retirer du texte
+ACTUALISATION_PAT = re.compile(
+    r"(?iu)\b(actualisation|nouvelle\s+fiche|changements?\s+notables?|nouveau\s+cours|aucun\s+changement)\b"
+)
+
+# Fragments de chemin SVG caractéristiques pour différencier Annonce / Cible
+ANNONCE_SVG_SNIP = b"M1.98047 8.62184C1.88751 8.46071"
+CIBLE_SVG_SNIP   = b"M12.2656 2.73438 12.1094 1.32812"
+
+ROMAN_TITLE_RE = re.compile(r"^\s*[IVXLC]+\s*[.)]?\s+.+", re.IGNORECASE)
+
+# ───────────────────────── Utils ───────────────────────────────────
+def cm_to_emu(cm: float) -> int:
+    return int(round(cm * 360000))
+
+def emu_to_cm(emu: int) -> float:
+    return emu / 360000.0
+
+def get_text(p) -> str:
+    return "".join(t.text or "" for t in findall(p, ".//w:t", NS))
+
+# Les éléments sans enfant sont « faux » : toujours tester `is None`, jamais
+# `find(...) or SubElement(...)`, qui ajouterait un doublon à chaque appel.
+_W_RPR, _W_RFONTS, _W_SZ, _W_SZCS = f"{{{W}}}rPr", f"{{{W}}}rFonts", f"{{{W}}}sz", f"{{{W}}}szCs"
+_W_B, _W_I, _W_COLOR, _W_VAL = f"{{{W}}}b", f"{{{W}}}i", f"{{{W}}}color", f"{{{W}}}val"
+_A_RPR = f"{{{A}}}rPr"
+_CALIBRI_ATTRS = tuple(f"{{{W}}}{k}" for k in ("ascii", "hAnsi", "cs"))
+
+def _child(parent, tag: str):
+    """Premier enfant direct de balise tag, créé au besoin."""
+    el = parent.find(tag)
+    if el is None:
+        el = SubElement(parent, tag)
+    return el
+
+def _sole_child(parent, tag: str):
+    """Comme _child, en retirant les doublons laissés par les anciennes versions."""
+    found = parent.findall(tag)
+    if not found:
+        return SubElement(parent, tag)
+    for extra in found[1:]:
+        parent.remove(extra)
+    return found[0]
+
+def _set_attr(el, name: str, value: str):
+    if el.get(name) != value:
+        el.set(name, value)
+
+@dataclass(frozen=True)
+class RunPatch:
+    """Propriétés de run à imposer, valeurs w:val déjà formatées."""
+    size: Optional[str] = None
+    bold: Optional[bool] = None
+    italic: Optional[bool] = None
+    color: Optional[str] = None
+    calibri: bool = False
+
+@lru_cache(maxsize=256)
+def run_patch(size=None, bold=None, italic=None, color=None, calibri=False) -> RunPatch:
+    return RunPatch(None if size is None else str(int(round(size * 2))), bold, italic, color, calibri)
+
+def _toggle(rPr, tag: str, on: bool):
+    if on:
+        _set_attr(_sole_child(rPr, tag), _W_VAL, "1")
+    else:
+        for el in rPr.findall(tag):
+            rPr.remove(el)
+
+def apply_run_patch(run, patch: RunPatch):
+    """
+    Idempotent : un run déjà conforme n'est pas modifié, et les doublons
+    (w:rPr, w:sz…) écrits par les versions précédentes sont résorbés.
+    """
+    rPrs = run.findall(_W_RPR)
+    if not rPrs:
+        rPr = SubElement(run, _W_RPR)
+    else:
+        rPr = rPrs[0]
+        if len(rPrs) > 1:
+            # Fusion : chaque propriété une seule fois, la première rencontrée gagne
+            merged = []
+            seen: Set[str] = set()
+            for el in [c for r in rPrs for c in r]:
+                if el.tag not in seen:
+                    seen.add(el.tag)
+                    merged.append(el)
+            for r in rPrs:
+                for el in list(r):
+                    r.remove(el)
+            for extra in rPrs[1:]:
+                run.remove(extra)
+            rPr.extend(merged)
+    if len(run) and run[0] is not rPr:
+        # CT_R : w:rPr est toujours le premier enfant du run
+        run.remove(rPr)
+        run.insert(0, rPr)
+    if patch.calibri:
+        rFonts = _sole_child(rPr, _W_RFONTS)
+        for k in _CALIBRI_ATTRS:
+            _set_attr(rFonts, k, "Calibri")
+    if patch.size is not None:
+        _set_attr(_sole_child(rPr, _W_SZ), _W_VAL, patch.size)
+        _set_attr(_sole_child(rPr, _W_SZCS), _W_VAL, patch.size)
+    if patch.bold is not None:
+        _toggle(rPr, _W_B, patch.bold)
+    if patch.italic is not None:
+        _toggle(rPr, _W_I, patch.italic)
+    if patch.color is not None:
+        _set_attr(_sole_child(rPr, _W_COLOR), _W_VAL, patch.color)
+
+def set_run_props(run, size=None, bold=None, italic=None, color=None, calibri=False):
+    apply_run_patch(run, run_patch(size, bold, italic, color, calibri))
+
+def set_dml_text_size_in_txbody(txbody, pt: float):
+    val = str(int(round(pt * 100)))
+    for r in findall(txbody, ".//a:r", NS):
+        _set_attr(_child(r, _A_RPR), "sz", val)
+
+def redistribute(nodes, new):
+    lens = [len(n.text or "") for n in nodes]
+    pos = 0
+    for i, n in enumerate(nodes):
+        n.text = new[pos:pos + lens[i]] if i < len(nodes) - 1 else new[pos:]
+        if i < len(nodes) - 1:
+            pos += lens[i]
+
+def normalize_spaces(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    s = s.replace(" - ", " - ")
+    return s
+
+def _norm_matchable(s: str) -> str:
+    s = s.replace("\u00A0", " ")
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.lower()
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+# ───────────────────────── Remplacements texte ─────────────────────
+def replace_years(root):
+    for p in findall(root, ".//w:p", NS):
+        wts = findall(p, ".//w:t", NS)
+        if not wts:
+            continue
+        txt = "".join(t.text or "" for t in wts)
+        new = YEAR_PAT.sub(REPL, txt)
+        # Si le motif '2025 - 2026' est suivi de lettres (UN, P, Paris, etc.),
+        # on ne garde que '2025 - 2026'.
+        new = re.sub(rf"{re.escape(REPL)}\s*[A-Za-zÀ-ÿ]+", REPL, new)
+        if new != txt:
+            redistribute(wts, new)
+    for tx in findall(root, ".//a:txBody", NS):
+        ats = findall(tx, ".//a:t", NS)
+        if not ats:
+            continue
+        txt = "".join(t.text or "" for t in ats)
+        new = YEAR_PAT.sub(REPL, txt)
+        new = re.sub(rf"{re.escape(REPL)}\s*[A-Za-zÀ-ÿ]+", REPL, new)
+        if new != txt:
+            redistribute(ats, new)
+
+def strip_actualisation_everywhere(root):
+    for t in findall(root, ".//w:t", NS) + findall(root, ".//a:t", NS):
+        if t.text:
+            t.text = ACTUALISATION_PAT.sub("", t.text)
+
+def force_calibri(root):
+    patch = run_patch(calibri=True)
+    for r in findall(root, ".//w:r", NS):
+        apply_run_patch(r, patch)
+
+# ───────────────────────── Couleurs ────────────────────────────────
+def _hex_to_rgb(h: str) -> Optional[Tuple[int, int, int]]:
+    h = (h or "").strip().lstrip("#").upper()
+    if len(h) != 6 or not re.fullmatch(r"[0-9A-F]{6}", h):
+        return None
+    return int(h[0:2],16), int(h[2:4],16), int(h[4:6],16)
+
+RED_HEX = {
+    "FF0000","C00000","CC0000","E60000","ED1C24","F44336","DC143C","B22222","E74C3C","D0021B"
+}
+BLUE_HEX = {
+    "0000FF","0070C0","2E74B5","1F497D","2F5496","4F81BD","5B9BD5","1F4E79","0F4C81","1E90FF","3399FF","3C78D8"
+}
+
+
+def _looks_red(rgb: Tuple[int, int, int]) -> bool:
+    r, g, b = rgb
+    return (r >= 170 and g <= 110 and b <= 110)
+
+
+def _looks_blue(rgb: Tuple[int, int, int]) -> bool:
+    r, g, b = rgb
+    return (b >= 170 and r <= 110 and g <= 140)
+
+
+@lru_cache(maxsize=4096)
+def _hex_is_red_or_blue(val: str) -> bool:
+    if val in RED_HEX or val in BLUE_HEX:
+        return True
+    rgb = _hex_to_rgb(val)
+    return bool(rgb and (_looks_red(rgb) or _looks_blue(rgb)))
+
+# Correspondance w:themeColor -> entrée a:clrScheme de theme1.xml (clés en minuscules)
+_THEME_COLOR_SLOTS = {
+    "dark1": "dk1", "text1": "dk1", "light1": "lt1", "background1": "lt1",
+    "dark2": "dk2", "text2": "dk2", "light2": "lt2", "background2": "lt2",
+    "accent1": "accent1", "accent2": "accent2", "accent3": "accent3",
+    "accent4": "accent4", "accent5": "accent5", "accent6": "accent6",
+    "hyperlink": "hlink", "followedhyperlink": "folhlink",
+}
+
+def _apply_theme_tint_shade(rgb: Tuple[int, int, int], tint: Optional[str], shade: Optional[str]) -> Tuple[int, int, int]:
+    def frac(v: Optional[str]) -> Optional[float]:
+        try:
+            return int(v, 16) / 255.0 if v else None
+        except ValueError:
+            return None
+    t, s = frac(tint), frac(shade)
+    out = []
+    for x in rgb:
+        if s is not None:
+            x = x * s
+        if t is not None:
+            x = x * t + 255 * (1 - t)
+        out.append(max(0, min(255, int(round(x)))))
+    return out[0], out[1], out[2]
+
+class ColorClassifier:
+    """
+    Décision « rouge/bleu -> noir » partagée par red_to_black et les passes puces.
+    Le verdict est mis en cache par couleur (val, themeColor, themeTint, themeShade) :
+    une fiche réutilise quelques dizaines de couleurs sur des milliers de runs.
+    Les couleurs de thème sont résolues via extract_theme_colors.
+    """
+
+    def __init__(self, theme_colors: Optional[Dict[str, str]] = None):
+        self.theme_colors = theme_colors or {}
+        self._cache: Dict[Tuple[str, str, str, str], bool] = {}
+
+    def should_blacken(self, col: ET.Element) -> bool:
+        key = (
+            col.get(f"{{{W}}}val") or "",
+            col.get(f"{{{W}}}themeColor") or "",
+            col.get(f"{{{W}}}themeTint") or "",
+            col.get(f"{{{W}}}themeShade") or "",
+        )
+        return self.classify(*key)
+
+    def classify(self, val: str, theme: str = "", tint: str = "", shade: str = "") -> bool:
+        key = (val, theme, tint, shade)
+        verdict = self._cache.get(key)
+        if verdict is None:
+            verdict = self._cache[key] = self._decide(*key)
+        return verdict
+
+    def _decide(self, val: str, theme: str, tint: str, shade: str) -> bool:
+        val = val.strip().upper()
+        theme = theme.strip().lower()
+        if theme in ("hyperlink", "followedhyperlink"):
+            return True
+        if _hex_is_red_or_blue(val):
+            return True
+        slot = _THEME_COLOR_SLOTS.get(theme)
+        base_rgb = _hex_to_rgb(self.theme_colors.get(slot, "")) if slot else None
+        if base_rgb is None:
+            return False
+        r, g, b = _apply_theme_tint_shade(base_rgb, tint or None, shade or None)
+        return _hex_is_red_or_blue(f"{r:02X}{g:02X}{b:02X}")
+
+    def blacken(self, col: ET.Element) -> bool:
+        if not self.should_blacken(col):
+            return False
+        col.set(f"{{{W}}}val", "000000")
+        for a in ("themeColor", "themeTint", "themeShade"):
+            col.attrib.pop(f"{{{W}}}{a}", None)
+        return True
+
+
+# Sélecteurs des w:color visés par chaque passe ; scan_bytes les réutilise
+# pour annoncer exactement ce que la conversion noircirait.
+def _run_colors(root) -> list:
+    return findall(root, ".//w:r/w:rPr/w:color", NS)
+
+def _numbering_bullet_colors(root) -> list:
+    return findall(root, ".//w:lvl//w:rPr/w:color", NS)
+
+def _style_bullet_colors(root) -> list:
+    CANDIDATES = {"list","bullet","puce","puces","liste"}
+    found = []
+    for st in findall(root, ".//w:style[@w:type='paragraph']", NS):
+        name_el = st.find("w:name", NS)
+        style_id = (st.get(f"{{{W}}}styleId") or "").lower()
+        style_name = (name_el.get(f"{{{W}}}val") if name_el is not None else "").lower()
+        tag = (style_id + " " + style_name)
+        if not any(tok in tag for tok in CANDIDATES):
+            continue
+        col = st.find(".//w:rPr/w:color", NS)
+        if col is not None:
+            found.append(col)
+    return found
+
+def _numbered_paragraph_colors(root) -> list:
+    found = []
+    for p in findall(root, ".//w:p", NS):
+        pPr = p.find("w:pPr", NS)
+        if pPr is None or pPr.find("w:numPr", NS) is None:
+            continue
+        col = pPr.find("w:rPr/w:color", NS)
+        if col is not None:
+            found.append(col)
+    return found
+
+def red_to_black(root, colors: Optional[ColorClassifier] = None):
+    colors = colors if colors is not None else ColorClassifier()
+    for col in _run_colors(root):
+        colors.blacken(col)
+
+def force_red_bullets_black_in_numbering(root, colors: Optional[ColorClassifier] = None):
+    colors = colors if colors is not None else ColorClassifier()
+    for col in _numbering_bullet_colors(root):
+        colors.blacken(col)
+
+def force_red_bullets_black_in_styles(root, colors: Optional[ColorClassifier] = None):
+    colors = colors if colors is not None else ColorClassifier()
+    for col in _style_bullet_colors(root):
+        colors.blacken(col)
+
+def force_red_bullets_black_in_paragraphs(root, colors: Optional[ColorClassifier] = None):
+    colors = colors if colors is not None else ColorClassifier()
+    for col in _numbered_paragraph_colors(root):
+        colors.blacken(col)
+
+# Passe du registre -> sélecteur de ses couleurs (cf. PASSES)
+_COLOR_SELECTORS: Dict[str, Callable[[ET.Element], list]] = {
+    "red_to_black": _run_colors,
+    "red_bullets_paragraphs": _numbered_paragraph_colors,
+    "red_bullets_numbering": _numbering_bullet_colors,
+    "red_bullets_styles": _style_bullet_colors,
+}
+
+# ───────────────────────── Helpers couvertures (formes) ────────────
+def holder_pos_cm(holder) -> Tuple[float, float]:
+    try:
+        x = int(holder.findtext("wp:positionH/wp:posOffset", default="", namespaces=NS) or "0")
+        y = int(holder.findtext("wp:positionV/wp:posOffset", default="", namespaces=NS) or "0")
+        return (emu_to_cm(x), emu_to_cm(y))
+    except Exception:
+        return (0.0, 0.0)
+
+def get_tx_text(holder) -> str:
+    tx = holder.find(".//a:txBody", NS)
+    if tx is not None:
+        return "".join(t.text or "" for t in findall(tx, ".//a:t", NS))
+    txbx = holder.find(".//wps:txbx/w:txbxContent", NS)
+    if txbx is not None:
+        return "".join(t.text or "" for t in findall(txbx, ".//w:t", NS))
+    return ""
+
+def set_tx_size(holder, pt: float):
+    tx = holder.find(".//a:txBody", NS)
+    if tx is not None:
+        set_dml_text_size_in_txbody(tx, pt)
+    txbx = holder.find(".//wps:txbx/w:txbxContent", NS)
+    if txbx is not None:
+        patch = run_patch(size=pt)
+        for r in findall(txbx, ".//w:r", NS):
+            apply_run_patch(r, patch)
+
+# ───────────────────────── Mise en forme couverture ────────────────
+def cover_sizes_cleanup(root, config):
+    paras = findall(root, ".//w:p", NS)
+    texts = [get_text(p).strip() for p in paras]
+    def set_size(p, pt):
+        for r in findall(p, ".//w:r", NS):
+            set_run_props(r, size=pt)
+    last_was_fiche = False
+    for i, txt in enumerate(texts):
+        low = txt.lower()
+        if txt.strip().upper() in (
+            "ACTUALISATION",
+            "NOUVELLE FICHE",
+            "CHANGEMENTS NOTABLES",
+            "NOUVEAU COURS",
+            "AUCUN CHANGEMENT",
+        ):
+            for t in findall(paras[i], ".//w:t", NS):
+                if t.text:
+                    t.text = re.sub(
+                        r"(?iu)\b(actualisation|nouvelle\s+fiche|changements?\s+notables?|nouveau\s+cours|aucun\s+changement)\b",
+                        "",
+                        t.text,
+                    )
+            continue
+        if "fiche de cours" in low:
+            # Titre "Fiche de cours" en 20 pt
+            set_size(paras[i], config.cover_title_size)
+            # Bloc précédent non vide = matière, en 18 pt
+            for k in range(i - 1, -1, -1):
+                if get_text(paras[k]).strip():
+                    set_size(paras[k], config.cover_subject_size)
+                    break
+            last_was_fiche = True
+            continue
+        if last_was_fiche and txt:
+            # Bloc juste après "Fiche de cours" = nom du cours, en 22 pt
+            set_size(paras[i], config.course_name_size)
+            last_was_fiche = False
+        if "université" in low and (YEAR_PAT.search(txt.replace("\u00A0"," ")) or "universite" in low):
+            # Bloc université + année, en 10 pt
+            set_size(paras[i], config.university_year_size)
+        # Bloc "PLAN I / II ..." en 11 pt
+        if txt.strip().upper().startswith("PLAN"):
+            set_size(paras[i], config.plan_size)
+
+def tune_cover_shapes_spatial(root, config):
+    holders = []
+    for holder in findall(root, ".//wp:anchor", NS) + findall(root, ".//wp:inline", NS):
+        raw_txt = get_tx_text(holder)
+        txt = raw_txt.strip()
+        if not txt:
+            continue
+        x, y = holder_pos_cm(holder)
+        holders.append((y, x, holder, raw_txt))
+    if not holders:
+        return
+    holders.sort(key=lambda t: (t[0], t[1]))
+    # Bloc université + année en 10 pt et remplacer l'année
+    for _, _, h, txt in holders:
+        low = txt.strip().lower()
+        if ("universite" in low or "université" in low):
+            set_tx_size(h, config.university_year_size)
+    # Fiche de cours + matière + nom du cours
+    idx_fiche = None
+    for i, (_, _, h, txt) in enumerate(holders):
+        if "fiche de cours" in txt.strip().lower():
+            # Titre "Fiche de cours" en 20 pt
+            set_tx_size(h, config.cover_title_size)
+            idx_fiche = i
+            # Bloc précédent non vide = matière, en 18 pt
+            for k in range(i - 1, -1, -1):
+                prev_txt = holders[k][3].strip()
+                if prev_txt and "fiche de cours" not in prev_txt.lower():
+                    set_tx_size(holders[k][2], config.cover_subject_size)
+                    break
+            break
+    if idx_fiche is not None:
+        # Bloc suivant non vide = nom du cours, en 22 pt
+        for j in range(idx_fiche + 1, len(holders)):
+            txt_next = holders[j][3].strip()
+            if txt_next and "fiche de cours" not in txt_next.lower():
+                set_tx_size(holders[j][2], config.course_name_size)
+                break
+    # Bloc "PLAN ..." en 11 pt
+    for _, _, h, txt in holders:
+        if txt.strip().upper().startswith("PLAN"):
+            set_tx_size(h, config.plan_size)
+    for _, _, h, _ in holders:
+        tx = h.find(".//a:txBody", NS)
+        if tx is not None:
+            for t in findall(tx, ".//a:t", NS):
+                if t.text:
+                    t.text = re.sub(
+                        r"(?iu)\b(actualisation|nouvelle\s+fiche|changements?\s+notables?|nouveau\s+cours|aucun\s+changement)\b",
+                        "",
+                        t.text,
+                    )
+        txbx = h.find(".//wps:txbx/w:txbxContent", NS)
+        if txbx is not None:
+            for t in findall(txbx, ".//w:t", NS):
+                if t.text:
+                    t.text = re.sub(
+                        r"(?iu)\b(actualisation|nouvelle\s+fiche|changements?\s+notables?|nouveau\s+cours|aucun\s+changement)\b",
+                        "",
+                        t.text,
+                    )
+
+def force_title_fiche_de_cours_22(root, config):
+    """
+    Historiquement : forçaient le titre \"Fiche de cours\" à 22 pt.
+    Désormais on aligne avec la nouvelle maquette :
+      - \"Fiche de cours\" en 20 pt
+      - le bloc suivant (nom du cours) en 22 pt
+    """
+    for p in findall(root, ".//w:p", NS):
+        if "fiche de cours" in _norm_matchable(get_text(p)):
+            for r in findall(p, ".//w:r", NS):
+                set_run_props(r, size=config.cover_title_size)
+    for holder in findall(root, ".//wp:anchor", NS) + findall(root, ".//wp:inline", NS):
+        txt = get_tx_text(holder)
+        if txt and "fiche de cours" in _norm_matchable(txt):
+            set_tx_size(holder, config.cover_title_size)
+
+def force_course_name_after_title_20(root, config):
+    paras = findall(root, ".//w:p", NS)
+    for i, p in enumerate(paras):
+        if "fiche de cours" in _norm_matchable(get_text(p)):
+            for j in range(i+1, len(paras)):
+                if get_text(paras[j]).strip():
+                    # Bloc suivant = nom du cours, en 22 pt
+                    for r in findall(paras[j], ".//w:r", NS):
+                        set_run_props(r, size=config.course_name_size)
+                    break
+            break
+
+# ───────────────────────── Tables & numérotations ──────────────────
+def _is_dark_hex(hexv: Optional[str]) -> bool:
+    if not hexv: return False
+    rgb = _hex_to_rgb(hexv)
+    if not rgb: return False
+    r,g,b = rgb
+    return (r+g+b) < 200 and b >= max(r, g)
+
+_DARK_BLUE_SET = {"002060","1F4E79","0F4C81","1F497D","2F5496","112F4E","203764","23395D"}
+
+def _is_dark_fill(shd: Optional[ET.Element]) -> bool:
+    if shd is None:
+        return False
+    fill = (shd.get(f"{{{W}}}fill") or "").upper()
+    return fill in _DARK_BLUE_SET or _is_dark_hex(fill)
+
+def tables_and_numbering(root, config):
+    """
+    Un seul parcours en ordre de document : chaque run est mis en forme par la
+    ligne de son tableau le plus proche (en-tête = première ligne de ce
+    tableau), jamais par les tableaux qui l'englobent. L'ombrage de la cellule
+    courante est transmis en descendant, sans remonter les ancêtres.
+    """
+    tag_tbl, tag_tr, tag_tc = f"{{{W}}}tbl", f"{{{W}}}tr", f"{{{W}}}tc"
+    tag_p, tag_r = f"{{{W}}}p", f"{{{W}}}r"
+    header_patch = run_patch(size=config.table_header_size, bold=True)
+    body_patch = run_patch(size=config.table_body_size)
+    roman_paras: List[Tuple[ET.Element, bool]] = []
+
+    # (nœud, [ligne déjà vue] du tableau propriétaire, rôle de la ligne, cellule sombre)
+    stack: List[Tuple[ET.Element, Optional[list], Optional[bool], bool]] = [(root, None, None, False)]
+    while stack:
+        node, table, header, dark_cell = stack.pop()
+        tag = node.tag
+        if tag == tag_tbl:
+            table, header = [False], None
+        elif tag == tag_tr and table is not None:
+            header, table[0] = not table[0], True
+        elif tag == tag_tc:
+            dark_cell = _is_dark_fill(node.find("w:tcPr/w:shd", NS))
+        elif tag == tag_r and header is not None:
+            apply_run_patch(node, header_patch if header else body_patch)
+        elif tag == tag_p:
+            roman_paras.append((node, dark_cell))
+        stack.extend((child, table, header, dark_cell) for child in reversed(node))
+
+    # Titres en chiffres romains sur fond sombre : après les tableaux, qu'ils priment
+    for p, dark_cell in roman_paras:
+        txt = get_text(p).strip()
+        if not txt or not ROMAN_TITLE_RE.match(txt):
+            continue
+        if not (_is_dark_fill(p.find("w:pPr/w:shd", NS)) or dark_cell):
+            continue
+        for r in findall(p, ".//w:r", NS):
+            set_run_props(r, size=config.dark_block_size, bold=True, italic=True, color="FFFFFF")
+
+# ───────────────────────── Helpers couleurs formes ─────────────────
+def _pct(val: Optional[str]) -> float:
+    try:
+        return max(0.0, min(1.0, int(val)/100000.0))
+    except Exception:
+        return 1.0
+
+def _apply_lum(base_rgb: Tuple[int,int,int], lumMod: Optional[str], lumOff: Optional[str]) -> Tuple[int,int,int]:
+    mod = _pct(lumMod) if lumMod is not None else 1.0
+    off = _pct(lumOff) if lumOff is not None else 0.0
+    r,g,b = base_rgb
+    def f(x):
+        return max(0, min(255, int(round(x*mod + 255*off))))
+    return (f(r), f(g), f(b))
+
+def _resolve_solid_fill_color(spPr: ET.Element, theme_colors: Dict[str,str]) -> Optional[Tuple[int,int,int]]:
+    if spPr is None:
+        return None
+    solid = None
+    for el in spPr.iter():
+        if el.tag == f"{{{A}}}solidFill":
+            solid = el
+            break
+    if solid is None:
+        return None
+    srgb = solid.find("a:srgbClr", NS)
+    if srgb is not None and srgb.get("val"):
+        rgb = _hex_to_rgb(srgb.get("val"))
+        lm = srgb.find("a:lumMod", NS); lo = srgb.find("a:lumOff", NS)
+        if rgb and (lm is not None or lo is not None):
+            rgb = _apply_lum(rgb, lm.get("val") if lm is not None else None,
+                                  lo.get("val") if lo is not None else None)
+        return rgb
+    scheme = solid.find("a:schemeClr", NS)
+    if scheme is not None:
+        base_hex = theme_colors.get((scheme.get("val") or "").lower())
+        base_rgb = _hex_to_rgb(base_hex) if base_hex else None
+        lm = scheme.find("a:lumMod", NS); lo = scheme.find("a:lumOff", NS)
+        if base_rgb:
+            return _apply_lum(base_rgb, lm.get("val") if lm is not None else None,
+                                         lo.get("val") if lo is not None else None)
+    sysc = solid.find("a:sysClr", NS)
+    if sysc is not None:
+        base_hex = sysc.get("lastClr") or sysc.get("val")
+        base_rgb = _hex_to_rgb(base_hex)
+        lm = sysc.find("a:lumMod", NS); lo = sysc.find("a:lumOff", NS)
+        if base_rgb:
+            return _apply_lum(base_rgb, lm.get("val") if lm is not None else None,
+                                         lo.get("val") if lo is not None else None)
+    return None
+
+def _shape_has_text(holder: ET.Element) -> bool:
+    txt = get_tx_text(holder)
+    return bool(txt.strip())
+
+# ───────────────────────── Thème ───────────────────────────────────
+def extract_theme_colors(parts: Dict[str, bytes]) -> Dict[str, str]:
+    data = parts.get("word/theme/theme1.xml")
+    if not data:
+        return {}
+    try:
+        root = fromstring(data)
+    except ET.ParseError:
+        return {}
+    colors: Dict[str, str] = {}
+    cs = root.find(".//a:clrScheme", NS)
+    if cs is None:
+        return colors
+    for el in list(cs):
+        tag = re.sub(r"{.*}", "", el.tag)
+        srgb = el.find("a:srgbClr", NS)
+        if srgb is not None and srgb.get("val"):
+            colors[tag.lower()] = srgb.get("val", "").upper()
+        else:
+            sysc = el.find("a:sysClr", NS)
+            if sysc is not None and sysc.get("lastClr"):
+                colors[tag.lower()] = sysc.get("lastClr", "").upper()
+    return colors
+
+# ───────────────────────── Suppression rectangle gris ──────────────
+def remove_large_grey_rectangles(root: ET.Element, theme_colors: Dict[str, str]):
+    parent_map = parents(root)
+    for drawing in findall(root, ".//w:drawing", NS):
+        holder = drawing.find(".//wp:anchor", NS)
+        if holder is None:
+            holder = drawing.find(".//wp:inline", NS)
+        if holder is None:
+            continue
+        if holder.find(".//pic:pic", NS) is not None:
+            continue
+        prst = holder.find(".//a:prstGeom", NS)
+        if prst is None or prst.get("prst") not in ("rect", "roundRect"):
+            continue
+        extent = holder.find("wp:extent", NS)
+        if extent is None:
+            continue
+        try:
+            cx = int(extent.get("cx", "0")); cy = int(extent.get("cy", "0"))
+        except Exception:
+            continue
+        width_cm  = emu_to_cm(cx); height_cm = emu_to_cm(cy)
+        x_el = holder.find(".//wp:positionH/wp:posOffset", NS)
+        try:
+            x_cm = emu_to_cm(int(x_el.text)) if x_el is not None else 0.0
+        except Exception:
+            x_cm = 0.0
+        if _shape_has_text(holder):
+            continue
+        spPr = holder.find(".//a:spPr", NS)
+        if spPr is None:
+            spPr = holder.find(".//wps:spPr", NS)
+        if spPr is None:
+            for el in holder.iter():
+                if el.tag.endswith("spPr"):
+                    spPr = el; break
+        rgb = _resolve_solid_fill_color(spPr, theme_colors)
+        looks_gray = rgb is not None and \
+                     abs(rgb[0]-0xF2) <= 12 and abs(rgb[1]-0xF2) <= 12 and abs(rgb[2]-0xF2) <= 12
+        on_right   = x_cm >= 9.0
+        big_enough = (width_cm >= 7.0 and height_cm >= 12.0)
+        if looks_gray and on_right and big_enough:
+            parent = parent_map.get(drawing)
+            if parent is not None:
+                parent.remove(drawing)
+    for pict in findall(root, ".//w:pict", NS):
+        for tag in ("rect", "roundrect", "shape"):
+            for shape in findall(pict, f".//v:{tag}", NS):
+                style = (shape.get("style") or "")
+                m_w = re.search(r"width:([0-9.]+)cm", style)
+                m_h = re.search(r"height:([0-9.]+)cm", style)
+                m_l = re.search(r"left:([0-9.]+)cm", style)
+                if not (m_w and m_h):
+                    continue
+                w = float(m_w.group(1)); h = float(m_h.group(1))
+                left_cm = float(m_l.group(1)) if m_l else 0.0
+                fill_attr = (shape.get("fillcolor") or "").lstrip("#")
+                rgb = _hex_to_rgb(fill_attr.upper())
+                looks_gray = rgb is not None and \
+                             abs(rgb[0]-0xF2) <= 12 and abs(rgb[1]-0xF2) <= 12 and abs(rgb[2]-0xF2) <= 12
+                has_txbx = shape.find(".//w:txbxContent", NS) is not None
+                if looks_gray and not has_txbx and left_cm >= 9.0 and w >= 7.0 and h >= 12.0:
+                    parent = parent_map.get(pict)
+                    if parent is not None:
+                        parent.remove(pict)
+
+# ───────────────────────── Légende (optionnelle) ───────────────────
+def build_anchored_image(rId, width_cm, height_cm, left_cm, top_cm, name="Legende"):
+    cx, cy = cm_to_emu(width_cm), cm_to_emu(height_cm)
+    xoff, yoff = cm_to_emu(left_cm), cm_to_emu(top_cm)
+    drawing = ET.Element(f"{{{W}}}drawing")
+    anchor = SubElement(
+        drawing, f"{{{WP}}}anchor",
+        {"distT":"0","distB":"0","distL":"0","distR":"0","simplePos":"0","relativeHeight":"0",
+         "behindDoc":"0","locked":"0","layoutInCell":"1","allowOverlap":"1"}
+    )
+    SubElement(anchor, f"{{{WP}}}simplePos", {"x": "0", "y": "0"})
+    posH = SubElement(anchor, f"{{{WP}}}positionH", {"relativeFrom": "page"})
+    SubElement(posH, f"{{{WP}}}posOffset").text = str(xoff)
+    posV = SubElement(anchor, f"{{{WP}}}positionV", {"relativeFrom": "page"})
+    SubElement(posV, f"{{{WP}}}posOffset").text = str(yoff)
+    SubElement(anchor, f"{{{WP}}}extent", {"cx": str(cx), "cy": str(cy)})
+    SubElement(anchor, f"{{{WP}}}effectExtent", {"l": "0", "t": "0", "r": "0", "b": "0"})
+    SubElement(anchor, f"{{{WP}}}wrapNone")
+    SubElement(anchor, f"{{{WP}}}docPr", {"id": "10", "name": name})
+    SubElement(anchor, f"{{{WP}}}cNvGraphicFramePr")
+    graphic = SubElement(anchor, f"{{{A}}}graphic")
+    gData = SubElement(graphic, f"{{{A}}}graphicData", {"uri": "http://schemas.openxmlformats.org/drawingml/2006/picture"})
+    pic = SubElement(gData, f"{{{PIC}}}pic")
+    nvPicPr = SubElement(pic, f"{{{PIC}}}nvPicPr")
+    SubElement(nvPicPr, f"{{{PIC}}}cNvPr", {"id": "0", "name": name + ".img"})
+    SubElement(nvPicPr, f"{{{PIC}}}cNvPicPr")
+    blipFill = SubElement(pic, f"{{{PIC}}}blipFill")
+    SubElement(blipFill, f"{{{A}}}blip", {f"{{{R}}}embed": rId})
+    stretch = SubElement(blipFill, f"{{{A}}}stretch")
+    SubElement(stretch, f"{{{A}}}fillRect")
+    spPr = SubElement(pic, f"{{{PIC}}}spPr")
+    xfrm = SubElement(spPr, f"{{{A}}}xfrm")
+    SubElement(xfrm, f"{{{A}}}off", {"x": "0", "y": "0"})
+    SubElement(xfrm, f"{{{A}}}ext", {"cx": str(cx), "cy": str(cy)})
+    prst = SubElement(spPr, f"{{{A}}}prstGeom", {"prst": "rect"})
+    SubElement(prst, f"{{{A}}}avLst")
+    return drawing
+
+def remove_legend_text(document_xml: bytes) -> bytes:
+    root = fromstring(document_xml)
+    clear_legend_text(root)
+    return tostring(root)
+
+def clear_legend_text(root: ET.Element):
+    for p in findall(root, ".//w:p", NS):
+        if get_text(p).strip().lower() == "légendes":
+            for t in findall(p, ".//w:t", NS):
+                t.text = ""
+    lines = {
+        "Notion nouvelle cette année",
+        "Notion hors programme",
+        "Notion déjà tombée au concours",
+        "Astuces et méthodes",
+    }
+    for p in findall(root, ".//w:p", NS):
+        if get_text(p).strip() in lines:
+            for t in findall(p, ".//w:t", NS):
+                t.text = ""
+
+
+def remove_legend_cible_icons(root: ET.Element):
+    """Supprime uniquement l'icône Cible située dans la légende de couverture.
+
+    Le visuel concerné est systématiquement suivi du texte "Notion déjà tombée au concours".
+    On laisse intactes les autres occurrences de l'icône dans le reste du document.
+    """
+
+    target_norm = _norm_matchable("Notion déjà tombée au concours")
+    parent_map = parents(root)
+
+    for p in findall(root, ".//w:p", NS):
+        if target_norm not in _norm_matchable(get_text(p)):
+            continue
+
+        # Supprimer les drawings (inline/anchor) et pict éventuels situés dans ce paragraphe.
+        for drawing in list(findall(p, ".//w:drawing", NS)):
+            parent = parent_map.get(drawing)
+            if parent is not None:
+                parent.remove(drawing)
+                # Nettoyer le run porteur si vide après suppression
+                if parent.tag == f"{{{W}}}r":
+                    children = list(parent)
+                    if not [ch for ch in children if ch.tag != f"{{{W}}}rPr"]:
+                        run_parent = parent_map.get(parent)
+                        if run_parent is not None:
+                            run_parent.remove(parent)
+
+        for pict in list(findall(p, ".//w:pict", NS)):
+            parent = parent_map.get(pict)
+            if parent is not None:
+                parent.remove(pict)
+
+
+def insert_legend_image(
+    document_xml: bytes, rels_xml: bytes, image_bytes: bytes,
+    left_cm=2.3, top_cm=23.8, width_cm=5.68, height_cm=3.77,
+) -> Tuple[bytes, bytes, Tuple[str, bytes]]:
+    root = fromstring(document_xml)
+    rels = ET.fromstring(rels_xml)
+    media = insert_legend_in_tree(root, rels, image_bytes, left_cm, top_cm, width_cm, height_cm)
+    return (
+        tostring(root),
+        ET.tostring(rels, encoding="utf-8", xml_declaration=True),
+        media,
+    )
+
+def insert_legend_in_tree(
+    root: ET.Element, rels: ET.Element, image_bytes: bytes,
+    left_cm=2.3, top_cm=23.8, width_cm=5.68, height_cm=3.77,
+) -> Tuple[str, bytes]:
+    paras = findall(root, ".//w:p", NS)
+    idx = None
+    for i, p in enumerate(paras):
+        if get_text(p).strip().lower().startswith("légendes"):
+            idx = i; break
+    if idx is None and paras: idx = 0
+    nums = []
+    for rel in rels.findall(f".//{{{P_REL}}}Relationship"):
+        rid = rel.get("Id", "")
+        if rid.startswith("rId"):
+            try: nums.append(int(rid[3:]))
+            except Exception: pass
+    new_rid = f"rId{(max(nums) if nums else 0) + 1}"
+    media_name = "media/image_legende.png"
+    rel = SubElement(rels, f"{{{P_REL}}}Relationship")
+    rel.set("Id", new_rid)
+    rel.set("Type", "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image")
+    rel.set("Target", media_name)
+    drawing = build_anchored_image(new_rid, width_cm, height_cm, left_cm, top_cm, "Legende")
+    (SubElement(paras[idx], f"{{{W}}}r") if idx is not None else SubElement(SubElement(root, f"{{{W}}}p"), f"{{{W}}}r")).append(adopt(root, drawing))
+    return (f"word/{media_name}", image_bytes)
+
+# ───────────────────────── Reposition icône écriture ───────────────
+def reposition_small_icon(root, left_cm=15.3, top_cm=11.0):
+    cand = []
+    for anchor in findall(root, ".//wp:anchor", NS):
+        extent = anchor.find("wp:extent", NS)
+        if extent is None:
+            continue
+        try:
+            cx = int(extent.get("cx", "0")); cy = int(extent.get("cy", "0"))
+        except Exception:
+            continue
+        if anchor.find(".//pic:pic", NS) is None:
+            continue
+        if cx > cm_to_emu(3.0) or cy > cm_to_emu(3.0):
+            continue
+        x = anchor.findtext("wp:positionH/wp:posOffset", default="0", namespaces=NS)
+        y = anchor.findtext("wp:positionV/wp:posOffset", default="0", namespaces=NS)
+        try:
+            x_cm = emu_to_cm(int(x)); y_cm = emu_to_cm(int(y))
+        except Exception:
+            x_cm, y_cm = 0.0, 0.0
+        cand.append((x_cm, y_cm, anchor))
+    if not cand:
+        return
+    chosen = max(cand, key=lambda t: t[0])
+    anchor = chosen[2]
+    posH = _child(anchor, f"{{{WP}}}positionH")
+    for ch in list(posH): posH.remove(ch)
+    posH.set("relativeFrom", "page")
+    SubElement(posH, f"{{{WP}}}posOffset").text = str(cm_to_emu(left_cm))
+    posV = _child(anchor, f"{{{WP}}}positionV")
+    for ch in list(posV): posV.remove(ch)
+    posV.set("relativeFrom", "page")
+    SubElement(posV, f"{{{WP}}}posOffset").text = str(cm_to_emu(top_cm))
+
+# ───────────────────────── Pieds de page 10 pt ─────────────────────
+def set_dml_text_size(root, pt: float):
+    set_dml_text_size_in_txbody(root, pt)
+
+def force_footer_size_10(root, config):
+    patch = run_patch(size=config.footer_size)
+    for r in findall(root, ".//w:r", NS):
+        if r.find("w:fldChar", NS) is not None or r.find("w:instrText", NS) is not None:
+            continue
+        apply_run_patch(r, patch)
+    set_dml_text_size(root, config.footer_size)
+
+
+# ───────────────────────── Fusion des runs ─────────────────────────
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+# Attributs de révision sans effet visuel : ignorés pour la comparaison des runs
+_RUN_RSID_ATTRS = {f"{{{W}}}rsidR", f"{{{W}}}rsidRPr", f"{{{W}}}rsidDel"}
+
+def _run_merge_key(run: ET.Element) -> Optional[Tuple[Tuple[Tuple[str, str], ...], bytes]]:
+    """
+    Clé de fusion d'un run purement textuel (w:rPr + w:t uniquement).
+    Retourne None pour tout run portant autre chose (champ, dessin, tabulation,
+    saut, note...) : ces runs ne sont jamais fusionnés.
+    """
+    rPr = None
+    has_text = False
+    for ch in run:
+        if ch.tag == f"{{{W}}}rPr":
+            rPr = ch
+        elif ch.tag == f"{{{W}}}t":
+            has_text = True
+        else:
+            return None
+    if not has_text:
+        return None
+    attrs = tuple(sorted((k, v) for k, v in run.attrib.items() if k not in _RUN_RSID_ATTRS))
+    return attrs, (ET.tostring(rPr) if rPr is not None else b"")
+
+def coalesce_runs(root: ET.Element) -> int:
+    """
+    Fusionne les w:r adjacents de même mise en forme (rPr identiques) pour
+    réduire la fragmentation laissée par Word et par les passes d'harmonisation.
+    Un signet, un champ ou un dessin entre deux runs est un élément frère :
+    il casse l'adjacence et empêche la fusion. Retourne le nombre de runs supprimés.
+    """
+    merged = 0
+    for parent in findall(root, ".//w:r/..", NS):
+        prev = prev_key = None
+        for child in list(parent):
+            key = _run_merge_key(child) if child.tag == f"{{{W}}}r" else None
+            if key is None or key != prev_key:
+                prev, prev_key = (child, key) if key is not None else (None, None)
+                continue
+            target = findall(prev, "w:t", NS)[-1]
+            text = (target.text or "") + "".join(t.text or "" for t in findall(child, "w:t", NS))
+            target.text = text
+            if text != text.strip() or "  " in text:
+                target.set(XML_SPACE, "preserve")
+            parent.remove(child)
+            merged += 1
+    return merged
+
+# ───────────────────────── Styles de caractère partagés ────────────
+# Propriétés sans effet « bascule » : un style de caractère les applique
+# exactement comme la mise en forme directe (ordre imposé par le schéma).
+# w:b / w:i sont exclus : dans un style, ils s'inversent avec ceux du style de paragraphe.
+_PROMOTABLE_RPR = ("rFonts", "color", "sz", "szCs")
+_STYLE_PROMOTION_PARTS = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+
+def _promotable_signature(rPr: Optional[ET.Element]) -> Optional[Tuple[bytes, ...]]:
+    if rPr is None or rPr.find("w:rStyle", NS) is not None:
+        return None
+    found: Dict[str, bytes] = {}
+    for ch in rPr:
+        local = ch.tag.split("}", 1)[-1]
+        if local not in _PROMOTABLE_RPR:
+            continue
+        if local in found:
+            # Propriété en double : ambigu, on ne touche pas au run
+            return None
+        found[local] = ET.tostring(ch)
+    if not found:
+        return None
+    return tuple(found.get(k, b"") for k in _PROMOTABLE_RPR)
+
+def promote_run_styles(parts: Dict[str, bytes], min_runs: int = 20) -> int:
+    """
+    Définit une seule fois dans word/styles.xml les combinaisons rFonts/color/sz
+    répétées sur au moins min_runs runs, sous forme de styles de caractère,
+    et remplace la mise en forme directe de ces runs par un w:rStyle.
+    Retourne le nombre de styles créés.
+    """
+    if "word/styles.xml" not in parts:
+        return 0
+    roots: Dict[str, ET.Element] = {}
+    counts: Dict[Tuple[bytes, ...], int] = {}
+    for name, data in parts.items():
+        if not _STYLE_PROMOTION_PARTS.match(name):
+            continue
+        try:
+            root = fromstring(data)
+        except ET.ParseError:
+            continue
+        roots[name] = root
+        for rPr in findall(root, ".//w:r/w:rPr", NS):
+            sig = _promotable_signature(rPr)
+            if sig is not None:
+                counts[sig] = counts.get(sig, 0) + 1
+    frequent = sorted(sig for sig, n in counts.items() if n >= min_runs)
+    if not frequent:
+        return 0
+    try:
+        styles = fromstring(parts["word/styles.xml"])
+    except ET.ParseError:
+        return 0
+
+    existing = {st.get(f"{{{W}}}styleId") for st in findall(styles, "w:style", NS)}
+    style_ids: Dict[Tuple[bytes, ...], str] = {}
+    n = 0
+    for sig in frequent:
+        n += 1
+        while f"FichesCar{n}" in existing:
+            n += 1
+        sid = f"FichesCar{n}"
+        style = SubElement(styles, f"{{{W}}}style", {
+            f"{{{W}}}type": "character", f"{{{W}}}customStyle": "1", f"{{{W}}}styleId": sid,
+        })
+        SubElement(style, f"{{{W}}}name", {f"{{{W}}}val": f"Fiches Car {n}"})
+        rPr = SubElement(style, f"{{{W}}}rPr")
+        for frag in sig:
+            if frag:
+                rPr.append(adopt(rPr, ET.fromstring(frag)))
+        style_ids[sig] = sid
+
+    for name, root in roots.items():
+        changed = False
+        for rPr in findall(root, ".//w:r/w:rPr", NS):
+            sid = style_ids.get(_promotable_signature(rPr))
+            if sid is None:
+                continue
+            for ch in list(rPr):
+                if ch.tag.split("}", 1)[-1] in _PROMOTABLE_RPR:
+                    rPr.remove(ch)
+            rPr.insert(0, rPr.makeelement(f"{{{W}}}rStyle", {f"{{{W}}}val": sid}))
+            changed = True
+        if changed:
+            parts[name] = tostring(root)
+    parts["word/styles.xml"] = tostring(styles)
+    return len(style_ids)
+
+# ───────────────────────── Optimisation des médias ─────────────────
+# Étape optionnelle (cfg.enable_media_optimization) : une image n'est jamais
+# affichée plus grande que son cadre wp:extent ; au-delà de media_target_dpi
+# sur ce cadre, les pixels ne servent qu'à alourdir l'archive.
+IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+_EMU_PER_INCH = 914400
+_OPTIMIZABLE_MEDIA = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+# Marge avant de rééchantillonner : inutile de retoucher une image presque à la cible
+_RESIZE_SLACK = 1.15
+# Une photo PNG ne passe en JPEG que si le gain dépasse 30 %
+_JPEG_MIN_GAIN = 0.7
+# Photo : plus d'une couleur distincte pour 16 pixels (une capture d'écran en a bien moins)
+_PHOTO_PIXELS_PER_COLOR = 16
+_MISS = object()
+
+class _LockedLRU:
+    """
+    Cache LRU borné, protégé par un verrou : avec pass_workers > 1, les parties
+    d'une fiche (corps, en-têtes, pieds) le consultent depuis plusieurs threads.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def setdefault(self, key, value):
+        with self._lock:
+            if key in self._data:
+                return self._data[key]
+            self._store(key, value)
+            return value
+
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+# (sha1, largeur, hauteur, qualité, JPEG permis) → (format, octets, redimensionnée) ou None
+_OPTIMIZED_MEDIA = _LockedLRU(64)
+
+@dataclass
+class MediaReport:
+    """Bilan de l'optimisation des médias d'une fiche."""
+    images: int = 0
+    resized: int = 0
+    recompressed: int = 0
+    converted_to_jpeg: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+def _needed_pixels(cx_emu: int, cy_emu: int, dpi: int) -> Tuple[int, int]:
+    return (max(1, round(cx_emu / _EMU_PER_INCH * dpi)), max(1, round(cy_emu / _EMU_PER_INCH * dpi)))
+
+def _has_alpha(im) -> bool:
+    if im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info):
+        alpha = im.convert("RGBA").getchannel("A")
+        return alpha.getextrema() != (255, 255)
+    return False
+
+def _optimize_image(data: bytes, fmt: str, need_w: int, need_h: int, quality: int,
+                    allow_jpeg: bool) -> Optional[Tuple[str, bytes, bool]]:
+    """
+    (format, octets, redimensionnée) si une version plus légère existe, sinon
+    None. Sans redimensionnement, un JPEG n'est jamais réencodé (perte sans
+    gain de définition) ; un PNG est recompressé sans perte, puis converti en
+    JPEG s'il est opaque, photographique et nettement plus léger ainsi.
+    """
+    try:
+        from PIL import Image  # import paresseux, comme pour _ahash
+        with Image.open(io.BytesIO(data)) as im:
+            if getattr(im, "n_frames", 1) > 1:
+                return None
+            im.load()
+            info = {k: im.info[k] for k in ("icc_profile", "exif") if k in im.info}
+            scale = max(need_w / im.width, need_h / im.height)
+            resized = scale * _RESIZE_SLACK < 1
+            if not resized and fmt == "JPEG":
+                return None
+            work = im
+            if resized:
+                if work.mode not in ("RGB", "RGBA", "L", "LA"):
+                    work = work.convert("RGBA" if _has_alpha(work) else "RGB")
+                size = (max(1, round(im.width * scale)), max(1, round(im.height * scale)))
+                work = work.resize(size, Image.LANCZOS)
+            best_fmt, best = fmt, None
+            buf = io.BytesIO()
+            if fmt == "JPEG":
+                work.convert("RGB").save(buf, "JPEG", quality=quality, optimize=True, **info)
+            else:
+                work.save(buf, "PNG", optimize=True, **{k: v for k, v in info.items() if k == "icc_profile"})
+            best = buf.getvalue()
+            if fmt == "PNG" and allow_jpeg and not _has_alpha(work) and work.mode != "1":
+                rgb = work.convert("RGB")
+                max_colors = max(256, min(1 << 16, rgb.width * rgb.height // _PHOTO_PIXELS_PER_COLOR))
+                if rgb.getcolors(maxcolors=max_colors) is None:
+                    buf = io.BytesIO()
+                    rgb.save(buf, "JPEG", quality=quality, optimize=True, **info)
+                    if len(buf.getvalue()) < _JPEG_MIN_GAIN * len(best):
+                        best_fmt, best = "JPEG", buf.getvalue()
+    except Exception:
+        return None
+    if len(best) >= len(data):
+        return None
+    return best_fmt, best, resized
+
+def _optimize_image_cached(data: bytes, fmt: str, need: Tuple[int, int], quality: int,
+                           allow_jpeg: bool) -> Optional[Tuple[str, bytes, bool]]:
+    key = (_sha1(data), need[0], need[1], quality, allow_jpeg)
+    result = _OPTIMIZED_MEDIA.get(key, _MISS)
+    if result is not _MISS:
+        metrics.inc("fiches_cache_requests_total", cache="optimized_media", result="hit")
+        return result
+    metrics.inc("fiches_cache_requests_total", cache="optimized_media", result="miss")
+    result = _optimize_image(data, fmt, need[0], need[1], quality, allow_jpeg)
+    _OPTIMIZED_MEDIA.put(key, result)
+    return result
+
+def optimize_legend(legend_bytes: bytes, cfg: "ProcessingConfig",
+                    report: Optional[MediaReport] = None) -> bytes:
+    """Légende ramenée à media_target_dpi sur son cadre avant insertion (reste un PNG)."""
+    need = _needed_pixels(cm_to_emu(cfg.legend_w), cm_to_emu(cfg.legend_h), cfg.media_target_dpi)
+    fmt = "JPEG" if legend_bytes[:3] == b"\xff\xd8\xff" else "PNG"
+    result = _optimize_image_cached(legend_bytes, fmt, need, cfg.media_jpeg_quality, False)
+    if result is None:
+        return legend_bytes
+    if report is not None:
+        report.images += 1
+        report.resized += int(result[2])
+        report.recompressed += int(not result[2])
+        report.bytes_before += len(legend_bytes)
+        report.bytes_after += len(result[1])
+    return result[1]
+
+def _media_extents(parts: Dict[str, bytes]) -> Dict[str, Optional[Tuple[int, int]]]:
+    """
+    Cadre d'affichage maximal (cx, cy en EMU, rognage a:srcRect compris) de
+    chaque image, toutes parties confondues. None si l'image est aussi
+    référencée ailleurs que par un a:blip dans un wp:inline/wp:anchor (VML,
+    remplissage de forme…) : sa taille d'affichage est alors inconnue.
+    """
+    extents: Dict[str, Optional[Tuple[int, int]]] = {}
+    for rels_name in [n for n in parts if n.endswith(".rels") and "/_rels/" in "/" + n]:
+        d, b = os.path.split(rels_name)
+        part_name = os.path.join(os.path.dirname(d), b[:-len(".rels")]).replace("\\", "/")
+        if part_name not in parts or not part_name.endswith(".xml"):
+            continue
+        try:
+            rels = ET.fromstring(parts[rels_name])
+        except ET.ParseError:
+            continue
+        images = {
+            rel.get("Id"): _resolve_target_path(part_name, rel.get("Target") or "")
+            for rel in rels.findall(f"{{{P_REL}}}Relationship")
+            if rel.get("Type") == IMAGE_REL and rel.get("TargetMode") != "External"
+        }
+        if not images:
+            continue
+        data = parts[part_name]
+        # Toutes les références, quel que soit l'attribut qui les porte
+        ref_re = re.compile(rb'="(%s)"' % b"|".join(re.escape(r.encode()) for r in images))
+        refs: Dict[str, int] = {}
+        for m in ref_re.finditer(data):
+            rid = m.group(1).decode()
+            refs[rid] = refs.get(rid, 0) + 1
+        try:
+            root = fromstring(data)
+        except ET.ParseError:
+            for rid in refs:
+                extents[images[rid]] = None
+            continue
+        parent_map = parents(root)
+        sized: Dict[str, List[Tuple[int, int]]] = {}
+        for blip in findall(root, ".//a:blip", NS):
+            rid = blip.get(f"{{{R}}}embed")
+            if rid not in images:
+                continue
+            holder = parent_map.get(blip)
+            while holder is not None and holder.tag not in (f"{{{WP}}}inline", f"{{{WP}}}anchor"):
+                holder = parent_map.get(holder)
+            ext = holder.find("wp:extent", NS) if holder is not None else None
+            if ext is None:
+                continue
+            try:
+                cx, cy = int(ext.get("cx", "0")), int(ext.get("cy", "0"))
+            except ValueError:
+                continue
+            fill = parent_map.get(blip)
+            crop = fill.find("a:srcRect", NS) if fill is not None else None
+            if crop is not None:
+                try:
+                    keep_w = 100000 - int(crop.get("l", "0")) - int(crop.get("r", "0"))
+                    keep_h = 100000 - int(crop.get("t", "0")) - int(crop.get("b", "0"))
+                except ValueError:
+                    continue
+                if keep_w <= 0 or keep_h <= 0:
+                    continue
+                cx, cy = cx * 100000 // keep_w, cy * 100000 // keep_h
+            if cx > 0 and cy > 0:
+                sized.setdefault(rid, []).append((cx, cy))
+        for rid, count in refs.items():
+            target = images[rid]
+            sizes = sized.get(rid, [])
+            if len(sizes) != count or (target in extents and extents[target] is None):
+                extents[target] = None
+                continue
+            prev = extents.get(target, (0, 0))
+            extents[target] = (max([prev[0]] + [w for w, _ in sizes]), max([prev[1]] + [h for _, h in sizes]))
+    return extents
+
+def _retarget_media(parts: Dict[str, bytes], moved: Dict[str, str]):
+    """Fait pointer vers moved[ancien] toute relation qui visait un ancien chemin."""
+    for rels_name in [n for n in parts if n.endswith(".rels")]:
+        if b"media/" not in parts[rels_name]:
+            continue
+        d, b = os.path.split(rels_name)
+        part_name = os.path.join(os.path.dirname(d), b[:-len(".rels")]).replace("\\", "/")
+        try:
+            rels = ET.fromstring(parts[rels_name])
+        except ET.ParseError:
+            continue
+        changed = False
+        for rel in rels.findall(f"{{{P_REL}}}Relationship"):
+            target = rel.get("Target") or ""
+            if rel.get("TargetMode") == "External":
+                continue
+            new = moved.get(_resolve_target_path(part_name, target))
+            if new is None:
+                continue
+            if target.startswith("/"):
+                rel.set("Target", "/" + new)
+            else:
+                rel.set("Target", os.path.relpath(new, os.path.dirname(part_name) or ".").replace("\\", "/"))
+            changed = True
+        if changed:
+            parts[rels_name] = ET.tostring(rels, encoding="utf-8", xml_declaration=True)
+
+def _drop_overrides(types: ET.Element, names: Iterable[str]):
+    dropped = {"/" + n for n in names}
+    for o in types.findall(f"{{{CT_NS}}}Override"):
+        if o.get("PartName") in dropped:
+            types.remove(o)
+
+def _rename_media(parts: Dict[str, bytes], old: str, new: str):
+    """Renomme une image et reporte le changement dans les .rels et [Content_Types].xml."""
+    parts[new] = parts.pop(old)
+    _retarget_media(parts, {old: new})
+    ct_name = "[Content_Types].xml"
+    if ct_name in parts:
+        try:
+            types = ET.fromstring(parts[ct_name])
+        except ET.ParseError:
+            return
+        _drop_overrides(types, [old])
+        ext = new.rsplit(".", 1)[-1]
+        if not any((d.get("Extension") or "").lower() == ext for d in types.findall(f"{{{CT_NS}}}Default")):
+            SubElement(types, f"{{{CT_NS}}}Default", {"Extension": ext, "ContentType": "image/jpeg"})
+        parts[ct_name] = ET.tostring(types, encoding="utf-8", xml_declaration=True)
+
+def optimize_media(parts: Dict[str, bytes], cfg: "ProcessingConfig",
+                   report: Optional[MediaReport] = None) -> MediaReport:
+    """
+    Rééchantillonne à cfg.media_target_dpi les images PNG/JPEG plus définies
+    que leur cadre d'affichage, recompresse les PNG sans perte et convertit
+    en JPEG les photos PNG opaques quand c'est nettement plus léger. Une image
+    dont un usage n'a pas de taille connue n'est pas touchée.
+    """
+    report = report if report is not None else MediaReport()
+    for target, extent in sorted(_media_extents(parts).items()):
+        fmt = _OPTIMIZABLE_MEDIA.get(os.path.splitext(target)[1].lower())
+        if extent is None or fmt is None or target not in parts:
+            continue
+        data = parts[target]
+        report.images += 1
+        result = _optimize_image_cached(
+            data, fmt, _needed_pixels(extent[0], extent[1], cfg.media_target_dpi),
+            cfg.media_jpeg_quality, True,
+        )
+        if result is None:
+            continue
+        new_fmt, new_data, resized = result
+        report.bytes_before += len(data)
+        report.bytes_after += len(new_data)
+        report.resized += int(resized)
+        report.recompressed += int(not resized)
+        parts[target] = new_data
+        if new_fmt != fmt:
+            report.converted_to_jpeg += 1
+            base = os.path.splitext(target)[0]
+            new_name, n = f"{base}.jpeg", 1
+            while new_name in parts:
+                new_name, n = f"{base}_{n}.jpeg", n + 1
+            _rename_media(parts, target, new_name)
+    metrics.inc("fiches_media_bytes_saved_total", report.bytes_saved)
+    return report
+
+def dedupe_media(parts: Dict[str, bytes]) -> int:
+    """
+    Fusionne les médias identiques octet pour octet (même logo collé dans
+    plusieurs fiches) : les relations pointent vers un exemplaire unique, les
+    copies devenues orphelines sont retirées du paquet et de [Content_Types].xml.
+    Retourne le nombre de parties supprimées.
+    """
+    by_size: Dict[Tuple[str, int], List[str]] = {}
+    for name in sorted(parts):
+        if "/media/" in name:
+            ext = os.path.splitext(name)[1].lower()
+            by_size.setdefault((ext, len(parts[name])), []).append(name)
+    moved: Dict[str, str] = {}
+    for names in by_size.values():
+        if len(names) < 2:
+            continue
+        keep: Dict[str, str] = {}
+        for name in names:
+            digest = _sha1(parts[name])
+            if digest in keep:
+                moved[name] = keep[digest]
+            else:
+                keep[digest] = name
+    if not moved:
+        return 0
+    _retarget_media(parts, moved)
+    for name in moved:
+        del parts[name]
+    ct_name = "[Content_Types].xml"
+    if ct_name in parts:
+        try:
+            types = ET.fromstring(parts[ct_name])
+        except ET.ParseError:
+            types = None
+        if types is not None:
+            _drop_overrides(types, moved)
+            parts[ct_name] = ET.tostring(types, encoding="utf-8", xml_declaration=True)
+    metrics.inc("fiches_media_duplicates_removed_total", len(moved))
+    return len(moved)
+
+# ───────────────────────── Configuration utilisateur ───────────────
+@dataclass
+class ProcessingConfig:
+    icon_left: float = 15.3
+    icon_top: float = 11.0
+    legend_left: float = 2.3
+    legend_top: float = 23.8
+    legend_w: float = 5.68
+    legend_h: float = 3.77
+    cover_title_size: float = 20.0
+    cover_subject_size: float = 18.0
+    course_name_size: float = 22.0
+    university_year_size: float = 10.0
+    plan_size: float = 11.0
+    table_header_size: float = 12.0
+    table_body_size: float = 9.0
+    dark_block_size: float = 10.0
+    footer_size: float = 10.0
+    enable_replace_years: bool = True
+    enable_strip_actualisation: bool = True
+    enable_force_calibri: bool = True
+    enable_red_to_black: bool = True
+    enable_cover_typo_cleanup: bool = True
+    enable_tables_formatting: bool = True
+    enable_footer_resize: bool = True
+    enable_megaphone_removal: bool = True
+    enable_legend_insertion: bool = True
+    enable_run_coalescing: bool = False
+    enable_style_promotion: bool = False
+    style_promotion_min_runs: int = 20
+    enable_streaming_body: bool = False
+    stream_cover_max_blocks: int = 200
+    enable_idempotence_stamp: bool = True
+    pass_workers: int = 0
+    pass_executor: str = "thread"  # "thread" (un cœur, GIL) ou "process" (pool partagé, plusieurs cœurs)
+    enable_media_dedup: bool = True
+    enable_media_optimization: bool = False
+    media_target_dpi: int = 220
+    media_jpeg_quality: int = 85
+
+# Réglages sans effet sur le contenu produit : exclus des empreintes
+_OUTPUT_NEUTRAL_FIELDS = frozenset({"pass_workers", "pass_executor"})
+
+# Réglages qui ne touchent qu'aux tailles, positions et à la mise en forme finale :
+# les modifier ne nécessite pas de refaire le nettoyage structurel (cf. IntermediateCache).
+LAYOUT_FIELDS = frozenset({
+    "icon_left", "icon_top",
+    "legend_left", "legend_top", "legend_w", "legend_h",
+    "cover_title_size", "cover_subject_size", "course_name_size", "university_year_size",
+    "plan_size", "table_header_size", "table_body_size", "dark_block_size", "footer_size",
+    "enable_cover_typo_cleanup", "enable_tables_formatting", "enable_footer_resize",
+    "enable_legend_insertion", "enable_style_promotion", "style_promotion_min_runs",
+    "enable_idempotence_stamp",
+    "enable_media_optimization", "media_target_dpi", "media_jpeg_quality",
+})
+
+# ───────────────────────── Suppression mégaphones ──────────────────
+def _sha1(b: bytes) -> str:
+    return hashlib.sha1(b).hexdigest()
+
+def _ahash(b: bytes, size: int = 8) -> Optional[int]:
+    """
+    Hash perceptuel très simple (average hash) pour comparer les petites icônes
+    même si Word les a légèrement recompressées ou redimensionnées.
+    Retourne un entier de size*size bits, ou None en cas d'erreur.
+    """
+    try:
+        from PIL import Image  # import paresseux : coûteux et inutile hors images
+        with Image.open(io.BytesIO(b)) as im:
+            im = im.convert("L").resize((size, size), Image.LANCZOS)
+            pixels = list(im.getdata())
+    except Exception:
+        return None
+    avg = sum(pixels) / len(pixels)
+    bits = 0
+    for i, p in enumerate(pixels):
+        if p > avg:
+            bits |= (1 << i)
+    return bits
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+# aHash déjà calculés, indexés par SHA-1 du contenu : les fiches partagent
+# logos et icônes, inutile de redécoder la même image d'un fichier à l'autre.
+_AHASH_BY_SHA1 = _LockedLRU(4096)
+
+def _ahash_for(data: bytes, data_hash: str) -> Optional[int]:
+    ah = _AHASH_BY_SHA1.get(data_hash, _MISS)
+    if ah is not _MISS:
+        metrics.inc("fiches_cache_requests_total", cache="ahash", result="hit")
+        metrics.inc("fiches_image_decodes_avoided_total")
+        return ah
+    metrics.inc("fiches_cache_requests_total", cache="ahash", result="miss")
+    ah = _ahash(data)
+    _AHASH_BY_SHA1.put(data_hash, ah)
+    return ah
+
+def _zip_entry_sha1(zin: zipfile.ZipFile, name: str) -> str:
+    """SHA-1 d'une entrée lue par blocs : le média n'est jamais chargé en entier."""
+    h = hashlib.sha1()
+    with zin.open(name) as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ───────────────────────── Manifeste des actifs ────────────────────
+# assets/.fingerprints.json conserve sha1, aHash et signature SVG de chaque
+# actif utilisé, validés par taille et mtime : un processus neuf (ou un worker
+# relancé) lit ce seul fichier au lieu de relire et décoder les icônes.
+ASSET_MANIFEST_NAME = ".fingerprints.json"
+_ASSET_MANIFEST_VERSION = 1
+_ASSET_MANIFESTS: Dict[str, Dict[str, dict]] = {}
+
+def _asset_search_dirs() -> List[str]:
+    dirs: List[str] = []
+    try:
+        dirs.append(os.path.dirname(os.path.abspath(__file__)))
+    except NameError:
+        pass
+    dirs.extend([os.getcwd(), "."])
+    return dirs
+
+def _find_asset(filenames: Iterable[str]) -> Optional[str]:
+    """Premier fichier trouvé, dans assets/ puis à la racine de chaque dossier candidat."""
+    for base in _asset_search_dirs():
+        for fname in filenames:
+            for path in (os.path.join(base, "assets", fname), os.path.join(base, fname)):
+                if os.path.isfile(path):
+                    return path
+    return None
+
+def _asset_manifest(directory: str) -> Dict[str, dict]:
+    entries = _ASSET_MANIFESTS.get(directory)
+    if entries is None:
+        entries = {}
+        try:
+            with open(os.path.join(directory, ASSET_MANIFEST_NAME), encoding="utf-8") as f:
+                raw = json.load(f)
+            if raw.get("version") == _ASSET_MANIFEST_VERSION:
+                entries = dict(raw.get("assets") or {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        _ASSET_MANIFESTS[directory] = entries
+    return entries
+
+def _save_asset_manifest(directory: str):
+    path = os.path.join(directory, ASSET_MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": _ASSET_MANIFEST_VERSION, "assets": _ASSET_MANIFESTS[directory]},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError:
+        # Dossier en lecture seule : le manifeste reste en mémoire pour ce processus
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def asset_fingerprint(path: str) -> dict:
+    """
+    Empreintes d'un actif ({"sha1", "ahash", "svg_signature", "size", "mtime_ns"}).
+    Recalculées (et le manifeste réécrit) seulement si l'actif a changé ;
+    les caches aHash et signature SVG sont amorcés au passage.
+    """
+    directory, fname = os.path.split(os.path.abspath(path))
+    st = os.stat(path)
+    entries = _asset_manifest(directory)
+    entry = entries.get(fname)
+    fresh = bool(entry) and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+    metrics.inc("fiches_cache_requests_total", cache="asset_manifest", result="hit" if fresh else "miss")
+    if fresh:
+        if entry["ahash"] is not None:
+            metrics.inc("fiches_image_decodes_avoided_total")
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+        data_hash = _sha1(data)
+        is_svg = fname.lower().endswith(".svg")
+        entry = entries[fname] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha1": data_hash,
+            # Pour les SVG, _ahash renvoie None : inutile de passer par PIL
+            "ahash": None if is_svg else _ahash(data),
+            "svg_signature": svg_signature(data, data_hash) if is_svg else None,
+        }
+        _save_asset_manifest(directory)
+    _AHASH_BY_SHA1.setdefault(entry["sha1"], entry["ahash"])
+    if entry.get("svg_signature"):
+        _SVG_SIG_BY_SHA1.setdefault(entry["sha1"], entry["svg_signature"])
+    return entry
+
+def _asset_hashes(candidates: List[str]) -> Tuple[Set[str], Set[int]]:
+    sha_hashes: Set[str] = set()
+    ahashes: Set[int] = set()
+    for filename in candidates:
+        path = _find_asset([filename])
+        if path is None:
+            continue
+        try:
+            entry = asset_fingerprint(path)
+        except OSError:
+            continue
+        sha_hashes.add(entry["sha1"])
+        if entry["ahash"] is not None:
+            ahashes.add(entry["ahash"])
+    return sha_hashes, ahashes
+
+# ───────────────────────── SVG modèle (annonce) ──────────────────────
+@lru_cache(maxsize=1)
+def _load_svg_model_bytes() -> Optional[bytes]:
+    """
+    Charge le SVG d'annonce de référence depuis assets/annonce.svg.
+    Retourne None si le fichier est introuvable.
+    """
+    path = _find_asset(["annonce.svg", "Annonce.svg"])
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _extract_svg_paths(svg_bytes: bytes) -> List[str]:
+    """
+    Extrait tous les attributs 'd' des éléments <path> d'un SVG.
+    Retourne une liste de chemins normalisés (espaces supprimés, nombres normalisés).
+    """
+    paths = []
+    try:
+        root = ET.fromstring(svg_bytes)
+        for path_el in root.iter():
+            # Gérer les namespaces
+            tag = path_el.tag.split("}", 1)[-1] if "}" in path_el.tag else path_el.tag
+            if tag == "path":
+                d_attr = path_el.get("d") or ""
+                if d_attr:
+                    # Normaliser : supprimer espaces multiples, normaliser nombres
+                    normalized = re.sub(r"\s+", " ", d_attr.strip())
+                    paths.append(normalized)
+    except Exception:
+        pass
+    return paths
+
+def _svg_content_matches(svg_bytes: bytes, model_bytes: bytes) -> bool:
+    """
+    Compare deux SVG en extrayant et comparant leurs chemins <path d="...">.
+    Retourne True si les SVG correspondent (même contenu géométrique).
+    """
+    if not svg_bytes or not model_bytes:
+        return False
+    
+    svg_paths = _extract_svg_paths(svg_bytes)
+    model_paths = _extract_svg_paths(model_bytes)
+    
+    if not svg_paths or not model_paths:
+        # Si aucun chemin trouvé, comparaison par hash SHA1
+        return _sha1(svg_bytes) == _sha1(model_bytes)
+    
+    # Normaliser et trier les chemins pour comparaison
+    svg_paths_sorted = sorted(svg_paths)
+    model_paths_sorted = sorted(model_paths)
+    
+    # Si le nombre de chemins diffère beaucoup, pas de match
+    if abs(len(svg_paths_sorted) - len(model_paths_sorted)) > max(1, len(model_paths_sorted) * 0.2):
+        return False
+    
+    # Comparer les chemins : au moins 80% doivent correspondre
+    matches = 0
+    min_len = min(len(svg_paths_sorted), len(model_paths_sorted))
+    for i in range(min_len):
+        if svg_paths_sorted[i] == model_paths_sorted[i]:
+            matches += 1
+    
+    # Match si au moins 80% des chemins correspondent
+    return matches >= min_len * 0.8
+
+def _normalize_svg(svg_bytes: bytes) -> Optional[bytes]:
+    """
+    Normalise un SVG en extrayant uniquement les éléments géométriques
+    essentiels (paths, formes simples) et en ignorant les métadonnées,
+    styles et attributs de position sujets à variation.
+
+    L'objectif est d'obtenir une « signature visuelle » stable pour
+    comparer annonce.svg / cible.svg avec leurs équivalents Word.
+    """
+    try:
+        root = ET.fromstring(svg_bytes)
+    except Exception:
+        return None
+
+    def local_tag(el: ET.Element) -> str:
+        return el.tag.split("}", 1)[-1] if "}" in el.tag else el.tag
+
+    # Clés géométriques pertinentes par type de forme
+    geom_keys = {
+        "path": {"d"},
+        "polygon": {"points"},
+        "polyline": {"points"},
+        "circle": {"cx", "cy", "r"},
+        "ellipse": {"cx", "cy", "rx", "ry"},
+        "rect": {"x", "y", "width", "height", "rx", "ry"},
+        "line": {"x1", "y1", "x2", "y2"},
+    }
+
+    # Construire une liste de « signatures » de formes
+    shapes = []
+    for el in root.iter():
+        tag = local_tag(el)
+        if tag not in geom_keys:
+            continue
+        keys = geom_keys[tag]
+        attrs = []
+        for k, v in el.attrib.items():
+            lk = k.split("}", 1)[-1] if "}" in k else k
+            if lk in keys:
+                attrs.append(f"{lk}={v}")
+        if not attrs:
+            continue
+        attrs.sort()
+        shapes.append(f"{tag}|" + "|".join(attrs))
+
+    if not shapes:
+        # Repli : si on ne trouve pas de formes géométriques classiques,
+        # revenir à l'ancienne normalisation simple.
+        try:
+            norm = ET.tostring(root, encoding="utf-8", xml_declaration=False)
+            norm = re.sub(rb"\s+", b" ", norm)
+            norm = re.sub(rb">\s+<", b"><", norm)
+            return norm.strip()
+        except Exception:
+            return None
+
+    # Signature finale : liste triée des signatures de formes
+    shapes.sort()
+    sig = "\n".join(shapes).encode("utf-8")
+    return sig
+
+@lru_cache(maxsize=1)
+def _load_cible_svg_model() -> Optional[bytes]:
+    """
+    Charge le SVG modèle Cible.svg depuis assets/.
+    """
+    path = _find_asset(["cible.svg", "Cible.svg"])
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+# Index des signatures géométriques : sha1(_normalize_svg) -> nature de l'icône
+SVG_CIBLE = "cible"
+SVG_ANNONCE = "annonce"
+_SVG_SIG_BY_SHA1 = _LockedLRU(4096)
+_SVG_NUMBER_RE = re.compile(rb"-?\d*\.\d+(?:[eE][-+]?\d+)?|-?\d+(?:[eE][-+]?\d+)?")
+
+def _canonical_number(m: "re.Match") -> bytes:
+    try:
+        return format(round(float(m.group(0)), 2), "g").encode("ascii")
+    except ValueError:
+        return m.group(0)
+
+def svg_signature(data: bytes, data_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Signature géométrique d'un SVG : _normalize_svg, nombres arrondis au
+    centième (un ré-export ne change que leur écriture), puis sha1.
+    Mise en cache par hash de contenu : un même SVG n'est normalisé qu'une fois.
+    """
+    data_hash = data_hash or _sha1(data)
+    sig = _SVG_SIG_BY_SHA1.get(data_hash, _MISS)
+    if sig is not _MISS:
+        metrics.inc("fiches_cache_requests_total", cache="svg_signature", result="hit")
+        return sig
+    metrics.inc("fiches_cache_requests_total", cache="svg_signature", result="miss")
+    norm = _normalize_svg(data)
+    sig = _sha1(_SVG_NUMBER_RE.sub(_canonical_number, norm)) if norm else None
+    _SVG_SIG_BY_SHA1.put(data_hash, sig)
+    return sig
+
+@lru_cache(maxsize=1)
+def _default_svg_index() -> Dict[str, str]:
+    index: Dict[str, str] = {}
+    for names, kind in ((["annonce.svg", "Annonce.svg"], SVG_ANNONCE), (["cible.svg", "Cible.svg"], SVG_CIBLE)):
+        path = _find_asset(names)
+        try:
+            sig = asset_fingerprint(path)["svg_signature"] if path else None
+        except OSError:
+            sig = None
+        if sig:
+            index[sig] = kind
+    return index
+
+def svg_signature_index(megaphone_samples: Optional[List[bytes]] = None) -> Dict[str, str]:
+    """Index des modèles Annonce/Cible, complété par les échantillons SVG de l'UI (annonces)."""
+    index = dict(_default_svg_index())
+    for b in megaphone_samples or []:
+        if b.lstrip()[:1] != b"<":
+            continue
+        sig = svg_signature(b)
+        # Un échantillon ne peut pas déclasser la cible de référence
+        if sig and index.get(sig) != SVG_CIBLE:
+            index[sig] = SVG_ANNONCE
+    return index
+
+def _svg_kind(data: bytes, svg_index: Optional[Dict[str, str]]) -> Optional[str]:
+    if not svg_index:
+        return None
+    sig = svg_signature(data)
+    return svg_index.get(sig) if sig else None
+
+# Marqueur de la cible (id="Icons_Bullseye"), que Word place sur l'élément <svg> racine
+_SVG_BULLSEYE_RE = re.compile(rb"icons_bullseye", re.IGNORECASE)
+_SVG_MARKER_HEAD = 2048
+
+def _svg_has_bullseye(data: bytes) -> bool:
+    """
+    Recherche insensible à la casse sans copie du SVG (pas de data.lower()) :
+    l'en-tête d'abord, puis le reste du fichier seulement si besoin.
+    """
+    if _SVG_BULLSEYE_RE.search(data, 0, _SVG_MARKER_HEAD):
+        return True
+    if len(data) <= _SVG_MARKER_HEAD:
+        return False
+    # Chevauchement pour un marqueur à cheval sur la limite de l'en-tête
+    return _SVG_BULLSEYE_RE.search(data, _SVG_MARKER_HEAD - len(b"icons_bullseye") + 1) is not None
+
+def _identify_svg_to_remove(parts: Dict[str, bytes], svg_index: Optional[Dict[str, str]] = None) -> Set[str]:
+    """
+    Parcourt TOUS les fichiers word/media/*.svg et identifie ceux à supprimer.
+    La signature géométrique (svg_index) prime ; à défaut, règle basée sur
+    les IDs internes des icônes :
+      - SVG contenant \"Icons_Bullseye\"  => CIBLE, à garder
+      - SVG contenant \"Icons_Megaphone\" => ANNONCE, à supprimer
+      - tout autre SVG                   => à supprimer
+    """
+    svg_to_remove: Set[str] = set()
+    if svg_index is None:
+        svg_index = _default_svg_index()
+
+    # Parcourir tous les SVG dans word/media/
+    for name, data in parts.items():
+        lname = name.lower()
+        if not lname.startswith("word/"):
+            continue
+        if "/media/" not in lname:
+            continue
+        if not lname.endswith(".svg"):
+            continue
+
+        # Heuristique basée sur l'attribut id vu dans les SVG Word :
+        #   - id=\"Icons_Bullseye\"  => cible à préserver
+        #   - id=\"Icons_Megaphone\" => annonce à supprimer
+        kind = _svg_kind(data, svg_index)
+        if kind == SVG_CIBLE or (kind is None and _svg_has_bullseye(data)):
+            # Cible : on la garde
+            continue
+        # Tout le reste (dont icons_megaphone*) est à supprimer
+        svg_to_remove.add(name)
+    
+    return svg_to_remove
+
+def _find_matching_svg_media(parts: Dict[str, bytes], svg_model: bytes) -> Set[str]:
+    """
+    Retourne l'ensemble des chemins 'word/media/*.svg' correspondant
+    au SVG d'annonce à supprimer. On utilise ici un fragment de chemin
+    très spécifique (ANNONCE_SVG_SNIP) pour être robuste aux
+    changements de formatage XML.
+    """
+    matches: Set[str] = set()
+    if not svg_model:
+        return matches
+
+    for name, data in parts.items():
+        lname = name.lower()
+        if not lname.startswith("word/"):
+            continue
+        if "/media/" not in lname:
+            continue
+        if not lname.endswith(".svg"):
+            continue
+
+        # Détection simple par fragment de chemin : si le SVG contient
+        # la trace caractéristique d'Annonce, on le marque pour suppression.
+        if ANNONCE_SVG_SNIP in data:
+            matches.add(name)
+    return matches
+
+@lru_cache(maxsize=1)
+def _load_default_megaphone_hashes() -> Tuple[Set[str], Set[int]]:
+    """
+    Charge les icônes 'Annonce' fournies dans le dossier assets comme
+    mégaphones à supprimer, sans toucher aux autres icônes de la fiche cible.
+    """
+    # Icônes d'annonce fournies : PNG et SVG
+    return _asset_hashes(["Annonce1.png", "Annonce2.png", "Annonce.svg"])
+
+@lru_cache(maxsize=1)
+def _load_protected_icon_hashes() -> Tuple[Set[str], Set[int]]:
+    """
+    Charge les icônes qui ne doivent JAMAIS être supprimées (ex: Cible.png).
+    """
+    # Icônes de cible à protéger : PNG et SVG
+    return _asset_hashes(["Cible.png", "Cible.svg"])
+
+def _megaphone_fingerprints(megaphone_samples: Optional[List[bytes]]) -> Tuple[Set[str], Set[int]]:
+    """
+    Construit la liste des empreintes d'icônes à supprimer :
+      - exemples fournis via l'UI (échantillons mégaphone)
+      - icônes Annonce1/Annonce2 du dossier assets
+    """
+    default_meg_hashes, default_meg_ahashes = _load_default_megaphone_hashes()
+    megaphone_hashes: Set[str] = set(default_meg_hashes)
+    megaphone_ahashes: Set[int] = set(default_meg_ahashes)
+    if megaphone_samples:
+        for b in megaphone_samples:
+            try:
+                megaphone_hashes.add(_sha1(b))
+                ah = _ahash(b)
+                if ah is not None:
+                    megaphone_ahashes.add(ah)
+            except Exception:
+                pass
+    return megaphone_hashes, megaphone_ahashes
+
+# Empreintes mégaphone (sha1, aHash), icônes protégées (sha1, aHash), index SVG
+IconFingerprints = Tuple[Set[str], Set[int], Set[str], Set[int], Optional[Dict[str, str]]]
+
+def _is_protected_icon(data_hash: str, data_ah: Optional[int],
+                       protected_hashes: Set[str], protected_ahashes: Set[int]) -> bool:
+    if data_hash in protected_hashes:
+        return True
+    return bool(data_ah is not None and protected_ahashes
+                and min(_hamming(data_ah, ah) for ah in protected_ahashes) <= 5)
+
+def _is_megaphone_icon(data_hash: str, data_ah: Optional[int],
+                       megaphone_hashes: Set[str], megaphone_ahashes: Set[int]) -> bool:
+    if megaphone_hashes and data_hash in megaphone_hashes:
+        return True
+    return bool(data_ah is not None and megaphone_ahashes
+                and min(_hamming(data_ah, ah) for ah in megaphone_ahashes) <= 5)
+
+def _rels_name_for(part_name: str) -> str:
+    d = os.path.dirname(part_name)
+    b = os.path.basename(part_name)
+    return os.path.join(d, "_rels", b + ".rels")
+
+def _resolve_target_path(base_part: str, target: str) -> str:
+    base_dir = os.path.dirname(base_part)
+    norm = os.path.normpath(os.path.join(base_dir, target))
+    return norm.replace("\\", "/")
+
+def remove_drawing_for_rid(root: ET.Element, rid: str) -> bool:
+    """Supprime toutes les occurrences visuelles d'un rId donné dans un XML Word.
+
+    Cette fonction recherche tout run (<w:r>) contenant un élément avec l'attribut
+    r:embed (ou r:id) égal au rid fourni, puis supprime le run entier. Si le run
+    n'est pas directement accessible, on supprime son <w:drawing> ou son parent
+    <wp:inline>/<wp:anchor> pour éviter toute référence visuelle résiduelle.
+
+    Retourne True si au moins une suppression a été effectuée.
+    """
+    if not rid:
+        return False
+
+    parent_map = parents(root)
+    runs_to_remove = []
+
+    for run in findall(root, ".//w:r", NS):
+        contains_rid = False
+        for el in run.iter():
+            if el.get(f"{{{R}}}embed") == rid or el.get(f"{{{R}}}id") == rid:
+                contains_rid = True
+                break
+        if contains_rid:
+            runs_to_remove.append(run)
+
+    changed = False
+
+    for run in runs_to_remove:
+        parent = parent_map.get(run)
+        if parent is not None:
+            parent.remove(run)
+            changed = True
+            continue
+
+        drawing = run.find(".//w:drawing", NS)
+        if drawing is not None:
+            drawing_parent = parent_map.get(drawing)
+            if drawing_parent is not None:
+                drawing_parent.remove(drawing)
+                changed = True
+                continue
+
+        for tag in (f"{{{WP}}}inline", f"{{{WP}}}anchor"):
+            holder = run.find(f".//{tag}")
+            if holder is not None:
+                holder_parent = parent_map.get(holder)
+                if holder_parent is not None:
+                    holder_parent.remove(holder)
+                    changed = True
+                    break
+
+    return changed
+
+def _svg_rids_by_part(parts: Dict[str, bytes], svg_paths_to_remove: Set[str]) -> Dict[str, Set[str]]:
+    """
+    Parcourt tous les .rels et retourne, pour chaque partie, les rIds
+    qui pointent vers un des SVG à supprimer.
+    """
+    media_to_rids: Dict[str, Set[str]] = {}  # part_name -> set of rIds
+    for name in list(parts.keys()):
+        if not name.endswith(".rels"):
+            continue
+        if "/_rels/" not in name:
+            continue
+
+        try:
+            rels_root = ET.fromstring(parts[name])
+        except ET.ParseError:
+            continue
+
+        # Déterminer le nom de la partie parente
+        base_name = name.replace("/_rels/", "/").replace(".rels", "")
+
+        for rel in rels_root.findall(f".//{{{P_REL}}}Relationship"):
+            rid = rel.get("Id") or ""
+            tgt = rel.get("Target") or ""
+            if not rid or not tgt:
+                continue
+
+            # Résoudre le chemin complet du média
+            media_path = _resolve_target_path(base_name, tgt)
+
+            # Si ce média est un SVG à supprimer, noter le rId
+            if media_path in svg_paths_to_remove:
+                if base_name not in media_to_rids:
+                    media_to_rids[base_name] = set()
+                media_to_rids[base_name].add(rid)
+    return media_to_rids
+
+def _strip_rid_references(root: ET.Element, rids_to_remove: Set[str], all_rids_to_remove: Set[str]) -> bool:
+    """
+    Supprime d'un arbre XML les dessins (<a:blip>, <v:imagedata>) qui référencent
+    les rIds donnés, puis nettoie les runs et paragraphes devenus vides.
+    Retourne True si l'arbre a été modifié.
+    """
+    changed = False
+
+    # Supprimer en amont tous les runs/drawings qui référencent directement ces rIds
+    for rid in all_rids_to_remove:
+        if remove_drawing_for_rid(root, rid):
+            changed = True
+
+    parent_map = parents(root)
+
+    # Supprimer les <a:blip r:embed="rId"> et leurs <w:drawing> parents
+    for blip in findall(root, ".//a:blip", NS):
+        rid = blip.get(f"{{{R}}}embed")
+        if rid and (rid in rids_to_remove or rid in all_rids_to_remove):
+            # Remonter jusqu'à w:drawing
+            node = blip
+            drawing = None
+            while node is not None:
+                if node.tag == f"{{{W}}}drawing":
+                    drawing = node
+                    break
+                node = parent_map.get(node)
+
+            if drawing is not None:
+                # Supprimer le drawing, ou remonter jusqu'au run parent si nécessaire
+                parent = parent_map.get(drawing)
+                if parent is not None:
+                    parent.remove(drawing)
+                    changed = True
+                else:
+                    # Si pas de parent direct, essayer de supprimer le run contenant le drawing
+                    run = None
+                    node2 = drawing
+                    while node2 is not None:
+                        if node2.tag == f"{{{W}}}r":
+                            run = node2
+                            break
+                        node2 = parent_map.get(node2)
+                    if run is not None:
+                        run_parent = parent_map.get(run)
+                        if run_parent is not None:
+                            run_parent.remove(run)
+                            changed = True
+
+    # Supprimer les <v:imagedata r:id="rId"> et leurs <w:pict> parents
+    for imagedata in findall(root, f".//v:imagedata", NS):
+        rid = imagedata.get(f"{{{R}}}id")
+        if rid and (rid in rids_to_remove or rid in all_rids_to_remove):
+            # Remonter jusqu'à w:pict
+            node = imagedata
+            pict = None
+            while node is not None:
+                if node.tag == f"{{{W}}}pict":
+                    pict = node
+                    break
+                node = parent_map.get(node)
+
+            if pict is not None:
+                parent = parent_map.get(pict)
+                if parent is not None:
+                    parent.remove(pict)
+                    changed = True
+
+    # Nettoyer les runs vides après suppression des drawings
+    if changed:
+        def _in_textbox(node: ET.Element) -> bool:
+            cur = node
+            while cur is not None:
+                if cur.tag == f"{{{W}}}txbxContent":
+                    return True
+                cur = parent_map.get(cur)
+            return False
+
+        # Supprimer les runs qui ne contiennent plus rien
+        for run in findall(root, ".//w:r", NS):
+            children = list(run)
+            if not children or all(child.tag == f"{{{W}}}rPr" for child in children):
+                parent = parent_map.get(run)
+                if parent is not None:
+                    parent.remove(run)
+                    changed = True
+
+        # Supprimer les paragraphes vides
+        for para in findall(root, ".//w:p", NS):
+            children = list(para)
+            if not children or all(child.tag in (f"{{{W}}}pPr", f"{{{W}}}rPr") for child in children):
+                # Vérifier qu'il n'y a pas de texte
+                text_content = "".join(t.text or "" for t in findall(para, ".//w:t", NS))
+                if not text_content.strip() and not _in_textbox(para):
+                    parent = parent_map.get(para)
+                    if parent is not None and parent.tag != f"{{{W}}}body":
+                        parent.remove(para)
+                        changed = True
+    return changed
+
+def _remove_svg_references(parts: Dict[str, bytes], svg_paths_to_remove: Set[str]) -> Dict[str, Set[str]]:
+    """
+    Supprime toutes les références aux SVG identifiés dans toutes les parties du document.
+    - Supprime les <a:blip r:embed="rId"> et leurs <w:drawing> parents
+    - Supprime les <v:imagedata r:id="rId"> et leurs <w:pict> parents
+    - Supprime les relations dans les .rels
+    - Supprime physiquement les fichiers SVG de parts
+    Retourne la map partie -> rIds supprimés (utile aux parties traitées hors de parts).
+    """
+    if not svg_paths_to_remove:
+        return {}
+    
+    # Construire un map inversé : chemin media -> rId pour toutes les parties
+    media_to_rids = _svg_rids_by_part(parts, svg_paths_to_remove)
+
+    # Construire aussi un set de tous les rIds à supprimer (toutes parties confondues)
+    # pour être sûr de tout attraper
+    all_rids_to_remove_global = set()
+    for rids in media_to_rids.values():
+        all_rids_to_remove_global.update(rids)
+
+    # Maintenant, supprimer toutes les références dans TOUTES les parties XML
+    # On parcourt toutes les parties XML, pas seulement celles dans media_to_rids
+    for name, data in list(parts.items()):
+        if not name.endswith(".xml"):
+            continue
+        
+        try:
+            root = fromstring(data)
+        except ET.ParseError:
+            continue
+        
+        # Obtenir les rIds à supprimer pour cette partie (peut être vide)
+        rids_to_remove = media_to_rids.get(name, set())
+        if _strip_rid_references(root, rids_to_remove, all_rids_to_remove_global):
+            parts[name] = tostring(root)
+    
+    # Supprimer les relations dans TOUS les .rels
+    for name in list(parts.keys()):
+        if not name.endswith(".rels"):
+            continue
+        if "/_rels/" not in name:
+            continue
+        
+        try:
+            rels_root = ET.fromstring(parts[name])
+        except ET.ParseError:
+            continue
+        
+        base_name = name.replace("/_rels/", "/").replace(".rels", "")
+        rids_to_remove = media_to_rids.get(base_name, set())
+        
+        # Utiliser aussi le set global pour être sûr de tout attraper
+        if not rids_to_remove and not all_rids_to_remove_global:
+            continue
+        
+        changed = False
+        for rel in list(rels_root.findall(f".//{{{P_REL}}}Relationship")):
+            rid = rel.get("Id") or ""
+            tgt = rel.get("Target") or ""
+            
+            # Supprimer si le rId est dans la liste, OU si la cible est un SVG à supprimer
+            should_remove = False
+            if rid in rids_to_remove or rid in all_rids_to_remove_global:
+                should_remove = True
+            elif tgt:
+                # Vérifier si la cible résolue est un SVG à supprimer
+                resolved = _resolve_target_path(base_name, tgt)
+                if resolved in svg_paths_to_remove:
+                    should_remove = True
+            
+            if should_remove:
+                rels_root.remove(rel)
+                changed = True
+        
+        if changed:
+            parts[name] = ET.tostring(rels_root, encoding="utf-8", xml_declaration=True)
+    
+    # Supprimer physiquement les fichiers SVG de parts
+    for svg_path in svg_paths_to_remove:
+        parts.pop(svg_path, None)
+    return media_to_rids
+
+def _remove_specific_svg_in_part(
+    parts: Dict[str, bytes],
+    part_name: str,
+    root: ET.Element,
+    svg_media_paths: Set[str],
+) -> None:
+    """
+    Supprime dans une partie donnée toutes les références aux SVG dont
+    le chemin figure dans svg_media_paths :
+      - <a:blip r:embed="rId"> et le <w:drawing> parent
+      - la relation correspondante dans _rels/part.rels
+    """
+    if not svg_media_paths:
+        return
+
+    rels_name = _rels_name_for(part_name)
+    if rels_name not in parts:
+        return
+    try:
+        rels_root = ET.fromstring(parts[rels_name])
+    except ET.ParseError:
+        return
+
+    # Map rId -> chemin media résolu
+    rmap: Dict[str, str] = {}
+    for rel in rels_root.findall(f".//{{{P_REL}}}Relationship"):
+        rid = rel.get("Id") or ""
+        tgt = rel.get("Target") or ""
+        if not rid or not tgt:
+            continue
+        rmap[rid] = _resolve_target_path(part_name, tgt)
+
+    # rId à supprimer (pointant vers un SVG modèle)
+    rids_to_remove: Set[str] = set()
+    for rid, mp in rmap.items():
+        if mp in svg_media_paths:
+            rids_to_remove.add(rid)
+
+    if not rids_to_remove:
+        return
+
+    # Construire la map parent -> enfant pour pouvoir supprimer proprement
+    parent_map = parents(root)
+
+    # Supprimer les dessins/blips référencés
+    for blip in findall(root, ".//a:blip", NS):
+        rid = blip.get(f"{{{R}}}embed")
+        if not rid or rid not in rids_to_remove:
+            continue
+        # Remonter jusqu'à w:drawing
+        node = blip
+        drawing = None
+        while node is not None:
+            if node.tag == f"{{{W}}}drawing":
+                drawing = node
+                break
+            node = parent_map.get(node)
+        if drawing is not None:
+            parent = parent_map.get(drawing)
+            if parent is not None:
+                parent.remove(drawing)
+
+    # Nettoyer les relations correspondantes
+    changed = False
+    for rel in list(rels_root.findall(f".//{{{P_REL}}}Relationship")):
+        rid = rel.get("Id") or ""
+        if rid in rids_to_remove:
+            rels_root.remove(rel)
+            changed = True
+
+    if changed:
+        parts[rels_name] = ET.tostring(rels_root, encoding="utf-8", xml_declaration=True)
+
+def _rels_target_map(rels_root: ET.Element, part_name: str) -> Dict[str, str]:
+    rmap: Dict[str, str] = {}
+    for rel in rels_root.findall(f".//{{{P_REL}}}Relationship"):
+        rid = rel.get("Id") or ""
+        tgt = rel.get("Target") or ""
+        rmap[rid] = _resolve_target_path(part_name, tgt)
+    return rmap
+
+def _remove_megaphone_drawings(root: ET.Element, rmap: Dict[str, str], parts: Dict[str, bytes],
+                               megaphone_hashes: Set[str], megaphone_ahashes: Set[int],
+                               protected_hashes: Set[str], protected_ahashes: Set[int],
+                               svg_index: Optional[Dict[str, str]] = None) -> Set[str]:
+    """
+    Supprime de l'arbre les dessins dont le média (résolu via rmap) est un mégaphone.
+    Retourne les rIds supprimés ; la mise à jour du .rels reste à l'appelant.
+    """
+    parent_map = parents(root)
+    removed_rids: Set[str] = set()
+
+    # Un même média est souvent référencé plusieurs fois : une empreinte par chemin
+    fingerprints: Dict[str, Tuple[str, Optional[int]]] = {}
+
+    def fingerprint(media_path: str, data: bytes) -> Tuple[str, Optional[int]]:
+        fp = fingerprints.get(media_path)
+        if fp is None:
+            data_hash = _sha1(data)
+            fp = fingerprints[media_path] = (data_hash, _ahash_for(data, data_hash))
+        return fp
+
+    # 1) Images DrawingML : <a:blip r:embed="...">
+    for blip in findall(root, ".//a:blip", NS):
+        rid = blip.get(f"{{{R}}}embed")
+        if not rid or rid not in rmap:
+            continue
+        media_path = rmap[rid]
+        if media_path not in parts:
+            continue
+        data = parts[media_path]
+        
+        # Vérifier si c'est un SVG
+        is_svg = media_path.lower().endswith(".svg")
+        data_normalized = None
+        svg_should_remove = False
+
+        # Règle simple pour les SVG :
+        #   - si le contenu contient le fragment caractéristique de Cible.svg -> on garde
+        #   - sinon -> on supprime (Annonce ou autre SVG)
+        if is_svg:
+            kind = _svg_kind(data, svg_index if svg_index is not None else _default_svg_index())
+            if kind == SVG_CIBLE or (kind is None and CIBLE_SVG_SNIP in data):
+                # Cible : on la préserve absolument
+                continue
+            else:
+                svg_should_remove = True
+        
+        data_hash, data_ah = fingerprint(media_path, data)
+
+        # Icônes protégées (ex: Cible.png) : on ne les touche jamais.
+        if _is_protected_icon(data_hash, data_ah, protected_hashes, protected_ahashes):
+            continue
+
+        # Mégaphones à supprimer : hash exact OU hash perceptuel proche
+        match_hash = _is_megaphone_icon(data_hash, data_ah, megaphone_hashes, megaphone_ahashes)
+        
+        # Pour les SVG non-cible, forcer la suppression
+        if is_svg and svg_should_remove:
+            match_hash = True
+
+        holder = None
+        node = blip
+        while node is not None:
+            if node.tag in (f"{{{WP}}}anchor", f"{{{WP}}}inline"):
+                holder = node; break
+            node = parent_map.get(node)
+        drawing = None
+        node2 = blip
+        while node2 is not None:
+            if node2.tag == f"{{{W}}}drawing":
+                drawing = node2; break
+            node2 = parent_map.get(node2)
+
+        # On supprime si :
+        #   - l'empreinte correspond à un mégaphone (bitmap)
+        #   - OU si c'est un SVG non-cible
+        should_remove = match_hash
+
+        if should_remove and drawing is not None:
+            parent = parent_map.get(drawing)
+            if parent is not None:
+                parent.remove(drawing)
+                removed_rids.add(rid)
+
+    # 2) Images VML : <v:imagedata r:id="..."> à l'intérieur de <w:pict>
+    for imdata in findall(root, ".//v:imagedata", NS):
+        rid = imdata.get(f"{{{R}}}id") or imdata.get(f"{{{R}}}embed")
+        if not rid or rid not in rmap:
+            continue
+        media_path = rmap[rid]
+        if media_path not in parts:
+            continue
+        data = parts[media_path]
+
+        # VML porte souvent des bitmap (PNG/EMF) – on applique la même logique de hash
+        data_hash, data_ah = fingerprint(media_path, data)
+
+        if _is_protected_icon(data_hash, data_ah, protected_hashes, protected_ahashes):
+            continue
+
+        match_hash = _is_megaphone_icon(data_hash, data_ah, megaphone_hashes, megaphone_ahashes)
+
+        if match_hash:
+            # Remonter à <w:pict> et le supprimer
+            node = imdata
+            pict = None
+            while node is not None:
+                if node.tag == f"{{{W}}}pict":
+                    pict = node
+                    break
+                node = parent_map.get(node)
+            if pict is not None:
+                parent = parent_map.get(pict)
+                if parent is not None:
+                    parent.remove(pict)
+                    removed_rids.add(rid)
+
+    return removed_rids
+
+# ───────────────────────── Texte pour l'index ──────────────────────
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+@dataclass
+class FicheText:
+    """
+    Texte d'une fiche relevé pendant le traitement, pour l'index plein texte
+    (cf. fiches_index) : nom du cours, titres du plan, paragraphes.
+    """
+    course: str = ""
+    plan: List[str] = field(default_factory=list)
+    body: List[str] = field(default_factory=list)
+    _after_title: bool = field(default=False, repr=False)
+
+    def add(self, text: str, dark: bool = False):
+        text = normalize_spaces(text)
+        if not text:
+            return
+        # Même règle que force_course_name_after_title_20 : le premier bloc
+        # non vide après « Fiche de cours » est le nom du cours.
+        if self._after_title and not self.course:
+            self.course = text
+        elif not self._after_title and "fiche de cours" in _norm_matchable(text):
+            self._after_title = True
+        # Titres du plan : chiffres romains sur fond sombre (cf. tables_and_numbering)
+        if dark and ROMAN_TITLE_RE.match(text):
+            self.plan.append(text)
+        self.body.append(text)
+
+def collect_fiche_text(root: ET.Element, sink: FicheText):
+    """
+    Relève les paragraphes de root dans l'ordre du document. Un paragraphe
+    qui en contient d'autres (zone de texte) est laissé à ses paragraphes
+    internes, et la variante mc:Fallback d'une forme (copie VML de la même
+    zone de texte) est ignorée, pour ne pas indexer deux fois le même texte.
+    """
+    tag_tc, tag_p = f"{{{W}}}tc", f"{{{W}}}p"
+    stack: List[Tuple[ET.Element, bool]] = [(root, False)]
+    while stack:
+        node, dark_cell = stack.pop()
+        if node.tag == _MC_FALLBACK:
+            continue
+        if node.tag == tag_tc:
+            dark_cell = _is_dark_fill(node.find("w:tcPr/w:shd", NS))
+        elif node.tag == tag_p and node.find(f".//{tag_p}") is None:
+            sink.add(get_text(node), dark_cell or _is_dark_fill(node.find("w:pPr/w:shd", NS)))
+            continue
+        stack.extend((child, dark_cell) for child in reversed(node))
+
+# ───────────────────────── Registre des passes ─────────────────────
+# Chaque passe déclare les parties qu'elle vise (regex sur le nom), les éléments
+# qu'elle lit et écrit, son interrupteur dans ProcessingConfig et ses contraintes
+# d'ordre. Le planificateur en déduit, par paquet, la liste minimale de passes
+# par partie : une partie qu'aucune passe active ne vise n'est ni lue ni réécrite.
+PHASES = ("structural", "layout", "final")
+
+@dataclass(frozen=True)
+class PassSpec:
+    name: str
+    run: Callable[[ET.Element, "PartContext"], object]
+    parts: Tuple[str, ...]
+    reads: Tuple[str, ...] = ()
+    writes: Tuple[str, ...] = ()
+    flag: Optional[str] = None
+    after: Tuple[str, ...] = ()
+    # structural : indépendante de LAYOUT_FIELDS ; layout : tailles/positions ;
+    # final : exécutée en dernier, juste avant la sérialisation de la partie
+    phase: str = "structural"
+    # Applicable bloc par bloc au corps en flux (hors page de garde)
+    block_local: bool = False
+
+    def enabled(self, cfg: ProcessingConfig) -> bool:
+        return self.flag is None or bool(getattr(cfg, self.flag))
+
+    def targets(self, part_name: str) -> bool:
+        return any(re.match(pat, part_name) for pat in self.parts)
+
+@dataclass
+class PartContext:
+    """État visible d'une passe : lecture seule sur le paquet, écritures locales."""
+    name: str
+    cfg: ProcessingConfig
+    parts: Dict[str, bytes]
+    colors: Optional[ColorClassifier] = None
+    theme_colors: Dict[str, str] = field(default_factory=dict)
+    megaphone_fps: "IconFingerprints" = (set(), set(), set(), set(), None)
+    # Parties annexes réécrites par la passe (ex. .rels), fusionnées après coup
+    updates: Dict[str, bytes] = field(default_factory=dict)
+    # Texte relevé pour l'index plein texte, si demandé (cf. process_bytes)
+    text_sink: Optional[FicheText] = None
+
+# Parties WordprocessingML porteuses de texte (hors thème et réglages)
+_TEXT_PARTS = (r"word/(?!theme/)(?!(?:fontTable|settings|webSettings)\.xml$).+\.xml$",)
+_DOCUMENT_PART = (r"word/document\.xml$",)
+_FOOTER_PARTS = (r"word/footer\d*\.xml$",)
+# Parties de contenu pouvant référencer des images via leur .rels
+_CONTENT_PARTS = (r"word/(?:glossary/)?(?:document|header\d*|footer\d*|footnotes|endnotes|comments\w*)\.xml$",)
+
+def _pass_cover_typography(root: ET.Element, ctx: PartContext):
+    cover_sizes_cleanup(root, ctx.cfg)
+    tune_cover_shapes_spatial(root, ctx.cfg)
+    force_course_name_after_title_20(root, ctx.cfg)
+    force_title_fiche_de_cours_22(root, ctx.cfg)
+
+def _pass_index_text(root: ET.Element, ctx: PartContext):
+    if ctx.text_sink is not None:
+        collect_fiche_text(root, ctx.text_sink)
+
+def _pass_megaphones(root: ET.Element, ctx: PartContext):
+    rels_name = _rels_name_for(ctx.name)
+    if rels_name not in ctx.parts:
+        return
+    try:
+        rels_root = ET.fromstring(ctx.parts[rels_name])
+    except ET.ParseError:
+        return
+    removed_rids = _remove_megaphone_drawings(
+        root, _rels_target_map(rels_root, ctx.name), ctx.parts, *ctx.megaphone_fps,
+    )
+    if removed_rids:
+        for rel in list(rels_root.findall(f".//{{{P_REL}}}Relationship")):
+            if (rel.get("Id") or "") in removed_rids:
+                rels_root.remove(rel)
+        ctx.updates[rels_name] = ET.tostring(rels_root, encoding="utf-8", xml_declaration=True)
+
+PASSES: List[PassSpec] = [
+    PassSpec("replace_years", lambda r, c: replace_years(r), _TEXT_PARTS,
+             reads=("w:t", "a:t"), writes=("w:t", "a:t"), flag="enable_replace_years", block_local=True),
+    PassSpec("strip_actualisation", lambda r, c: strip_actualisation_everywhere(r), _TEXT_PARTS,
+             reads=("w:t", "a:t"), writes=("w:t", "a:t"), flag="enable_strip_actualisation", block_local=True),
+    PassSpec("force_calibri", lambda r, c: force_calibri(r), _TEXT_PARTS,
+             reads=("w:r",), writes=("w:rPr", "w:rFonts"), flag="enable_force_calibri", block_local=True),
+    PassSpec("red_to_black", lambda r, c: red_to_black(r, c.colors), _TEXT_PARTS,
+             reads=("w:color",), writes=("w:color",), flag="enable_red_to_black", block_local=True),
+    PassSpec("remove_legend_cible_icons", lambda r, c: remove_legend_cible_icons(r), _DOCUMENT_PART,
+             reads=("w:p", "w:drawing"), writes=("w:drawing",)),
+    PassSpec("remove_grey_rectangles", lambda r, c: remove_large_grey_rectangles(r, c.theme_colors), _DOCUMENT_PART,
+             reads=("w:drawing", "mc:AlternateContent"), writes=("w:drawing", "mc:AlternateContent"), block_local=True),
+    PassSpec("red_bullets_paragraphs", lambda r, c: force_red_bullets_black_in_paragraphs(r, c.colors), _DOCUMENT_PART,
+             reads=("w:numPr", "w:color"), writes=("w:color",), flag="enable_red_to_black", block_local=True),
+    PassSpec("red_bullets_numbering", lambda r, c: force_red_bullets_black_in_numbering(r, c.colors),
+             (r"word/numbering\.xml$",), reads=("w:lvl", "w:color"), writes=("w:color",), flag="enable_red_to_black"),
+    PassSpec("red_bullets_styles", lambda r, c: force_red_bullets_black_in_styles(r, c.colors),
+             (r"word/styles\.xml$",), reads=("w:style", "w:color"), writes=("w:color",), flag="enable_red_to_black"),
+    PassSpec("megaphones", _pass_megaphones, _CONTENT_PARTS,
+             reads=("a:blip", "v:imagedata"), writes=("w:drawing", "w:pict"), flag="enable_megaphone_removal"),
+    PassSpec("cover_typography", _pass_cover_typography, _DOCUMENT_PART,
+             reads=("w:p", "wps:txbx", "a:txBody"), writes=("w:rPr", "a:rPr"),
+             flag="enable_cover_typo_cleanup", phase="layout"),
+    PassSpec("tables_and_numbering", lambda r, c: tables_and_numbering(r, c.cfg), _DOCUMENT_PART,
+             reads=("w:tbl", "w:shd"), writes=("w:rPr",), flag="enable_tables_formatting",
+             after=("cover_typography",), phase="layout", block_local=True),
+    # Lecture seule, sur le texte définitif (après les passes structurelles)
+    PassSpec("index_text", _pass_index_text, _DOCUMENT_PART, reads=("w:p", "w:shd"),
+             phase="layout", block_local=True),
+    PassSpec("reposition_small_icon", lambda r, c: reposition_small_icon(r, c.cfg.icon_left, c.cfg.icon_top),
+             _DOCUMENT_PART, reads=("wp:anchor",), writes=("wp:positionH", "wp:positionV"), phase="layout"),
+    PassSpec("footer_size", lambda r, c: force_footer_size_10(r, c.cfg), _FOOTER_PARTS,
+             reads=("w:r", "a:r"), writes=("w:rPr", "a:rPr"), flag="enable_footer_resize", phase="layout"),
+    PassSpec("coalesce_runs", lambda r, c: coalesce_runs(r), _TEXT_PARTS,
+             reads=("w:r", "w:rPr"), writes=("w:r",), flag="enable_run_coalescing", phase="final", block_local=True),
+]
+
+def schedule_passes(specs: List[PassSpec]) -> List[PassSpec]:
+    """
+    Ordre d'exécution : phases dans l'ordre de PHASES, puis dépendances
+    explicites (after) et implicites (une passe qui lit ou écrit ce qu'une
+    passe déclarée avant elle écrit), à égalité l'ordre du registre.
+    """
+    registry_index = {p.name: i for i, p in enumerate(PASSES)}
+    specs = sorted(specs, key=lambda p: (PHASES.index(p.phase), registry_index.get(p.name, len(PASSES))))
+    rank = {p.name: i for i, p in enumerate(specs)}
+    deps: Dict[str, Set[str]] = {p.name: set() for p in specs}
+    for i, a in enumerate(specs):
+        for b in specs[i + 1:]:
+            if a.phase != b.phase or set(a.writes) & (set(b.reads) | set(b.writes)):
+                deps[b.name].add(a.name)
+    for p in specs:
+        # Une dépendance désactivée ou hors périmètre ne contraint rien
+        deps[p.name].update(d for d in p.after if d in deps)
+
+    order: List[PassSpec] = []
+    done: Set[str] = set()
+    pending = list(specs)
+    while pending:
+        ready = [p for p in pending if deps[p.name] <= done]
+        if not ready:
+            raise ValueError("Dépendances cycliques entre passes : " + ", ".join(p.name for p in pending))
+        nxt = min(ready, key=lambda p: rank[p.name])
+        order.append(nxt)
+        done.add(nxt.name)
+        pending.remove(nxt)
+    return order
+
+def build_plan(part_names: Iterable[str], cfg: ProcessingConfig,
+               phases: Tuple[str, ...] = PHASES) -> Dict[str, List[PassSpec]]:
+    """Plan minimal par partie ; les parties sans passe active en sont absentes."""
+    active = [p for p in PASSES if p.phase in phases and p.enabled(cfg)]
+    plan: Dict[str, List[PassSpec]] = {}
+    for name in part_names:
+        if not name.endswith(".xml"):
+            continue
+        specs = [p for p in active if p.targets(name)]
+        if specs:
+            plan[name] = schedule_passes(specs)
+    return plan
+
+def _is_layout_part(name: str) -> bool:
+    """Partie visée par une passe de mise en page, quels que soient les interrupteurs."""
+    return any(p.phase == "layout" and p.targets(name) for p in PASSES)
+
+def run_passes(root: ET.Element, specs: List[PassSpec], ctx: PartContext,
+               timings: Optional[Dict[str, float]] = None):
+    """
+    Applique specs à root. Durées observées par passe, ou cumulées dans
+    timings quand l'appelant découpe une partie (corps en flux) et ne les
+    observe qu'une fois pour toute la partie.
+    """
+    for spec in specs:
+        start = time.perf_counter()
+        spec.run(root, ctx)
+        elapsed = time.perf_counter() - start
+        if timings is None:
+            metrics.observe("fiches_pass_seconds", elapsed, **{"pass": spec.name})
+        else:
+            timings[spec.name] = timings.get(spec.name, 0.0) + elapsed
+
+# ───────────────────────── Limites d'ingestion ─────────────────────
+@dataclass(frozen=True)
+class IngestionLimits:
+    """
+    Bornes d'une archive DOCX : vérifiées sur le répertoire central avant toute
+    lecture, puis pendant la décompression (budget mémoire par fiche).
+    Le taux de compression n'est contrôlé qu'au-delà de ratio_floor_bytes :
+    un petit XML très répétitif se compresse légitimement très bien.
+    """
+    max_archive_bytes: int = 200 * 2 ** 20
+    max_entries: int = 5000
+    max_entry_bytes: int = 256 * 2 ** 20
+    max_total_bytes: int = 512 * 2 ** 20
+    max_ratio: float = 200.0
+    ratio_floor_bytes: int = 2 ** 20
+
+DEFAULT_LIMITS = IngestionLimits()
+
+class IngestionError(ValueError):
+    """Archive refusée par IngestionLimits ; le message nomme la limite dépassée."""
+
+def _mib(n: int) -> str:
+    return f"{n / 2 ** 20:.1f} Mo"
+
+def check_archive(zin: zipfile.ZipFile, limits: IngestionLimits = DEFAULT_LIMITS,
+                  archive_bytes: Optional[int] = None) -> List[zipfile.ZipInfo]:
+    """
+    Contrôle le répertoire central (nombre d'entrées, tailles déclarées, taux
+    de compression) sans rien décompresser ; lève IngestionError au premier
+    dépassement.
+    """
+    if archive_bytes is not None and archive_bytes > limits.max_archive_bytes:
+        raise IngestionError(f"archive refusée : {_mib(archive_bytes)} (maximum {_mib(limits.max_archive_bytes)})")
+    infos = zin.infolist()
+    if len(infos) > limits.max_entries:
+        raise IngestionError(f"archive refusée : {len(infos)} entrées (maximum {limits.max_entries})")
+    total = 0
+    for info in infos:
+        if info.file_size > limits.max_entry_bytes:
+            raise IngestionError(
+                f"archive refusée : {info.filename} décompressé ferait {_mib(info.file_size)} "
+                f"(maximum {_mib(limits.max_entry_bytes)})"
+            )
+        if info.file_size > limits.ratio_floor_bytes and (
+            info.compress_size <= 0 or info.file_size / info.compress_size > limits.max_ratio
+        ):
+            raise IngestionError(
+                f"archive refusée : {info.filename} compressé plus de {limits.max_ratio:g} fois "
+                f"({info.compress_size} → {info.file_size} octets)"
+            )
+        total += info.file_size
+        if total > limits.max_total_bytes:
+            raise IngestionError(
+                f"archive refusée : plus de {_mib(limits.max_total_bytes)} une fois décompressée"
+            )
+    return infos
+
+class _ReadBudget:
+    """Octets décompressés d'une fiche, comptés au fil de la lecture (le déclaré peut mentir)."""
+
+    def __init__(self, zin: zipfile.ZipFile, limits: IngestionLimits, used: int = 0):
+        self.zin = zin
+        self.limits = limits
+        self.used = used
+
+    def _charge(self, name: str, entry_size: int, n: int):
+        self.used += n
+        if entry_size > self.limits.max_entry_bytes:
+            raise IngestionError(f"archive refusée : {name} dépasse {_mib(self.limits.max_entry_bytes)} décompressé")
+        if self.used > self.limits.max_total_bytes:
+            raise IngestionError(f"archive refusée : plus de {_mib(self.limits.max_total_bytes)} décompressés")
+
+    def read(self, name: str) -> bytes:
+        chunks: List[bytes] = []
+        size = 0
+        with self.zin.open(name) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                size += len(chunk)
+                self._charge(name, size, len(chunk))
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def open(self, name: str) -> "_BudgetedReader":
+        return _BudgetedReader(self, name, self.zin.open(name))
+
+class _BudgetedReader(io.RawIOBase):
+    """Flux d'une entrée (iterparse) débité du budget de la fiche."""
+
+    def __init__(self, budget: _ReadBudget, name: str, raw):
+        self.budget, self.name, self.raw, self.size = budget, name, raw, 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.raw.read(n)
+        self.size += len(data)
+        self.budget._charge(self.name, self.size, len(data))
+        return data
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+# ───────────────────────── Corps en flux (mémoire bornée) ──────────
+STREAMED_PART = "word/document.xml"
+STREAMED_RELS = "word/_rels/document.xml.rels"
+
+def _ends_cover_page(block: ET.Element) -> bool:
+    """Vrai si le bloc clôt la page de couverture (saut de section ou de page)."""
+    if block.tag == f"{{{W}}}sectPr" or block.find(".//w:sectPr", NS) is not None:
+        return True
+    return any(br.get(f"{{{W}}}type") == "page" for br in block.iter(f"{{{W}}}br"))
+
+def _qname(tag: str, prefixes: Dict[str, str]) -> str:
+    if tag[:1] != "{":
+        return tag
+    uri, local = tag[1:].split("}", 1)
+    prefix = prefixes.get(uri)
+    return f"{prefix}:{local}" if prefix else local
+
+def _start_tag(elem: ET.Element, prefixes: Dict[str, str], decls: List[Tuple[str, str]] = ()) -> str:
+    attrs = [f"xmlns:{p}={quoteattr(u)}" if p else f"xmlns={quoteattr(u)}" for p, u in decls]
+    attrs += [f"{_qname(k, prefixes)}={quoteattr(v)}" for k, v in elem.attrib.items()]
+    return "<" + _qname(elem.tag, prefixes) + "".join(" " + a for a in attrs) + ">"
+
+_XMLNS_DECL_RE = re.compile(rb' xmlns:([A-Za-z_][\w.-]*)="([^"]*)"')
+
+def _document_prefixes(decls: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    {uri: préfixe} des déclarations de la racine (w14, mc, wp14...), pour que les
+    blocs sérialisés réutilisent ces déclarations au lieu de ns0, ns1...
+    Les préfixes et URI déjà utilisés par NS ne sont jamais réaffectés. La table
+    reste locale au document : le registre global d'ElementTree n'est pas
+    touché, la sérialisation des autres parties et des autres fiches du
+    processus ne dépend donc pas des documents lus en flux auparavant.
+    """
+    prefixes: Dict[str, str] = {}
+    for prefix, uri in decls:
+        if (not prefix or prefix in NS or prefix == "xml" or uri in NS.values()
+                or re.match(r"ns\d+$", prefix) or prefix in prefixes.values()):
+            continue
+        prefixes.setdefault(uri, prefix)
+    return prefixes
+
+def _block_qnames(block: ET.Element, doc_prefixes: Dict[str, str]) -> Tuple[Dict, Dict[str, str]]:
+    """ET._namespaces, avec les préfixes du document prioritaires sur le registre global."""
+    qnames: Dict = {None: None}
+    namespaces: Dict[str, str] = {}
+    taken = set(doc_prefixes.values())
+
+    def add_qname(qname: str):
+        if qname[:1] != "{":
+            qnames[qname] = qname
+            return
+        uri, local = qname[1:].rsplit("}", 1)
+        prefix = namespaces.get(uri)
+        if prefix is None:
+            prefix = doc_prefixes.get(uri)
+            if prefix is None:
+                prefix = _ET_NAMESPACE_MAP.get(uri)
+                if prefix is None or prefix in taken:
+                    prefix = "ns%d" % len(namespaces)
+            if prefix != "xml":
+                namespaces[uri] = prefix
+        qnames[qname] = "%s:%s" % (prefix, local)
+
+    for elem in block.iter():
+        if isinstance(elem.tag, str) and elem.tag not in qnames:
+            add_qname(elem.tag)
+        for key in elem.keys():
+            if key not in qnames:
+                add_qname(key)
+    return qnames, namespaces
+
+def _private_serializer() -> Optional[Callable]:
+    """
+    ET._serialize_xml, interne à CPython : pris seulement sur les versions où
+    sa signature est connue (3.8 à 3.13) et vérifiée. Ailleurs, les blocs
+    passent par ET.tostring (API publique) : sortie valide, mais préfixes
+    ns0, ns1… propres à chaque bloc au lieu de ceux du document.
+    """
+    serialize = getattr(ET, "_serialize_xml", None)
+    if serialize is None or not (3, 8) <= sys.version_info[:2] <= (3, 13):
+        return None
+    try:
+        params = list(inspect.signature(serialize).parameters)
+    except (TypeError, ValueError):
+        return None
+    if params[:5] != ["write", "elem", "qnames", "namespaces", "short_empty_elements"]:
+        return None
+    return serialize
+
+_ET_SERIALIZE_XML = _private_serializer()
+_ET_NAMESPACE_MAP: Dict[str, str] = getattr(ET, "_namespace_map", {})
+
+def _serialize_block(block: ET.Element, root_decls: Set[Tuple[str, str]],
+                     doc_prefixes: Dict[str, str]) -> bytes:
+    """
+    Sérialise un bloc du corps en retirant de sa balise ouvrante les déclarations
+    d'espaces de noms déjà présentes, à l'identique, sur la racine du document.
+    """
+    if _ET_SERIALIZE_XML is None:
+        data = ET.tostring(block, encoding="utf-8", short_empty_elements=True)
+    else:
+        chunks: List[str] = []
+        qnames, namespaces = _block_qnames(block, doc_prefixes)
+        _ET_SERIALIZE_XML(chunks.append, block, qnames, namespaces, short_empty_elements=True)
+        data = "".join(chunks).encode("utf-8", "xmlcharrefreplace")
+    head_end = data.index(b">") + 1
+
+    def keep(m) -> bytes:
+        return b"" if (m.group(1).decode(), m.group(2).decode()) in root_decls else m.group(0)
+
+    return _XMLNS_DECL_RE.sub(keep, data[:head_end]) + data[head_end:]
+
+def _stream_document_xml(
+    zin: zipfile.ZipFile,
+    zout: zipfile.ZipFile,
+    parts: Dict[str, bytes],
+    cfg: ProcessingConfig,
+    colors: ColorClassifier,
+    theme_colors: Dict[str, str],
+    svg_rids_by_part: Dict[str, Set[str]],
+    megaphone_fingerprints: "IconFingerprints",
+    legend_bytes: Optional[bytes],
+    budget: Optional[_ReadBudget] = None,
+    text_sink: Optional[FicheText] = None,
+) -> None:
+    """
+    Réécrit word/document.xml directement dans l'archive de sortie, bloc par bloc.
+
+    La couverture (blocs du corps jusqu'au premier saut de page ou de section,
+    au plus cfg.stream_cover_max_blocks blocs) est traitée comme un arbre complet
+    avec toutes les passes du document et l'insertion de la légende. Chaque bloc
+    suivant (w:p, w:tbl...) est lu par iterparse, traité seul avec les passes
+    locales puis sérialisé et libéré : la mémoire crête suit le plus gros bloc,
+    pas la taille du document.
+    """
+    svg_rids = svg_rids_by_part.get(STREAMED_PART, set())
+    all_svg_rids: Set[str] = set()
+    for rids in svg_rids_by_part.values():
+        all_svg_rids.update(rids)
+
+    rels_root = None
+    if STREAMED_RELS in parts:
+        try:
+            rels_root = ET.fromstring(parts[STREAMED_RELS])
+        except ET.ParseError:
+            rels_root = None
+    rmap = _rels_target_map(rels_root, STREAMED_PART) if rels_root is not None else {}
+    removed_rids: Set[str] = set()
+
+    # Les mégaphones sont traités ici avec la table des rels commune à tous les blocs
+    plan = [p for p in build_plan([STREAMED_PART], cfg).get(STREAMED_PART, []) if p.name != "megaphones"]
+    cover_plan = [p for p in plan if p.phase != "final"]
+    block_plan = [p for p in cover_plan if p.block_local]
+    final_plan = [p for p in plan if p.phase == "final"]
+    ctx = PartContext(STREAMED_PART, cfg, parts, colors, theme_colors, text_sink=text_sink)
+    # Une observation par passe pour tout le corps, pas une par bloc
+    timings: Dict[str, float] = {}
+
+    def run_block_passes(root: ET.Element, cover: bool):
+        if all_svg_rids:
+            _strip_rid_references(root, svg_rids, all_svg_rids)
+        run_passes(root, cover_plan if cover else block_plan, ctx, timings)
+        if cfg.enable_megaphone_removal and rels_root is not None:
+            removed_rids.update(_remove_megaphone_drawings(root, rmap, parts, *megaphone_fingerprints))
+        run_passes(root, final_plan, ctx, timings)
+
+    decls: List[Tuple[str, str]] = []
+    prefixes: Dict[str, str] = {}
+    doc_prefixes: Dict[str, str] = {}
+    level = 0
+    root = body = cover = None
+    in_body = False
+    in_cover = True
+
+    with zout.open(STREAMED_PART, "w") as out:
+        def write_children(container: ET.Element):
+            for child in list(container):
+                out.write(_serialize_block(child, root_decls, doc_prefixes))
+                container.remove(child)
+
+        def flush_cover():
+            cover_root = ET.Element(root.tag)
+            cover_root.append(cover)
+            run_block_passes(cover_root, cover=True)
+            if cfg.enable_legend_insertion and legend_bytes and rels_root is not None:
+                clear_legend_text(cover_root)
+                media_name, media_bytes = insert_legend_in_tree(
+                    cover_root, rels_root, legend_bytes,
+                    left_cm=cfg.legend_left, top_cm=cfg.legend_top,
+                    width_cm=cfg.legend_w, height_cm=cfg.legend_h,
+                )
+                parts[media_name] = media_bytes
+            write_children(cover)
+
+        body = (budget or _ReadBudget(zin, DEFAULT_LIMITS)).open(STREAMED_PART)
+        for event, elem in ET.iterparse(body, events=("start-ns", "start", "end")):
+            if event == "start-ns":
+                if root is None:
+                    decls.append(elem)
+                    prefixes.setdefault(elem[1], elem[0])
+                continue
+            if event == "start":
+                level += 1
+                if level == 1:
+                    root = elem
+                    root_decls = set(decls)
+                    doc_prefixes.update(_document_prefixes(decls))
+                    out.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+                    out.write(_start_tag(root, prefixes, decls).encode("utf-8"))
+                elif level == 2 and elem.tag == f"{{{W}}}body":
+                    body, in_body = elem, True
+                    cover = ET.Element(body.tag)
+                    out.write(_start_tag(body, prefixes).encode("utf-8"))
+                continue
+
+            level -= 1
+            if level == 2 and in_body:
+                body.remove(elem)
+                if in_cover:
+                    cover.append(elem)
+                    if _ends_cover_page(elem) or len(cover) >= cfg.stream_cover_max_blocks:
+                        flush_cover()
+                        in_cover = False
+                    continue
+                holder = ET.Element(body.tag)
+                holder.append(elem)
+                run_block_passes(holder, cover=False)
+                write_children(holder)
+            elif level == 1:
+                if elem is body:
+                    if in_cover:
+                        flush_cover()
+                        in_cover = False
+                    in_body = False
+                    out.write(f"</{_qname(body.tag, prefixes)}>".encode("utf-8"))
+                else:
+                    out.write(_serialize_block(elem, root_decls, doc_prefixes))
+                root.remove(elem)
+            elif level == 0:
+                out.write(f"</{_qname(root.tag, prefixes)}>".encode("utf-8"))
+
+    for name, elapsed in timings.items():
+        metrics.observe("fiches_pass_seconds", elapsed, **{"pass": name})
+
+    if rels_root is not None:
+        for rel in list(rels_root.findall(f".//{{{P_REL}}}Relationship")):
+            if (rel.get("Id") or "") in removed_rids:
+                rels_root.remove(rel)
+        parts[STREAMED_RELS] = ET.tostring(rels_root, encoding="utf-8", xml_declaration=True)
+
+# ───────────────────────── Tampon d'idempotence ────────────────────
+STAMP_PART = "docProps/custom.xml"
+CUSTOM_PROPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/custom-properties"
+VT_NS = "http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes"
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+CUSTOM_PROPS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/custom-properties"
+CUSTOM_PROPS_CT = "application/vnd.openxmlformats-officedocument.custom-properties+xml"
+_CUSTOM_PROPS_FMTID = "{D5CDD505-2E9C-101B-9397-08002B2CF9AE}"
+_STAMP_VERSION = "FichesEngineVersion"
+_STAMP_CONFIG = "FichesConfigHash"
+_STAMP_CONTENT = "FichesContentHash"
+# Parties réécrites par Word à chaque enregistrement : exclues de l'empreinte de contenu
+_STAMP_EXCLUDED = {STAMP_PART, "docProps/core.xml", "docProps/app.xml"}
+
+def config_fingerprint(
+    cfg: ProcessingConfig,
+    legend_bytes: Optional[bytes] = None,
+    megaphone_samples: Optional[List[bytes]] = None,
+) -> str:
+    """Empreinte de tout ce qui influe sur la sortie : réglages, légende, échantillons."""
+    payload = {
+        "config": {k: v for k, v in asdict(cfg).items() if k not in _OUTPUT_NEUTRAL_FIELDS},
+        "legend": _sha1(legend_bytes) if legend_bytes and cfg.enable_legend_insertion else None,
+        "megaphones": sorted(_sha1(b) for b in (megaphone_samples or [])),
+    }
+    return _sha1(json.dumps(payload, sort_keys=True).encode("utf-8"))
+
+def _package_content_hash(infos: Iterable[zipfile.ZipInfo]) -> str:
+    """
+    Empreinte du contenu calculée à partir du répertoire central du ZIP
+    (nom, CRC-32, taille) : aucune entrée n'est décompressée.
+    """
+    lines = sorted(
+        f"{i.filename}\0{i.CRC:08x}\0{i.file_size}"
+        for i in infos if i.filename not in _STAMP_EXCLUDED
+    )
+    return _sha1("\n".join(lines).encode("utf-8"))
+
+def _read_stamp(zin: zipfile.ZipFile, limits: IngestionLimits = DEFAULT_LIMITS) -> Dict[str, str]:
+    try:
+        root = ET.fromstring(_ReadBudget(zin, limits).read(STAMP_PART))
+    except (KeyError, ET.ParseError, IngestionError):
+        return {}
+    stamp: Dict[str, str] = {}
+    for prop in root.findall(f"{{{CUSTOM_PROPS_NS}}}property"):
+        name = prop.get("name") or ""
+        if name in (_STAMP_VERSION, _STAMP_CONFIG, _STAMP_CONTENT):
+            stamp[name] = "".join(prop.itertext()).strip()
+    return stamp
+
+def is_already_harmonized(docx_bytes: bytes, fingerprint: str,
+                          limits: IngestionLimits = DEFAULT_LIMITS) -> bool:
+    """
+    Vrai si la fiche porte un tampon de cette version du moteur, pour cette
+    empreinte de configuration, et que son contenu n'a pas bougé depuis.
+    Ne lit que docProps/custom.xml et le répertoire central, dans les limites
+    d'ingestion données (celles de l'appelant de process_bytes).
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+            check_archive(zin, limits, len(docx_bytes))
+            stamp = _read_stamp(zin, limits)
+            if not stamp:
+                return False
+            return (
+                stamp.get(_STAMP_VERSION) == ENGINE_VERSION
+                and stamp.get(_STAMP_CONFIG) == fingerprint
+                and stamp.get(_STAMP_CONTENT) == _package_content_hash(zin.infolist())
+            )
+    except (zipfile.BadZipFile, IngestionError):
+        return False
+
+def _declare_stamp_part(parts: Dict[str, bytes]):
+    """Déclare docProps/custom.xml dans [Content_Types].xml et _rels/.rels si besoin."""
+    ct_name = "[Content_Types].xml"
+    if ct_name in parts:
+        try:
+            types = ET.fromstring(parts[ct_name])
+        except ET.ParseError:
+            types = None
+        if types is not None and not any(
+            o.get("PartName") == "/" + STAMP_PART for o in types.findall(f"{{{CT_NS}}}Override")
+        ):
+            SubElement(types, f"{{{CT_NS}}}Override", {"PartName": "/" + STAMP_PART, "ContentType": CUSTOM_PROPS_CT})
+            parts[ct_name] = ET.tostring(types, encoding="utf-8", xml_declaration=True)
+    rels_name = "_rels/.rels"
+    if rels_name in parts:
+        try:
+            rels = ET.fromstring(parts[rels_name])
+        except ET.ParseError:
+            return
+        existing = rels.findall(f"{{{P_REL}}}Relationship")
+        if any(r.get("Type") == CUSTOM_PROPS_REL for r in existing):
+            return
+        ids = {r.get("Id") for r in existing}
+        n = len(existing) + 1
+        while f"rId{n}" in ids:
+            n += 1
+        SubElement(rels, f"{{{P_REL}}}Relationship", {"Id": f"rId{n}", "Type": CUSTOM_PROPS_REL, "Target": STAMP_PART})
+        parts[rels_name] = ET.tostring(rels, encoding="utf-8", xml_declaration=True)
+
+def _stamped_custom_xml(existing: Optional[bytes], values: Dict[str, str]) -> bytes:
+    root = None
+    if existing:
+        try:
+            root = ET.fromstring(existing)
+        except ET.ParseError:
+            root = None
+    if root is None:
+        root = ET.Element(f"{{{CUSTOM_PROPS_NS}}}Properties")
+    pids = [0]
+    for prop in list(root.findall(f"{{{CUSTOM_PROPS_NS}}}property")):
+        if prop.get("name") in values:
+            root.remove(prop)
+            continue
+        try:
+            pids.append(int(prop.get("pid") or 0))
+        except ValueError:
+            pass
+    pid = max(max(pids), 1)
+    for name, value in values.items():
+        pid += 1
+        prop = SubElement(root, f"{{{CUSTOM_PROPS_NS}}}property",
+                             {"fmtid": _CUSTOM_PROPS_FMTID, "pid": str(pid), "name": name})
+        SubElement(prop, f"{{{VT_NS}}}lpwstr").text = value
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+# ───────────────────────── Intermédiaire structurel ────────────────
+class IntermediateCache:
+    """
+    Paquets nettoyés structurellement (SVG, mégaphones, rectangles gris, textes,
+    couleurs), indexés par contenu d'entrée et réglages structurels. Un
+    changement limité à LAYOUT_FIELDS repart de l'intermédiaire et ne rejoue
+    que les passes de taille/position. LRU borné en nombre d'entrées.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, bytes]]:
+        parts = self._load(key)
+        if parts is None:
+            self.misses += 1
+            metrics.inc("fiches_cache_requests_total", cache="intermediate", result="miss")
+            return None
+        self.hits += 1
+        metrics.inc("fiches_cache_requests_total", cache="intermediate", result="hit")
+        return parts
+
+    def put(self, key: Tuple[str, str], parts: Dict[str, bytes]):
+        self._store(key, dict(parts))
+
+    def clear(self):
+        self._entries.clear()
+
+    def _load(self, key: Tuple[str, str]) -> Optional[Dict[str, bytes]]:
+        parts = self._entries.get(key)
+        if parts is None:
+            return None
+        self._entries.move_to_end(key)
+        return dict(parts)
+
+    def _store(self, key: Tuple[str, str], parts: Dict[str, bytes]):
+        self._entries[key] = parts
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class DiskIntermediateCache(IntermediateCache):
+    """
+    IntermediateCache rangé sur disque, un ZIP non compressé par intermédiaire :
+    plusieurs processus (workers d'un pool) le partagent, quel que soit celui
+    qui a calculé l'entrée. Écritures atomiques ; au-delà de max_entries, les
+    entrées les moins récemment servies sont supprimées.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 64):
+        super().__init__(max_entries)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: Tuple[str, str]) -> str:
+        return os.path.join(self.directory, f"{key[0]}-{key[1]}.zip")
+
+    def _load(self, key: Tuple[str, str]) -> Optional[Dict[str, bytes]]:
+        path = self._path(key)
+        try:
+            with zipfile.ZipFile(path, "r") as z:
+                parts = {name: z.read(name) for name in z.namelist()}
+            os.utime(path)
+        except (OSError, zipfile.BadZipFile):
+            return None
+        return parts
+
+    def _store(self, key: Tuple[str, str], parts: Dict[str, bytes]):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as z:
+                for name, data in parts.items():
+                    z.writestr(name, data)
+            os.replace(tmp, path)
+        except OSError:
+            _remove_quietly(tmp)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".zip"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            _remove_quietly(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".zip"):
+                _remove_quietly(os.path.join(self.directory, name))
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def structural_fingerprint(cfg: ProcessingConfig, megaphone_samples: Optional[List[bytes]] = None) -> str:
+    """Empreinte des seuls réglages qui changent le nettoyage structurel."""
+    payload = {
+        "config": {k: v for k, v in asdict(cfg).items() if k not in LAYOUT_FIELDS and k not in _OUTPUT_NEUTRAL_FIELDS},
+        "megaphones": sorted(_sha1(b) for b in (megaphone_samples or [])),
+    }
+    return _sha1(json.dumps(payload, sort_keys=True).encode("utf-8"))
+
+def _structural_part(name: str, data: bytes, ctx: PartContext,
+                     structural: List[PassSpec], final: List[PassSpec], keep_tree: bool):
+    """Passes structurelles (et finales hors mise en page) d'une partie isolée."""
+    try:
+        root = fromstring(data)
+    except ET.ParseError:
+        return name, None, None, {}
+    run_passes(root, structural, ctx)
+    if keep_tree:
+        return name, root, None, ctx.updates
+    run_passes(root, final, ctx)
+    return name, None, tostring(root), ctx.updates
+
+_PASSES_BY_NAME = {p.name: p for p in PASSES}
+
+def _reparsable_bytes(root: ET.Element) -> bytes:
+    """
+    Arbre sérialisé pour être relu (intermédiaire en cache, partie revenue d'un
+    worker) : un CR brut du texte deviendrait LF à la relecture (fin de ligne
+    XML), il est écrit &#13; pour retrouver exactement le même arbre.
+    """
+    return tostring(root).replace(b"\r", b"&#13;")
+
+def _structural_part_job(job):
+    # Point d'entrée des processus : les passes voyagent par nom (les lambdas ne
+    # sont pas sérialisables) et les parties mises en page reviennent en octets.
+    name, data, ctx, structural, final, layout = job
+    name, root, out, updates = _structural_part(
+        name, data, ctx,
+        [_PASSES_BY_NAME[n] for n in structural], [_PASSES_BY_NAME[n] for n in final], layout,
+    )
+    if root is not None:
+        out = _reparsable_bytes(root)
+    # Mesures du worker (durées de passes…) rapatriées avec le résultat
+    return name, None, out, updates, metrics.drain()
+
+# Pool de processus des passes, gardé d'une fiche à l'autre : le démarrer à
+# chaque document coûtait plus que le travail réparti. Recréé si le nombre
+# de workers change, après un fork, ou s'il a été cassé.
+_PASS_POOL: Optional[ProcessPoolExecutor] = None
+_PASS_POOL_KEY: Tuple[int, int] = (0, 0)
+_PASS_POOL_LOCK = threading.Lock()
+
+def _pass_pool(workers: int) -> ProcessPoolExecutor:
+    global _PASS_POOL, _PASS_POOL_KEY
+    key = (os.getpid(), workers)
+    with _PASS_POOL_LOCK:
+        if _PASS_POOL is None or _PASS_POOL_KEY != key:
+            if _PASS_POOL is not None and _PASS_POOL_KEY[0] == key[0]:
+                _PASS_POOL.shutdown(wait=False)
+            _PASS_POOL, _PASS_POOL_KEY = ProcessPoolExecutor(max_workers=workers), key
+        return _PASS_POOL
+
+def _drop_pass_pool(broken: ProcessPoolExecutor):
+    global _PASS_POOL
+    with _PASS_POOL_LOCK:
+        if _PASS_POOL is broken:
+            _PASS_POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def _part_inputs(parts: Dict[str, bytes], name: str) -> Dict[str, bytes]:
+    """Sous-ensemble du paquet lu par les passes d'une partie : son .rels et ses cibles."""
+    rels_name = _rels_name_for(name)
+    if rels_name not in parts:
+        return {}
+    subset = {rels_name: parts[rels_name]}
+    try:
+        rels_root = ET.fromstring(parts[rels_name])
+    except ET.ParseError:
+        return subset
+    for target in _rels_target_map(rels_root, name).values():
+        if target in parts:
+            subset[target] = parts[target]
+    return subset
+
+def _structural_phase(
+    parts: Dict[str, bytes], cfg: ProcessingConfig, colors: ColorClassifier,
+    theme_colors: Dict[str, str], megaphone_fps: "IconFingerprints",
+) -> Dict[str, ET.Element]:
+    """
+    Applique les passes indépendantes de LAYOUT_FIELDS aux parties qu'elles visent.
+    Les parties hors mise en page sont resérialisées dans parts ; les arbres du
+    corps et des pieds de page sont renvoyés tels quels pour la phase suivante.
+    Les parties sont indépendantes : avec cfg.pass_workers > 1 elles sont
+    traitées en parallèle, puis leurs réécritures de .rels sont fusionnées
+    dans l'ordre des noms de parties. Les passes sont du Python pur : en
+    threads elles restent sur un cœur (GIL) ; seul "process" en occupe
+    plusieurs, le corps restant dans le processus appelant pendant que le
+    pool partagé traite en-têtes, pieds et styles. Le gain est donc borné
+    par le poids de ces autres parties.
+    """
+    plan = build_plan(parts.keys(), cfg)
+    names = sorted(plan)
+
+    def split(name: str) -> Tuple[List[PassSpec], List[PassSpec]]:
+        return ([p for p in plan[name] if p.phase == "structural"],
+                [p for p in plan[name] if p.phase == "final"])
+
+    def work(name: str):
+        structural, final = split(name)
+        ctx = PartContext(name, cfg, parts, colors, theme_colors, megaphone_fps)
+        return _structural_part(name, parts[name], ctx, structural, final, _is_layout_part(name))
+
+    parallel = cfg.pass_workers and cfg.pass_workers > 1 and len(names) > 1
+    if parallel and cfg.pass_executor == "process":
+        # La plus grosse partie (le corps, en général) reste ici : l'envoyer à un
+        # worker coûterait sa sérialisation aller-retour sans rien paralléliser.
+        # Les autres partent dans le pool pendant ce temps, plus grosses d'abord.
+        by_size = sorted(names, key=lambda n: -len(parts[n]))
+        jobs = []
+        for name in by_size[1:]:
+            structural, final = split(name)
+            ctx = PartContext(name, cfg, _part_inputs(parts, name), colors, theme_colors, megaphone_fps)
+            jobs.append((name, parts[name], ctx, [p.name for p in structural], [p.name for p in final],
+                         _is_layout_part(name)))
+        pool = _pass_pool(cfg.pass_workers)
+        try:
+            futures = [pool.submit(_structural_part_job, job) for job in jobs]
+            done = {by_size[0]: work(by_size[0])}
+            for fut in futures:
+                *result, delta = fut.result()
+                metrics.merge(delta)
+                done[result[0]] = tuple(result)
+        except BrokenProcessPool:
+            _drop_pass_pool(pool)
+            raise
+        results = [done[n] for n in names]
+    elif parallel:
+        with ThreadPoolExecutor(max_workers=cfg.pass_workers) as pool:
+            results = list(pool.map(work, names))
+    else:
+        results = [work(n) for n in names]
+
+    layout_trees: Dict[str, ET.Element] = {}
+    for name, root, data, updates in results:
+        for upd_name in sorted(updates):
+            parts[upd_name] = updates[upd_name]
+        if root is None and data is not None and _is_layout_part(name):
+            root = fromstring(data)
+        if root is not None:
+            layout_trees[name] = root
+        elif data is not None:
+            parts[name] = data
+    return layout_trees
+
+def _layout_phase(
+    parts: Dict[str, bytes], layout_trees: Dict[str, ET.Element], cfg: ProcessingConfig,
+    legend_bytes: Optional[bytes], insert_legend: bool, text_sink: Optional[FicheText] = None,
+):
+    """Passes de taille/position, légende et styles partagés sur l'intermédiaire."""
+    plan = build_plan(layout_trees.keys(), cfg, ("layout", "final"))
+    for name, root in layout_trees.items():
+        run_passes(root, plan.get(name, []), PartContext(name, cfg, parts, text_sink=text_sink))
+
+        if (
+            name == "word/document.xml"
+            and insert_legend
+            and cfg.enable_legend_insertion
+            and legend_bytes
+            and "word/_rels/document.xml.rels" in parts
+        ):
+            clear_legend_text(root)
+            rels = ET.fromstring(parts["word/_rels/document.xml.rels"])
+            media_name, media_bytes = insert_legend_in_tree(
+                root, rels, legend_bytes,
+                left_cm=cfg.legend_left,
+                top_cm=cfg.legend_top,
+                width_cm=cfg.legend_w,
+                height_cm=cfg.legend_h,
+            )
+            parts["word/_rels/document.xml.rels"] = ET.tostring(rels, encoding="utf-8", xml_declaration=True)
+            parts[media_name] = media_bytes
+
+        parts[name] = tostring(root)
+
+    if cfg.enable_style_promotion:
+        promote_run_styles(parts, cfg.style_promotion_min_runs)
+
+# ───────────────────────── Processing DOCX ─────────────────────────
+def process_bytes(
+    docx_bytes: bytes,
+    legend_bytes: bytes = None,
+    icon_left=15.3,
+    icon_top=11.0,
+    legend_left=2.3,
+    legend_top=23.8,
+    legend_w=5.68,
+    legend_h=3.77,
+    megaphone_samples: Optional[List[bytes]] = None,
+    config: Optional[ProcessingConfig] = None,
+    cache: Optional[IntermediateCache] = None,
+    limits: Optional[IngestionLimits] = None,
+    media_report: Optional[MediaReport] = None,
+    text_sink: Optional[FicheText] = None,
+) -> bytes:
+    """
+    Harmonise une fiche DOCX ; compte fiches, octets, durée et échecs (fiches_metrics).
+    Une archive hors de limits (DEFAULT_LIMITS par défaut) lève IngestionError
+    avant toute décompression. Avec cfg.enable_media_optimization, le bilan
+    des images allégées est ajouté à media_report s'il est fourni. text_sink
+    reçoit le texte du corps tel qu'écrit (rien si la fiche est déjà harmonisée).
+    """
+    start = time.perf_counter()
+    try:
+        out = _process_docx(
+            docx_bytes, legend_bytes, icon_left, icon_top, legend_left, legend_top, legend_w, legend_h,
+            megaphone_samples, config, cache, limits or DEFAULT_LIMITS, media_report, text_sink,
+        )
+    except Exception as e:
+        metrics.inc("fiches_documents_total", outcome="failed")
+        metrics.inc("fiches_errors_total", type=type(e).__name__)
+        raise
+    metrics.observe("fiches_document_seconds", time.perf_counter() - start)
+    metrics.inc("fiches_documents_total", outcome="skipped" if out is docx_bytes else "processed")
+    metrics.inc("fiches_bytes_in_total", len(docx_bytes))
+    metrics.inc("fiches_bytes_out_total", len(out))
+    return out
+
+def _process_docx(
+    docx_bytes: bytes,
+    legend_bytes: bytes = None,
+    icon_left=15.3,
+    icon_top=11.0,
+    legend_left=2.3,
+    legend_top=23.8,
+    legend_w=5.68,
+    legend_h=3.77,
+    megaphone_samples: Optional[List[bytes]] = None,
+    config: Optional[ProcessingConfig] = None,
+    cache: Optional[IntermediateCache] = None,
+    limits: IngestionLimits = DEFAULT_LIMITS,
+    media_report: Optional[MediaReport] = None,
+    text_sink: Optional[FicheText] = None,
+) -> bytes:
+
+    cfg = config or ProcessingConfig(
+        icon_left=icon_left,
+        icon_top=icon_top,
+        legend_left=legend_left,
+        legend_top=legend_top,
+        legend_w=legend_w,
+        legend_h=legend_h,
+    )
+
+    with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+        # Répertoire central contrôlé avant toute décompression
+        names = [i.filename for i in check_archive(zin, limits, len(docx_bytes))]
+
+    fingerprint = None
+    if cfg.enable_idempotence_stamp:
+        fingerprint = config_fingerprint(cfg, legend_bytes, megaphone_samples)
+        if is_already_harmonized(docx_bytes, fingerprint, limits):
+            return docx_bytes
+
+    if cfg.enable_media_optimization:
+        media_report = media_report if media_report is not None else MediaReport()
+        if legend_bytes and cfg.enable_legend_insertion:
+            # Après l'empreinte : le tampon reste lié à la légende fournie
+            legend_bytes = optimize_legend(legend_bytes, cfg, media_report)
+
+    # En mode flux, document.xml n'est jamais chargé en entier : il est relu
+    # bloc par bloc au moment de l'écriture de l'archive de sortie.
+    stream_body = cfg.enable_streaming_body and STREAMED_PART in names
+
+    # Intermédiaire structurel déjà calculé pour ce fichier et ces réglages ?
+    cache_key = None
+    cached = None
+    read_bytes = 0
+    if cache is not None and not stream_body:
+        cache_key = (_sha1(docx_bytes), structural_fingerprint(cfg, megaphone_samples))
+        cached = cache.get(cache_key)
+
+    if cached is not None:
+        parts = cached
+        layout_trees: Dict[str, ET.Element] = {}
+        for name in parts:
+            if name.endswith(".xml") and _is_layout_part(name):
+                try:
+                    layout_trees[name] = fromstring(parts[name])
+                except ET.ParseError:
+                    continue
+    else:
+        with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+            budget = _ReadBudget(zin, limits)
+            parts = {n: budget.read(n) for n in names if not (stream_body and n == STREAMED_PART)}
+            read_bytes = budget.used
+
+        # Une seule copie par média identique : chaque image n'est ensuite
+        # empreintée, analysée et recompressée qu'une fois.
+        if cfg.enable_media_dedup:
+            dedupe_media(parts)
+
+        # NOUVELLE APPROCHE : Identifier tous les SVG à supprimer (tous sauf Cible.svg)
+        svg_index = svg_signature_index(megaphone_samples)
+        svg_paths_to_remove = _identify_svg_to_remove(parts, svg_index)
+
+        # Détail du tri des SVG, visible avec le niveau DEBUG de ce module
+        if log.isEnabledFor(logging.DEBUG):
+            total_svg_count = sum(1 for n in parts.keys() if n.lower().endswith(".svg") and "/media/" in n.lower())
+            log.debug("SVG : %d dans word/media/, %d gardé(s) (Cible), %d à supprimer %s",
+                      total_svg_count, total_svg_count - len(svg_paths_to_remove), len(svg_paths_to_remove),
+                      sorted(svg_paths_to_remove)[:5])
+
+        # Supprimer toutes les références aux SVG identifiés
+        svg_rids_by_part = _remove_svg_references(parts, svg_paths_to_remove)
+
+        theme_colors = extract_theme_colors(parts)
+        colors = ColorClassifier(theme_colors)
+
+        megaphone_hashes, megaphone_ahashes = _megaphone_fingerprints(megaphone_samples)
+
+        protected_hashes, protected_ahashes = _load_protected_icon_hashes()
+
+        megaphone_fps = (megaphone_hashes, megaphone_ahashes, protected_hashes, protected_ahashes, svg_index)
+        layout_trees = _structural_phase(parts, cfg, colors, theme_colors, megaphone_fps)
+
+        if cache_key is not None:
+            snapshot = dict(parts)
+            for name, root in layout_trees.items():
+                snapshot[name] = _reparsable_bytes(root)
+            cache.put(cache_key, snapshot)
+
+    _layout_phase(parts, layout_trees, cfg, legend_bytes, insert_legend=not stream_body, text_sink=text_sink)
+
+    # En mode flux, document.xml n'est pas dans parts : les cadres de ses images
+    # sont inconnus et le paquet n'est pas optimisé (seule la légende l'est).
+    if cfg.enable_media_optimization and not stream_body:
+        optimize_media(parts, cfg, media_report)
+
+    if fingerprint is not None:
+        _declare_stamp_part(parts)
+
+    out_buf = io.BytesIO()
+    with zipfile.ZipFile(out_buf, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        if stream_body:
+            with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+                _stream_document_xml(
+                    zin, zout, parts, cfg, colors, theme_colors, svg_rids_by_part,
+                    megaphone_fps,
+                    legend_bytes,
+                    _ReadBudget(zin, limits, used=read_bytes),
+                    text_sink,
+                )
+        for n, d in parts.items():
+            if fingerprint is not None and n == STAMP_PART:
+                continue
+            zout.writestr(n, d)
+        if fingerprint is not None:
+            # Écrit en dernier : l'empreinte couvre toutes les autres entrées
+            zout.writestr(STAMP_PART, _stamped_custom_xml(parts.get(STAMP_PART), {
+                _STAMP_VERSION: ENGINE_VERSION,
+                _STAMP_CONFIG: fingerprint,
+                _STAMP_CONTENT: _package_content_hash(zout.infolist()),
+            }))
+    return out_buf.getvalue()
+
+# ───────────────────────── Analyse seule (sans écriture) ───────────
+_SCAN_PARA_END_RE = re.compile(rb"</(?:w|a):p>")
+_SCAN_TEXT_RE = re.compile(rb"<(?:w|a):t(?:\s[^>]*)?>([^<]*)</(?:w|a):t>")
+
+@dataclass
+class ScanReport:
+    """Ce que process_bytes modifierait dans une fiche, sans rien réécrire."""
+    years: int = 0
+    actualisation: int = 0
+    red_or_blue: int = 0
+    svg_to_remove: int = 0
+    megaphones: int = 0
+    error: Optional[str] = None
+
+    @property
+    def needs_processing(self) -> bool:
+        return bool(self.years or self.actualisation or self.red_or_blue
+                    or self.svg_to_remove or self.megaphones)
+
+def _drawing_media(root) -> List[Tuple[ET.Element, str]]:
+    """(dessin supprimable, rId de son image) : mêmes sélecteurs que _remove_megaphone_drawings."""
+    found = []
+    for container, ref_path, attrs in (("w:drawing", ".//a:blip", (f"{{{R}}}embed",)),
+                                       ("w:pict", ".//v:imagedata", (f"{{{R}}}id", f"{{{R}}}embed"))):
+        for holder in findall(root, f".//{container}", NS):
+            for ref in findall(holder, ref_path, NS):
+                rid = next((ref.get(a) for a in attrs if ref.get(a)), None)
+                if rid:
+                    found.append((holder, rid))
+    return found
+
+def scan_bytes(docx_bytes: bytes, megaphone_samples: Optional[List[bytes]] = None,
+               limits: IngestionLimits = DEFAULT_LIMITS,
+               config: Optional[ProcessingConfig] = None) -> ScanReport:
+    """
+    Analyse en lecture seule de ce que process_bytes(…, config=config)
+    changerait. Les parties visées sont celles du plan de passes (build_plan),
+    les couleurs comptées celles que les passes sélectionnent (_COLOR_SELECTORS)
+    et que ColorClassifier noircirait, les mégaphones les dessins qui
+    référencent un média reconnu. Les médias sont empreintés par blocs sans
+    être chargés en entier quand leur aHash est déjà connu.
+    Mêmes limites d'ingestion que process_bytes (IngestionError).
+    """
+    cfg = config or ProcessingConfig()
+    report = ScanReport()
+    with zipfile.ZipFile(io.BytesIO(docx_bytes), "r") as zin:
+        names = [i.filename for i in check_archive(zin, limits, len(docx_bytes))]
+        budget = _ReadBudget(zin, limits)
+        theme = {n: budget.read(n) for n in names if n == "word/theme/theme1.xml"}
+        colors = ColorClassifier(extract_theme_colors(theme))
+
+        media = [n for n in names if n.lower().startswith("word/") and "/media/" in n.lower()]
+        svgs = {n: budget.read(n) for n in media if n.lower().endswith(".svg")}
+        svg_index = svg_signature_index(megaphone_samples)
+        report.svg_to_remove = len(_identify_svg_to_remove(svgs, svg_index))
+
+        megaphone_media: Optional[Set[str]] = None
+
+        def megaphone_paths() -> Set[str]:
+            megaphone_hashes, megaphone_ahashes = _megaphone_fingerprints(megaphone_samples)
+            protected_hashes, protected_ahashes = _load_protected_icon_hashes()
+            found = set()
+            for name in media:
+                if name in svgs:
+                    continue
+                # Hash par blocs ; le média n'est lu en entier que si son aHash est inconnu
+                data_hash = _zip_entry_sha1(zin, name)
+                data_ah = _AHASH_BY_SHA1.get(data_hash, _MISS)
+                if data_ah is not _MISS:
+                    metrics.inc("fiches_image_decodes_avoided_total")
+                else:
+                    data_ah = _ahash_for(budget.read(name), data_hash)
+                if _is_protected_icon(data_hash, data_ah, protected_hashes, protected_ahashes):
+                    continue
+                if _is_megaphone_icon(data_hash, data_ah, megaphone_hashes, megaphone_ahashes):
+                    found.add(name)
+            return found
+
+        for name, specs in build_plan(names, cfg, phases=("structural",)).items():
+            active = {spec.name for spec in specs}
+            data = budget.read(name)
+            if active & {"replace_years", "strip_actualisation"}:
+                for chunk in _SCAN_PARA_END_RE.split(data):
+                    texts = _SCAN_TEXT_RE.findall(chunk)
+                    if not texts:
+                        continue
+                    txt = unescape(b"".join(texts).decode("utf-8", "replace"))
+                    if "replace_years" in active:
+                        report.years += len(YEAR_PAT.findall(txt))
+                    if "strip_actualisation" in active:
+                        report.actualisation += len(ACTUALISATION_PAT.findall(txt))
+
+            selectors = [_COLOR_SELECTORS[n] for n in active if n in _COLOR_SELECTORS]
+            rels_name = _rels_name_for(name)
+            check_megaphones = "megaphones" in active and rels_name in names
+            if not (selectors and b"color" in data) and not check_megaphones:
+                continue
+            try:
+                root = fromstring(data)
+            except ET.ParseError:
+                continue
+
+            if selectors:
+                # Une même couleur visée par deux passes n'est comptée qu'une fois
+                targets = {id(col): col for select in selectors for col in select(root)}
+                report.red_or_blue += sum(1 for col in targets.values() if colors.should_blacken(col))
+
+            if check_megaphones:
+                try:
+                    rmap = _rels_target_map(ET.fromstring(budget.read(rels_name)), name)
+                except ET.ParseError:
+                    continue
+                if megaphone_media is None:
+                    megaphone_media = megaphone_paths()
+                report.megaphones += len({id(holder) for holder, rid in _drawing_media(root)
+                                          if rmap.get(rid) in megaphone_media})
+    return report
+
+def _scan_path(args: Tuple[str, Optional[List[bytes]], Optional[ProcessingConfig]]) -> Tuple[str, ScanReport]:
+    path, megaphone_samples, config = args
+    try:
+        with open(path, "rb") as f:
+            return path, scan_bytes(f.read(), megaphone_samples, config=config)
+    except Exception as e:
+        return path, ScanReport(error=f"{type(e).__name__}: {e}")
+
+def scan_paths(
+    paths: Iterable[str],
+    megaphone_samples: Optional[List[bytes]] = None,
+    workers: Optional[int] = None,
+    config: Optional[ProcessingConfig] = None,
+) -> List[Tuple[str, ScanReport]]:
+    """Analyse un lot de fiches en parallèle (un processus par cœur par défaut)."""
+    jobs = [(p, megaphone_samples, config) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_scan_path, jobs, chunksize=8))
+
+# ───────────────────────── Nom de fichier de sortie ────────────────
+def cleaned_filename(original_name: str) -> str:
+    base, ext = os.path.splitext(original_name)
+    base = re.sub(r"(?iu)\bactu\b", "", base)
+    base = normalize_spaces(base)
+    base = re.sub(r"\s+([\-_,])", r"\1", base)
+    if not ext.lower().endswith(".docx"):
+        ext = ".docx"
+    return f"{base}{ext}"
+
+def unique_names(names: Iterable[str], taken: Iterable[str] = ()) -> List[str]:
+    """
+    Noms rendus uniques, sans tenir compte de la casse, dans l'ordre donné : le
+    deuxième « X.docx » devient « X (2).docx », le troisième « X (3).docx »...
+    Utile après cleaned_filename, qui peut confondre « X.docx » et « X actu.docx ».
+    taken : noms déjà attribués par ailleurs, à éviter aussi.
+    """
+    used: Set[str] = {t.lower() for t in taken}
+    out: List[str] = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate.lower() in used:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        used.add(candidate.lower())
+        out.append(candidate)
+    return out
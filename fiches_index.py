@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Index plein texte des fiches harmonisées (SQLite FTS5).
+
+Le texte vient du traitement lui-même : process_bytes(…, text_sink=FicheText())
+relève nom du cours, titres du plan et paragraphes pendant les passes, et
+FicheIndex.add() les range dans l'index. Aucun DOCX n'est rouvert : un lot
+converti est cherchable dès qu'il se termine.
+
+    index = FicheIndex("fiches.sqlite3")
+    index.add("UE1/Anatomie.docx", text)
+    index.search("plexus brachial")
+
+La recherche ignore casse et accents (tokenizer unicode61) ; la syntaxe FTS5
+est acceptée (guillemets, OR, préfixe*). Une fiche réindexée sous le même nom
+remplace la précédente.
+
+En ligne de commande : python fiches_index.py INDEX "requête" [--limit N]
+"""
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fiches_engine import FicheText
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fiches (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    course TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    indexed REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS fiches_fts USING fts5(
+    course, plan, body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+@dataclass
+class SearchHit:
+    name: str
+    course: str
+    plan: List[str]
+    snippet: str
+    score: float
+
+class FicheIndex:
+    """Index sur disque ; sûr entre threads, un seul écrivain par fichier conseillé."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        try:
+            self._db.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._db.close()
+            raise RuntimeError(f"SQLite sans FTS5, index plein texte indisponible : {e}") from None
+
+    def add(self, name: str, text: FicheText):
+        """(Ré)indexe une fiche sous name, en général son nom de sortie."""
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id FROM fiches WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                self._db.execute("DELETE FROM fiches_fts WHERE rowid = ?", (row[0],))
+                self._db.execute("DELETE FROM fiches WHERE id = ?", (row[0],))
+            cur = self._db.execute(
+                "INSERT INTO fiches (name, course, plan, indexed) VALUES (?, ?, ?, ?)",
+                (name, text.course, json.dumps(text.plan, ensure_ascii=False), time.time()),
+            )
+            self._db.execute(
+                "INSERT INTO fiches_fts (rowid, course, plan, body) VALUES (?, ?, ?, ?)",
+                (cur.lastrowid, text.course, "\n".join(text.plan), "\n".join(text.body)),
+            )
+
+    def remove(self, name: str) -> bool:
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id FROM fiches WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return False
+            self._db.execute("DELETE FROM fiches_fts WHERE rowid = ?", (row[0],))
+            self._db.execute("DELETE FROM fiches WHERE id = ?", (row[0],))
+            return True
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        """
+        Fiches les plus pertinentes d'abord (bm25, nom du cours et plan pesant
+        plus que le corps). Une requête qui n'est pas du FTS5 valide est
+        cherchée comme une suite de mots.
+        """
+        sql = (
+            "SELECT f.name, f.course, f.plan,"
+            " snippet(fiches_fts, 2, '[', ']', '…', 12), bm25(fiches_fts, 10.0, 5.0, 1.0) AS score"
+            " FROM fiches_fts JOIN fiches f ON f.id = fiches_fts.rowid"
+            " WHERE fiches_fts MATCH ? ORDER BY score LIMIT ?"
+        )
+        with self._lock:
+            try:
+                rows = self._db.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                words = " ".join('"' + w.replace('"', '""') + '"' for w in query.split())
+                rows = self._db.execute(sql, (words, limit)).fetchall() if words else []
+        return [SearchHit(name, course, json.loads(plan), snippet, score)
+                for name, course, plan, snippet, score in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM fiches").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recherche dans l'index des fiches")
+    parser.add_argument("index", help="fichier d'index (--index de fiches_batch / fiches_watch)")
+    parser.add_argument("query", help="mots cherchés (syntaxe FTS5 acceptée)")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+    try:
+        index = FicheIndex(args.index)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    hits = index.search(args.query, args.limit)
+    for hit in hits:
+        print(f"{hit.name} — {hit.course or 'cours inconnu'}")
+        print("    " + " ".join(hit.snippet.split()))
+    if not hits:
+        print("Aucune fiche trouvée.")
+    index.close()
+
+if __name__ == "__main__":
+    main()
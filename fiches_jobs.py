@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+File de conversions en arrière-plan, indépendante des réexécutions Streamlit.
+
+Un lot soumis reçoit un identifiant ; ses fichiers, ses réglages et le ZIP
+produit sont rangés sur disque (un dossier par lot) et l'avancement dans une
+base SQLite, si bien qu'un onglet rechargé — ou un serveur relancé — retrouve
+le lot là où il en était. Les fichiers sont convertis un par un par un pool
+de processus ; le prochain fichier est pris à tour de rôle chez chaque
+utilisateur ayant du travail en attente, pour qu'un gros lot n'affame pas les
+autres. Les lots terminés restent téléchargeables retention_s secondes.
+Les intermédiaires structurels (IntermediateCache) sont rangés sous le
+dossier de stockage et servent à tous les workers : une fiche resoumise avec
+d'autres tailles ne rejoue que la mise en page.
+
+FICHES_JOBS_DIR choisit le dossier de stockage (par défaut fiches_jobs dans
+le dossier temporaire du système).
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass, asdict, field, replace
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import fiches_metrics as metrics
+from fiches_engine import (
+    DiskIntermediateCache,
+    MediaReport,
+    ProcessingConfig,
+    cleaned_filename,
+    config_fingerprint,
+    is_already_harmonized,
+    process_bytes,
+    unique_names,
+)
+
+# ───────────────────────── États ───────────────────────────────────
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+RESULT_NAME = "fiches_modifiees.zip"
+DEFAULT_RETENTION_S = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    out_name TEXT,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    saved_bytes INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS files_pending ON files(state, job_id);
+"""
+
+@dataclass
+class JobStatus:
+    """Avancement d'un lot tel que l'affiche l'interface."""
+    id: str
+    owner: str
+    state: str
+    created: float
+    finished: Optional[float] = None
+    total: int = 0
+    done: int = 0
+    skipped: List[str] = field(default_factory=list)
+    # (fichier, octets gagnés par l'optimisation des médias)
+    saved: List[Tuple[str, int]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QUEUED, RUNNING)
+
+    @property
+    def progress(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+# ───────────────────────── Conversion (processus worker) ────────────
+# Intermédiaires structurels partagés par tous les workers, sous le dossier de
+# la file : une fiche resoumise avec d'autres tailles repart de son intermédiaire
+# quel que soit le worker qui la reprend.
+INTERMEDIATE_DIR = "intermediaires"
+_WORKER_CACHE: Optional[DiskIntermediateCache] = None
+
+def _read_optional(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _convert_file(args: Tuple[str, int, str]) -> Tuple[Optional[str], bool, int, Optional[str], dict]:
+    """
+    Convertit le fichier idx du lot rangé dans job_dir. Renvoie
+    (nom de sortie, déjà harmonisé, octets gagnés sur les médias, erreur,
+    mesures) ; la sortie est écrite à côté de l'entrée pour que seul un chemin
+    revienne au processus principal.
+    """
+    global _WORKER_CACHE
+    job_dir, idx, name = args
+    try:
+        with open(os.path.join(job_dir, "job.json"), encoding="utf-8") as f:
+            spec = json.load(f)
+        # Déjà dans un worker du pool : les parties d'une fiche se partagent des
+        # threads, jamais un second pool de processus imbriqué.
+        cfg = replace(ProcessingConfig(**spec["config"]), pass_executor="thread")
+        legend_bytes = _read_optional(os.path.join(job_dir, "legend")) if cfg.enable_legend_insertion else None
+        samples = [
+            _read_optional(os.path.join(job_dir, f"megaphone_{i}")) for i in range(spec["megaphones"])
+        ]
+        samples = [s for s in samples if s] or None
+        with open(os.path.join(job_dir, "in", str(idx)), "rb") as f:
+            original_bytes = f.read()
+
+        report = MediaReport()
+        if cfg.enable_idempotence_stamp and is_already_harmonized(
+            original_bytes, config_fingerprint(cfg, legend_bytes, samples)
+        ):
+            out_name, out_bytes, skipped = name, original_bytes, True
+        else:
+            cache_dir = os.path.join(os.path.dirname(job_dir), INTERMEDIATE_DIR)
+            if _WORKER_CACHE is None or _WORKER_CACHE.directory != cache_dir:
+                _WORKER_CACHE = DiskIntermediateCache(cache_dir)
+            out_bytes = process_bytes(
+                original_bytes,
+                legend_bytes=legend_bytes,
+                megaphone_samples=samples,
+                config=cfg,
+                cache=_WORKER_CACHE,
+                media_report=report,
+            )
+            out_name, skipped = cleaned_filename(name), False
+        tmp = os.path.join(job_dir, "out", f"{idx}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(out_bytes)
+        os.replace(tmp, os.path.join(job_dir, "out", str(idx)))
+        return out_name, skipped, report.bytes_saved, None, metrics.drain()
+    except Exception as e:
+        return None, False, 0, f"{name} : {e}", metrics.drain()
+
+# ───────────────────────── File de lots ────────────────────────────
+class JobQueue:
+    """
+    File persistante de lots de conversion. Un seul objet par dossier de
+    stockage et par serveur (cf. st.cache_resource côté interface) ; un
+    thread répartiteur alimente le pool et finalise les lots.
+    """
+
+    def __init__(self, root: Optional[str] = None, workers: Optional[int] = None,
+                 retention_s: float = DEFAULT_RETENTION_S):
+        self.root = root or os.environ.get("FICHES_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "fiches_jobs")
+        self.workers = workers or os.cpu_count() or 1
+        self.retention_s = retention_s
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, "jobs.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+        try:
+            # Bases créées avant la colonne saved_bytes
+            self._db.execute("ALTER TABLE files ADD COLUMN saved_bytes INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        # Conversions interrompues par un arrêt du serveur : reprises depuis le début
+        with self._db:
+            self._db.execute("UPDATE files SET state = ? WHERE state = ?", (QUEUED, RUNNING))
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._in_flight = 0
+        # Un worker tué (mémoire…) casse le pool et tous les fichiers en cours.
+        # Ceux-ci sont rejoués un par un : seul celui qui casse encore le pool
+        # en étant seul est noté en échec.
+        self._crashes: Dict[Tuple[str, int], int] = {}
+        self._suspects: List[Tuple[str, int, str]] = []
+        self._solo: Optional[Tuple[str, int]] = None
+        # Dernier passage de chaque utilisateur, pour le tourniquet
+        self._served: Dict[str, int] = {}
+        self._turn = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_purge = 0.0
+        self._thread = threading.Thread(target=self._dispatch_loop, name="fiches-jobs", daemon=True)
+        self._thread.start()
+        metrics.REGISTRY.gauge("fiches_queue_files", "Fichiers de la file d'arrière-plan, par état.", self._depth)
+
+    # ── API ──
+    def submit(self, owner: str, files: List[Tuple[str, bytes]], config: ProcessingConfig,
+               legend_bytes: Optional[bytes] = None,
+               megaphone_samples: Optional[List[bytes]] = None) -> str:
+        """Range le lot sur disque et le met en file ; renvoie son identifiant."""
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(os.path.join(job_dir, "in"))
+        os.makedirs(os.path.join(job_dir, "out"))
+        for idx, (_, data) in enumerate(files):
+            with open(os.path.join(job_dir, "in", str(idx)), "wb") as f:
+                f.write(data)
+        if legend_bytes:
+            with open(os.path.join(job_dir, "legend"), "wb") as f:
+                f.write(legend_bytes)
+        samples = megaphone_samples or []
+        for i, sample in enumerate(samples):
+            with open(os.path.join(job_dir, f"megaphone_{i}"), "wb") as f:
+                f.write(sample)
+        with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+            json.dump({"config": asdict(config), "megaphones": len(samples)}, f)
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, owner, state, created) VALUES (?, ?, ?, ?)",
+                (job_id, owner, QUEUED, time.time()),
+            )
+            self._db.executemany(
+                "INSERT INTO files (job_id, idx, name, state) VALUES (?, ?, ?, ?)",
+                [(job_id, idx, name, QUEUED) for idx, (name, _) in enumerate(files)],
+            )
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, owner, state, created, finished FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            files = self._db.execute(
+                "SELECT name, state, skipped, saved_bytes, error FROM files WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        status = JobStatus(*row, total=len(files))
+        for name, state, skipped, saved_bytes, error in files:
+            if state in (DONE, FAILED):
+                status.done += 1
+            if skipped:
+                status.skipped.append(name)
+            if saved_bytes:
+                status.saved.append((name, saved_bytes))
+            if error:
+                status.errors.append(error)
+        return status
+
+    def jobs_for(self, owner: str, limit: int = 10) -> List[JobStatus]:
+        """Lots récents d'un utilisateur, du plus récent au plus ancien."""
+        with self._lock:
+            ids = [r[0] for r in self._db.execute(
+                "SELECT id FROM jobs WHERE owner = ? ORDER BY created DESC LIMIT ?", (owner, limit)
+            )]
+        return [s for s in (self.status(i) for i in ids) if s is not None]
+
+    def result_path(self, job_id: str) -> Optional[str]:
+        """Chemin du ZIP d'un lot terminé, ou None (en cours, vide ou expiré)."""
+        try:
+            path = os.path.join(self._job_dir(job_id), RESULT_NAME)
+        except ValueError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Supprime les lots terminés depuis plus de retention_s ; renvoie leur nombre."""
+        limit = (now or time.time()) - self.retention_s
+        with self._lock, self._db:
+            ids = [r[0] for r in self._db.execute(
+                "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?", (limit,)
+            )]
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+        for job_id in ids:
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        return len(ids)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+        self._db.close()
+
+    def _depth(self) -> Dict[tuple, float]:
+        depth = {((("state", QUEUED),)): 0, ((("state", RUNNING),)): 0}
+        if self._closed:
+            return depth
+        with self._lock:
+            for state, n in self._db.execute(
+                "SELECT state, COUNT(*) FROM files WHERE state IN (?, ?) GROUP BY state", (QUEUED, RUNNING)
+            ):
+                depth[(("state", state),)] = n
+        return depth
+
+    # ── Répartition ──
+    def _job_dir(self, job_id: str) -> str:
+        # L'identifiant vient parfois de l'URL : jamais utilisé tel quel comme chemin
+        return os.path.join(self.root, uuid.UUID(job_id).hex)
+
+    def _next_file(self) -> Optional[Tuple[str, int, str, str]]:
+        """
+        Prochain fichier en attente : chez l'utilisateur servi le moins
+        récemment, dans son lot le plus ancien. Réservé dans la base avant
+        d'être rendu.
+        """
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT j.owner, MIN(j.created) FROM files f JOIN jobs j ON j.id = f.job_id "
+                "WHERE f.state = ? GROUP BY j.owner", (QUEUED,)
+            ).fetchall()
+            if not rows:
+                return None
+            owner = min(rows, key=lambda r: (self._served.get(r[0], -1), r[1]))[0]
+            job_id, idx, name = self._db.execute(
+                "SELECT f.job_id, f.idx, f.name FROM files f JOIN jobs j ON j.id = f.job_id "
+                "WHERE f.state = ? AND j.owner = ? ORDER BY j.created, f.idx LIMIT 1", (QUEUED, owner)
+            ).fetchone()
+            self._db.execute("UPDATE files SET state = ? WHERE job_id = ? AND idx = ?", (RUNNING, job_id, idx))
+            self._db.execute("UPDATE jobs SET state = ? WHERE id = ? AND state = ?", (RUNNING, job_id, QUEUED))
+            self._turn += 1
+            self._served[owner] = self._turn
+        return owner, job_id, idx, name
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Remplace le pool cassé, une seule fois quel que soit le nombre de fichiers touchés."""
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _next_submission(self) -> Optional[Tuple[str, int, str]]:
+        """Fichier à lancer maintenant : un suspect seul sur le pool, sinon le suivant de la file."""
+        with self._lock:
+            if self._solo is not None:
+                return None
+            if self._suspects:
+                if self._in_flight:
+                    # On laisse le pool se vider avant de rejouer un suspect seul
+                    return None
+                job_id, idx, name = self._suspects.pop(0)
+                self._solo = (job_id, idx)
+                return job_id, idx, name
+        nxt = self._next_file()
+        return None if nxt is None else nxt[1:]
+
+    def _dispatch_loop(self):
+        while not self._closed:
+            self._finalize_ready()
+            if time.time() - self._last_purge > 60:
+                self._last_purge = time.time()
+                self.purge_expired()
+            while self._in_flight < self.workers:
+                nxt = self._next_submission()
+                if nxt is None:
+                    break
+                job_id, idx, name = nxt
+                pool = self._pool
+                try:
+                    fut = pool.submit(_convert_file, (self._job_dir(job_id), idx, name))
+                except BrokenProcessPool:
+                    # Cassé entre deux soumissions : nouveau pool, fichier remis à sa place
+                    self._replace_pool(pool)
+                    with self._lock:
+                        if self._solo == (job_id, idx):
+                            self._solo = None
+                            self._suspects.insert(0, (job_id, idx, name))
+                            continue
+                    with self._lock, self._db:
+                        self._db.execute("UPDATE files SET state = ? WHERE job_id = ? AND idx = ?",
+                                         (QUEUED, job_id, idx))
+                    continue
+                with self._lock:
+                    self._in_flight += 1
+                fut.add_done_callback(lambda f, p=pool, j=job_id, i=idx, n=name: self._file_done(p, j, i, n, f))
+            self._wake.wait(timeout=5.0)
+            self._wake.clear()
+
+    def _file_done(self, pool: ProcessPoolExecutor, job_id: str, idx: int, name: str, fut):
+        key = (job_id, idx)
+        try:
+            out_name, skipped, saved_bytes, error, delta = fut.result()
+        except BrokenProcessPool as e:
+            self._replace_pool(pool)
+            metrics.inc("fiches_errors_total", type=type(e).__name__)
+            with self._lock:
+                crashes = self._crashes[key] = self._crashes.get(key, 0) + 1
+                if self._solo == key:
+                    self._solo = None
+                if crashes < 2:
+                    # Peut-être une victime du fichier fautif : rejoué seul
+                    self._suspects.append((job_id, idx, name))
+                    self._in_flight -= 1
+            if crashes < 2:
+                self._wake.set()
+                return
+            out_name, skipped, saved_bytes, delta = None, False, 0, None
+            error = f"{name} : la conversion a interrompu son processus deux fois (fichier trop lourd ?)"
+        except Exception as e:
+            out_name, skipped, saved_bytes, error, delta = None, False, 0, f"{name} : {e}", None
+            metrics.inc("fiches_errors_total", type=type(e).__name__)
+        metrics.merge(delta)
+        with self._lock, self._db:
+            if self._solo == key:
+                self._solo = None
+            self._crashes.pop(key, None)
+            self._db.execute(
+                "UPDATE files SET state = ?, out_name = ?, skipped = ?, saved_bytes = ?, error = ?"
+                " WHERE job_id = ? AND idx = ?",
+                (FAILED if error else DONE, out_name, int(skipped), saved_bytes, error, job_id, idx),
+            )
+            self._in_flight -= 1
+        self._wake.set()
+
+    def _finalize_ready(self):
+        """Assemble le ZIP des lots dont plus aucun fichier n'est en attente ou en cours."""
+        with self._lock:
+            ready = [r[0] for r in self._db.execute(
+                "SELECT j.id FROM jobs j WHERE j.finished IS NULL AND NOT EXISTS "
+                "(SELECT 1 FROM files f WHERE f.job_id = j.id AND f.state IN (?, ?))", (QUEUED, RUNNING)
+            )]
+        for job_id in ready:
+            with self._lock:
+                outputs = self._db.execute(
+                    "SELECT idx, out_name FROM files WHERE job_id = ? AND state = ? ORDER BY idx", (job_id, DONE)
+                ).fetchall()
+            job_dir = self._job_dir(job_id)
+            if outputs:
+                tmp = os.path.join(job_dir, RESULT_NAME + ".tmp")
+                # « X.docx » et « X actu.docx » donnent le même nom : suffixes « (n) »
+                names = unique_names(out_name for _, out_name in outputs)
+                with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as z:
+                    for (idx, _), out_name in zip(outputs, names):
+                        z.write(os.path.join(job_dir, "out", str(idx)), out_name)
+                os.replace(tmp, os.path.join(job_dir, RESULT_NAME))
+            # Entrées et sorties unitaires ne servent plus : seul le ZIP est conservé
+            shutil.rmtree(os.path.join(job_dir, "in"), ignore_errors=True)
+            shutil.rmtree(os.path.join(job_dir, "out"), ignore_errors=True)
+            with self._lock, self._db:
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, finished = ? WHERE id = ?",
+                    (DONE if outputs else FAILED, time.time(), job_id),
+                )
+            metrics.inc("fiches_jobs_total", state=DONE if outputs else FAILED)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Compteurs et histogrammes du convertisseur, exposés au format texte Prometheus.
+
+Le moteur, la file de lots et le service HTTP enregistrent leurs mesures dans
+le registre REGISTRY. Les processus workers accumulent localement ; chaque
+conversion renvoie drain() avec son résultat et le processus principal le
+fusionne (merge), si bien que /metrics reflète aussi le travail fait dans les
+pools. Les jauges (profondeur de file…) sont lues à la demande.
+
+Sans dépendance : serve() ouvre un petit serveur HTTP local si aucun serveur
+ASGI n'expose déjà /metrics (cf. fiches_service).
+"""
+import os
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Secondes : de la petite passe (quelques ms) à la très grosse fiche (minutes)
+PASS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DOCUMENT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _format_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class Registry:
+    """Métriques d'un processus ; toutes les méthodes sont sûres entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # (nom, labels) → [effectifs par borne, somme, nombre]
+        self._hists: Dict[Tuple[str, Labels], list] = {}
+
+    def _check_fork(self):
+        # Un worker forké hérite des valeurs du parent : il repart de zéro,
+        # sinon drain() les renverrait une seconde fois.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    # ── Déclarations ──
+    def counter(self, name: str, doc: str):
+        self._meta[name] = ("counter", doc)
+
+    def histogram(self, name: str, doc: str, buckets: Tuple[float, ...]):
+        self._meta[name] = ("histogram", doc)
+        self._buckets[name] = tuple(buckets)
+
+    def gauge(self, name: str, doc: str, read: Callable[[], Dict[Labels, float]]):
+        """Jauge lue à chaque rendu ; read renvoie {labels: valeur}."""
+        self._meta[name] = ("gauge", doc)
+        self._gauges[name] = read
+
+    # ── Mesures ──
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        buckets = self._buckets[name]
+        with self._lock:
+            self._check_fork()
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    # ── Échanges entre processus ──
+    def drain(self) -> dict:
+        """Mesures accumulées depuis le dernier drain(), remises à zéro."""
+        with self._lock:
+            self._check_fork()
+            delta = {"counters": self._counters, "hists": self._hists}
+            self._counters, self._hists = {}, {}
+        return delta
+
+    def merge(self, delta: Optional[dict]):
+        if not delta:
+            return
+        with self._lock:
+            self._check_fork()
+            for key, amount in delta["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + amount
+            for key, (counts, total, n) in delta["hists"].items():
+                h = self._hists.get(key)
+                if h is None:
+                    h = self._hists[key] = [[0] * len(counts), 0.0, 0]
+                h[0] = [a + b for a, b in zip(h[0], counts)]
+                h[1] += total
+                h[2] += n
+
+    # ── Lecture ──
+    def value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def snapshot(self) -> List[dict]:
+        """Une ligne par série (compteurs, jauges, nombre et moyenne des histogrammes)."""
+        rows = []
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (list(v[0]), v[1], v[2]) for k, v in self._hists.items()}
+        for (name, labels), v in sorted(counters.items()):
+            rows.append({"métrique": name, "labels": _format_labels(labels), "valeur": v})
+        for name, read in sorted(self._gauges.items()):
+            for labels, v in sorted(read().items()):
+                rows.append({"métrique": name, "labels": _format_labels(labels), "valeur": v})
+        for (name, labels), (_, total, n) in sorted(hists.items()):
+            rows.append({"métrique": f"{name} (n / moyenne)", "labels": _format_labels(labels),
+                         "valeur": f"{n} / {total / n:.3f}" if n else "0"})
+        return rows
+
+    def render(self) -> str:
+        """Format d'exposition texte Prometheus 0.0.4."""
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (list(v[0]), v[1], v[2]) for k, v in self._hists.items()}
+        gauges = {name: read() for name, read in self._gauges.items()}
+        lines: List[str] = []
+        for name in sorted(self._meta):
+            kind, doc = self._meta[name]
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (n, labels), v in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(v)}")
+            elif kind == "gauge":
+                for labels, v in sorted(gauges[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(v)}")
+            else:
+                for (n, labels), (counts, total, count) in sorted(hists.items()):
+                    if n != name:
+                        continue
+                    for bound, c in zip(self._buckets[name], counts):
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {c}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+drain = REGISTRY.drain
+merge = REGISTRY.merge
+
+# ───────────────────────── Catalogue ───────────────────────────────
+REGISTRY.counter("fiches_documents_total", "Fiches traitées par process_bytes, par issue (processed, skipped, failed).")
+REGISTRY.counter("fiches_bytes_in_total", "Octets DOCX reçus par process_bytes.")
+REGISTRY.counter("fiches_bytes_out_total", "Octets DOCX produits par process_bytes.")
+REGISTRY.counter("fiches_errors_total", "Échecs de conversion, par type d'exception.")
+REGISTRY.counter("fiches_image_decodes_avoided_total", "Décodages d'image évités grâce aux caches d'empreintes.")
+REGISTRY.counter("fiches_cache_requests_total", "Consultations des caches du moteur, par cache et résultat (hit, miss).")
+REGISTRY.counter("fiches_media_bytes_saved_total", "Octets gagnés par l'optimisation des médias.")
+REGISTRY.counter("fiches_media_duplicates_removed_total", "Copies de médias identiques retirées des paquets.")
+REGISTRY.counter("fiches_jobs_total", "Lots de la file d'arrière-plan, par état final.")
+REGISTRY.counter("fiches_watch_files_total", "Fiches du dossier surveillé, par issue (processed, failed).")
+REGISTRY.counter("fiches_http_requests_total", "Requêtes du service HTTP, par route et statut.")
+REGISTRY.histogram("fiches_document_seconds", "Durée de process_bytes par fiche.", DOCUMENT_BUCKETS)
+REGISTRY.histogram("fiches_pass_seconds", "Durée de chaque passe sur une partie XML.", PASS_BUCKETS)
+
+# ───────────────────────── Exposition HTTP autonome ────────────────
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_SERVERS: Dict[Tuple[str, int], ThreadingHTTPServer] = {}
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Sert /metrics sur host:port dans un thread ; un seul serveur par adresse."""
+    server = _SERVERS.get((host, port))
+    if server is None:
+        server = _SERVERS[(host, port)] = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="fiches-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+Service HTTP local d'harmonisation (application ASGI, sans framework).
+
+    POST /convert   une fiche : corps DOCX brut, ou multipart avec un champ fichier
+    POST /batch     un lot : multipart (champs fichiers) ou corps ZIP
+    GET  /metrics   compteurs et histogrammes au format Prometheus (fiches_metrics)
+    GET  /health
+
+Les réglages de ProcessingConfig passent en paramètres d'URL
+(?footer_size=10&enable_legend_insertion=0), bornés (400 hors bornes) ;
+pass_workers et pass_executor restent réglés par le serveur. En multipart,
+un champ « legend » remplace la légende par défaut et les champs
+« megaphone » ajoutent des échantillons d'icônes.
+
+Le travail CPU tourne dans un pool de processus ; réception et envoi restent
+asynchrones. La réponse d'un lot est un ZIP écrit au fil de l'eau : chaque
+fiche y est ajoutée dès qu'elle est prête, la première arrive donc avant que
+la dernière soit traitée. Deux fiches de même nom de sortie sont distinguées
+par un suffixe « (2) ». Les échecs sont listés dans erreurs.txt, en fin
+d'archive ; un worker tué (mémoire…) ne fait échouer que les fiches en cours
+et le pool est recréé. Une requête pèse au plus 512 Mio, décompressés compris
+(DEFAULT_LIMITS) ; les entrées d'un ZIP sont lues une à une, à leur tour de
+conversion.
+
+Lancement : python fiches_service.py [--host H] [--port P] [--workers N]
+(nécessite uvicorn ; tout autre serveur ASGI convient aussi avec
+fiches_service:app).
+"""
+import io
+import os
+import asyncio
+import zipfile
+import argparse
+import email.policy
+from email.parser import BytesParser
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import fields, replace
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, quote
+
+import fiches_metrics as metrics
+from fiches_engine import (
+    DEFAULT_LIMITS,
+    IngestionError,
+    IngestionLimits,
+    MediaReport,
+    ProcessingConfig,
+    _ReadBudget,
+    _find_asset,
+    check_archive,
+    cleaned_filename,
+    process_bytes,
+    unique_names,
+)
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ERRORS_NAME = "erreurs.txt"
+MAX_BODY_BYTES = DEFAULT_LIMITS.max_total_bytes
+
+# ZIP d'un lot : chaque entrée est une fiche, bornée comme une archive DOCX ;
+# le total décompressé d'une requête a le budget d'une fiche
+_BATCH_LIMITS = IngestionLimits(
+    max_archive_bytes=MAX_BODY_BYTES,
+    max_entry_bytes=DEFAULT_LIMITS.max_archive_bytes,
+    max_total_bytes=DEFAULT_LIMITS.max_total_bytes,
+)
+
+# Fiche d'une requête : nom et lecture différée (les entrées ZIP sont
+# décompressées une à une, au moment de leur conversion)
+Document = Tuple[str, Callable[[], bytes]]
+
+class RequestError(ValueError):
+    """Requête invalide, renvoyée au client (400 par défaut) avec ce message."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+# ───────────────────────── Conversion (processus worker) ────────────
+def _convert(args: Tuple[str, bytes, ProcessingConfig, Optional[bytes], Optional[List[bytes]]]
+             ) -> Tuple[str, Optional[bytes], Optional[str], int, dict]:
+    name, data, cfg, legend_bytes, megaphone_samples = args
+    # Déjà dans un worker du pool : jamais de second pool de processus imbriqué
+    cfg = replace(cfg, pass_executor="thread")
+    report = MediaReport()
+    try:
+        out = process_bytes(data, legend_bytes=legend_bytes, megaphone_samples=megaphone_samples, config=cfg,
+                            media_report=report)
+        return cleaned_filename(name), out, None, report.bytes_saved, metrics.drain()
+    except Exception as e:
+        return name, None, f"{name} : {e}", 0, metrics.drain()
+
+@lru_cache(maxsize=1)
+def _default_legend_bytes() -> Optional[bytes]:
+    path = _find_asset(["Legende.png"])
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+# ───────────────────────── Lecture de la requête ───────────────────
+_CONFIG_FIELDS = {f.name: f for f in fields(ProcessingConfig)}
+_TRUE = {"1", "true", "yes", "oui", "on"}
+_FALSE = {"0", "false", "no", "non", "off"}
+
+_POSITION_CM = (-5.0, 40.0)
+_FONT_PT = (4.0, 96.0)
+# Bornes des réglages numériques : une valeur hors bornes est refusée (400)
+_BOUNDS: Dict[str, Tuple[float, float]] = {
+    "icon_left": _POSITION_CM, "icon_top": _POSITION_CM,
+    "legend_left": _POSITION_CM, "legend_top": _POSITION_CM,
+    "legend_w": (0.5, 30.0), "legend_h": (0.5, 30.0),
+    "cover_title_size": _FONT_PT, "cover_subject_size": _FONT_PT, "course_name_size": _FONT_PT,
+    "university_year_size": _FONT_PT, "plan_size": _FONT_PT, "table_header_size": _FONT_PT,
+    "table_body_size": _FONT_PT, "dark_block_size": _FONT_PT, "footer_size": _FONT_PT,
+    "style_promotion_min_runs": (2, 100_000),
+    "stream_cover_max_blocks": (1, 10_000),
+    "pass_workers": (0, 64),
+    "media_target_dpi": (72, 600),
+    "media_jpeg_quality": (30, 95),
+}
+_CHOICES: Dict[str, Tuple[str, ...]] = {"pass_executor": ("thread", "process")}
+# Réglages de l'hôte, jamais pris d'un client distant : le service a déjà son pool
+_HOST_FIELDS = frozenset({"pass_workers", "pass_executor"})
+
+def config_from_query(query: str, remote: bool = True) -> ProcessingConfig:
+    """
+    ProcessingConfig dont les champs cités dans la query string sont remplacés.
+    Chaque valeur est vérifiée (type, bornes) ; remote=False accepte en plus
+    les réglages de l'hôte (--config des outils en ligne de commande).
+    """
+    defaults = ProcessingConfig()
+    values = {}
+    for key, raw in parse_qsl(query, keep_blank_values=True):
+        if key not in _CONFIG_FIELDS or (remote and key in _HOST_FIELDS):
+            if key == "name":
+                continue
+            raise RequestError(f"réglage inconnu : {key}")
+        kind = type(getattr(defaults, key))
+        try:
+            if kind is bool:
+                low = raw.strip().lower()
+                if low not in _TRUE and low not in _FALSE:
+                    raise ValueError(raw)
+                values[key] = low in _TRUE
+            else:
+                values[key] = kind(raw)
+        except ValueError:
+            raise RequestError(f"valeur invalide pour {key} : {raw!r}") from None
+        if key in _BOUNDS:
+            lo, hi = _BOUNDS[key]
+            # NaN échoue aussi à la comparaison
+            if not lo <= values[key] <= hi:
+                raise RequestError(f"{key} doit être compris entre {lo:g} et {hi:g} : {raw!r}")
+        elif key in _CHOICES and values[key] not in _CHOICES[key]:
+            raise RequestError(f"{key} attend {' ou '.join(_CHOICES[key])} : {raw!r}")
+    return replace(defaults, **values)
+
+def _parse_multipart(content_type: bytes, body: bytes) -> List[Tuple[str, Optional[str], bytes]]:
+    """(nom du champ, nom de fichier, contenu) de chaque partie d'un corps multipart/form-data."""
+    msg = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type + b"\r\nMIME-Version: 1.0\r\n\r\n" + body
+    )
+    if not msg.is_multipart():
+        raise RequestError("corps multipart illisible")
+    out = []
+    for part in msg.iter_parts():
+        field_name = part.get_param("name", header="content-disposition")
+        out.append((field_name or "", part.get_filename(), part.get_payload(decode=True) or b""))
+    return out
+
+def _docx_from_zip(body: bytes, budget: _ReadBudget) -> List[Document]:
+    """Entrées .docx d'un ZIP, lues plus tard à travers le budget de la requête."""
+    try:
+        z = zipfile.ZipFile(io.BytesIO(body))
+        check_archive(z, _BATCH_LIMITS, len(body))
+    except zipfile.BadZipFile:
+        raise RequestError("archive ZIP illisible") from None
+    except IngestionError as e:
+        raise RequestError(f"lot refusé ({e})", 413) from None
+
+    def reader(info: zipfile.ZipInfo) -> Callable[[], bytes]:
+        def read() -> bytes:
+            # Lectures sérialisées par l'appelant : le budget passe d'un ZIP à l'autre
+            budget.zin = z
+            return budget.read(info.filename)
+        return read
+
+    return [
+        (os.path.basename(info.filename), reader(info))
+        for info in z.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(".docx")
+        and not info.filename.startswith("__MACOSX/")
+    ]
+
+def _load(name: str, load: Callable[[], bytes]) -> bytes:
+    try:
+        return load()
+    except zipfile.BadZipFile:
+        raise RequestError(f"{name} illisible dans l'archive") from None
+    except IngestionError as e:
+        raise RequestError(f"lot refusé ({e})", 413) from None
+
+def read_documents(content_type: bytes, body: bytes
+                   ) -> Tuple[List[Document], Optional[bytes], Optional[List[bytes]]]:
+    """Fiches, légende et échantillons mégaphone d'une requête de lot."""
+    mime = content_type.split(b";", 1)[0].strip().lower()
+    # Un seul budget de décompression pour toute la requête, tous ZIP confondus
+    budget = _ReadBudget(None, _BATCH_LIMITS)
+    if mime == b"multipart/form-data":
+        docs: List[Document] = []
+        legend: Optional[bytes] = None
+        samples: List[bytes] = []
+        for field_name, filename, data in _parse_multipart(content_type, body):
+            if field_name == "legend":
+                legend = data
+            elif field_name == "megaphone":
+                samples.append(data)
+            elif filename and filename.lower().endswith(".zip"):
+                docs.extend(_docx_from_zip(data, budget))
+            elif filename:
+                docs.append((os.path.basename(filename), lambda data=data: data))
+        return docs, legend, samples or None
+    if mime in (b"application/zip", b"application/x-zip-compressed"):
+        return _docx_from_zip(body, budget), None, None
+    raise RequestError("attendu : multipart/form-data ou application/zip")
+
+# ───────────────────────── ZIP en flux ─────────────────────────────
+class _ChunkSink(io.RawIOBase):
+    """Sortie non positionnable : zipfile y écrit en mode flux (descripteurs de données)."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+# ───────────────────────── Application ASGI ────────────────────────
+_ROUTES = ("/health", "/metrics", "/convert", "/batch")
+
+class FichesService:
+    """Application ASGI ; le pool de processus est créé à la première conversion."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Fiches rejouées après un worker tué : une à la fois, sur un pool à part
+        self._retry_pool: Optional[ProcessPoolExecutor] = None
+        self._retry_lock = asyncio.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        for pool in (self._pool, self._retry_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+        self._pool = self._retry_pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        status = [500]
+
+        async def send_counted(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self._route(method, path, scope, receive, send_counted)
+        finally:
+            route = path if path in _ROUTES else "other"
+            metrics.inc("fiches_http_requests_total", route=route, status=status[0])
+
+    async def _route(self, method: str, path: str, scope, receive, send):
+        try:
+            if path == "/health" and method == "GET":
+                await _send_bytes(send, 200, b"ok", b"text/plain; charset=utf-8")
+            elif path == "/metrics" and method == "GET":
+                await _send_bytes(send, 200, metrics.REGISTRY.render().encode("utf-8"),
+                                  metrics.CONTENT_TYPE.encode())
+            elif path == "/convert" and method == "POST":
+                await self._convert_one(scope, receive, send)
+            elif path == "/batch" and method == "POST":
+                await self._convert_batch(scope, receive, send)
+            elif path in _ROUTES:
+                await _send_bytes(send, 405, b"method not allowed", b"text/plain; charset=utf-8")
+            else:
+                await _send_bytes(send, 404, b"not found", b"text/plain; charset=utf-8")
+        except RequestError as e:
+            await _send_bytes(send, e.status, str(e).encode("utf-8"), b"text/plain; charset=utf-8")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run(self, job) -> Tuple[str, Optional[bytes], Optional[str], int]:
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            result = await loop.run_in_executor(pool, _convert, job)
+        except BrokenProcessPool as e:
+            # Worker tué (mémoire, signal) : le pool et toutes les fiches en cours
+            # sont perdus. Pool neuf pour la suite, et chaque fiche touchée est
+            # rejouée seule, à part : seule celle qui recasse est en erreur.
+            self._drop_pool(pool)
+            metrics.inc("fiches_errors_total", type=type(e).__name__)
+            async with self._retry_lock:
+                retry_pool = self._retry_pool or ProcessPoolExecutor(max_workers=1)
+                self._retry_pool = retry_pool
+                try:
+                    result = await loop.run_in_executor(retry_pool, _convert, job)
+                except BrokenProcessPool as e:
+                    self._retry_pool = None
+                    retry_pool.shutdown(wait=False, cancel_futures=True)
+                    metrics.inc("fiches_errors_total", type=type(e).__name__)
+                    return job[0], None, f"{job[0]} : la conversion a interrompu son processus (fichier trop lourd ?)", 0
+        name, out, error, saved_bytes, delta = result
+        metrics.merge(delta)
+        return name, out, error, saved_bytes
+
+    def _drop_pool(self, broken: ProcessPoolExecutor):
+        """Oublie le pool cassé, une seule fois quel que soit le nombre de fiches touchées."""
+        if self._pool is broken:
+            self._pool = None
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _job(self, name: str, data: bytes, cfg: ProcessingConfig,
+             legend: Optional[bytes], samples: Optional[List[bytes]]):
+        if not cfg.enable_legend_insertion:
+            legend = None
+        elif legend is None:
+            legend = _default_legend_bytes()
+        return name, data, cfg, legend, samples
+
+    async def _convert_one(self, scope, receive, send):
+        cfg = config_from_query(scope.get("query_string", b"").decode("latin-1"))
+        content_type = _header(scope, b"content-type")
+        body = await _read_body(receive)
+        legend, samples = None, None
+        name = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1"))).get("name", "fiche.docx")
+        if content_type.split(b";", 1)[0].strip().lower() == b"multipart/form-data":
+            docs, legend, samples = read_documents(content_type, body)
+            if len(docs) != 1:
+                raise RequestError("/convert attend exactement une fiche (utiliser /batch pour un lot)")
+            name, load = docs[0]
+            body = await asyncio.get_running_loop().run_in_executor(None, _load, name, load)
+        out_name, out, error, saved_bytes = await self._run(self._job(name, body, cfg, legend, samples))
+        if error is not None:
+            await _send_bytes(send, 422, error.encode("utf-8"), b"text/plain; charset=utf-8")
+            return
+        await _send_bytes(send, 200, out, DOCX_MIME.encode(), _attachment(out_name),
+                          (b"x-fiches-media-bytes-saved", str(saved_bytes).encode()))
+
+    async def _convert_batch(self, scope, receive, send):
+        cfg = config_from_query(scope.get("query_string", b"").decode("latin-1"))
+        docs, legend, samples = read_documents(_header(scope, b"content-type"), await _read_body(receive))
+        if not docs:
+            raise RequestError("aucune fiche .docx dans la requête")
+
+        loop = asyncio.get_running_loop()
+        # Noms fixés dans l'ordre de la requête : deux fiches ne s'écrasent jamais dans le ZIP
+        out_names = unique_names(cleaned_filename(n) for n, _ in docs)
+        # Fiches en mémoire bornées : une entrée n'est décompressée qu'à son tour
+        window = 2 * (self.workers or os.cpu_count() or 1)
+        read_lock = asyncio.Lock()
+
+        async def numbered(i: int, name: str, load: Callable[[], bytes]):
+            async with read_lock:
+                try:
+                    data = await loop.run_in_executor(None, _load, name, load)
+                except RequestError as e:
+                    return i, (name, None, f"{name} : {e}", 0)
+            return i, await self._run(self._job(name, data, cfg, legend, samples))
+
+        queued = iter(enumerate(docs))
+        pending = set()
+
+        def refill():
+            for i, (name, load) in queued:
+                pending.add(asyncio.ensure_future(numbered(i, name, load)))
+                if len(pending) >= window:
+                    break
+
+        refill()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/zip"), _attachment("fiches_modifiees.zip")],
+        })
+        sink = _ChunkSink()
+        errors: List[str] = []
+        try:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as z:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    refill()
+                    for fut in done:
+                        i, (_, out, error, _) = fut.result()
+                        if error is not None:
+                            errors.append(error)
+                            continue
+                        # Compression hors de la boucle d'événements
+                        await loop.run_in_executor(None, z.writestr, out_names[i], out)
+                        await send({"type": "http.response.body", "body": sink.drain(), "more_body": True})
+                if errors:
+                    z.writestr(ERRORS_NAME, "\n".join(errors) + "\n")
+        finally:
+            for fut in pending:
+                fut.cancel()
+        await send({"type": "http.response.body", "body": sink.drain(), "more_body": False})
+
+# ───────────────────────── HTTP bas niveau ─────────────────────────
+def _header(scope, name: bytes) -> bytes:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value
+    return b""
+
+def _attachment(filename: str) -> Tuple[bytes, bytes]:
+    ascii_name = filename.encode("ascii", "replace").decode("ascii").replace('"', "")
+    return (b"content-disposition",
+            f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}".encode("ascii"))
+
+async def _read_body(receive, limit: int = MAX_BODY_BYTES) -> bytes:
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise RequestError("client déconnecté")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise RequestError(f"requête trop volumineuse (maximum {limit} octets)", 413)
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+async def _send_bytes(send, status: int, body: bytes, content_type: bytes, *headers: Tuple[bytes, bytes]):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+app = FichesService()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Service HTTP d'harmonisation des fiches")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="processus de conversion (défaut : un par cœur)")
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn est requis pour lancer le service : pip install uvicorn")
+    app.workers = args.workers
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
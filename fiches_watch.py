@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+"""
+Dossier surveillé : harmonise automatiquement les fiches déposées.
+
+Chaque .docx nouveau ou modifié sous le dossier source est converti par un
+pool de processus, et le résultat est écrit sous cleaned_filename dans une
+arborescence miroir (source/UE1/a.docx → miroir/UE1/a.docx nettoyé). Un
+fichier n'est pris qu'une fois stable (taille et date inchangées pendant
+settle_s secondes), pour ne pas lire une copie en cours.
+
+Sous Linux, les changements sont signalés par inotify (via ctypes). Ailleurs,
+quand les watches manquent, ou avec --poll pour un partage réseau qu'inotify
+ne voit pas, le dossier est reparcouru toutes les poll_s secondes. Un
+reparcours complet a aussi lieu toutes les rescan_s secondes, par sécurité.
+
+L'état (signature et empreinte SHA-1 de chaque source déjà traitée, ou son
+erreur) est tenu dans un fichier JSON. Après un redémarrage, seuls les
+fichiers modifiés entre-temps sont reconvertis ; changer les réglages ou la
+légende fait tout reconvertir. Une source supprimée est oubliée, sa sortie
+est conservée.
+
+Un worker tué (mémoire…) casse le pool : il est recréé une fois, et chaque
+fiche perdue est rejouée seule ; celle qui le tue à nouveau est notée en échec.
+
+Avec --index FICHIER, chaque fiche convertie est (ré)indexée dans l'index
+plein texte (fiches_index) sous son chemin de sortie.
+
+Lancement : python fiches_watch.py SOURCE MIROIR [--workers N] [--poll]
+[--config "footer_size=10&enable_legend_insertion=0"] [--index FICHIER]
+[--metrics-port P]
+"""
+import os
+import sys
+import json
+import time
+import select
+import signal
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+import zipfile
+import ctypes
+import ctypes.util
+from dataclasses import replace
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
+
+import fiches_metrics as metrics
+from fiches_index import FicheIndex
+from fiches_engine import (
+    FicheText,
+    ProcessingConfig,
+    _find_asset,
+    cleaned_filename,
+    config_fingerprint,
+    process_bytes,
+    unique_names,
+)
+
+log = logging.getLogger("fiches_watch")
+
+STATE_NAME = ".fiches_watch.json"
+STATE_VERSION = 1
+DEFAULT_SETTLE_S = 2.0
+DEFAULT_POLL_S = 5.0
+DEFAULT_RESCAN_S = 600.0
+# Attente maximale d'un tour à vide : délai de réaction à stop()
+_IDLE_WAIT_S = 1.0
+# Écriture de l'état au plus toutes les 2 s pendant un gros lot
+_STATE_SAVE_EVERY_S = 2.0
+
+Signature = Tuple[int, int]  # (taille, mtime_ns)
+
+def _is_candidate(name: str) -> bool:
+    # ~$x.docx : fichier verrou de Word ; .x.docx : fichier caché ou temporaire
+    return name.lower().endswith(".docx") and not name.startswith(("~$", "."))
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+# ───────────────────────── Conversion (processus worker) ────────────
+def _convert(args: Tuple[bytes, ProcessingConfig, Optional[bytes], bool]
+             ) -> Tuple[Optional[bytes], Optional[str], Optional[FicheText], dict]:
+    data, cfg, legend_bytes, want_text = args
+    # Déjà dans un worker du pool : jamais de second pool de processus imbriqué
+    cfg = replace(cfg, pass_executor="thread")
+    text = FicheText() if want_text else None
+    try:
+        out = process_bytes(data, legend_bytes=legend_bytes, config=cfg, text_sink=text)
+        return out, None, text, metrics.drain()
+    except Exception as e:
+        return None, str(e) or type(e).__name__, None, metrics.drain()
+
+def _default_legend_bytes() -> Optional[bytes]:
+    path = _find_asset(["Legende.png"])
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+# ───────────────────────── Sources de changements ───────────────────
+class _Poller:
+    """Repli sans inotify : chaque attente se termine par un reparcours complet."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = time.monotonic() + interval
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """Chemins modifiés, ou None pour « tout reparcourir »."""
+        delay = self._next - time.monotonic()
+        if timeout is not None and timeout < delay:
+            time.sleep(max(0.0, timeout))
+            return set()
+        time.sleep(max(0.0, delay))
+        self._next = time.monotonic() + self.interval
+        return None
+
+    def close(self):
+        pass
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF)
+_EVENT = struct.Struct("iIII")
+
+class _Inotify:
+    """Watches inotify récursifs ; lève OSError si le noyau les refuse."""
+
+    def __init__(self, root: str, skip: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.skip = skip
+        self.dirs: Dict[int, str] = {}
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, top: str):
+        for dirpath, dirnames, _ in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")
+                           and os.path.join(dirpath, d) != self.skip]
+            wd = self._add(self.fd, os.fsencode(dirpath), _WATCH_MASK)
+            if wd < 0:
+                # ENOSPC : plus de watches disponibles (fs.inotify.max_user_watches)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch {dirpath}")
+            self.dirs[wd] = dirpath
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[str] = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                if mask & _IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                base = self.dirs.get(wd)
+                if base is None or not name:
+                    continue
+                path = os.path.join(base, name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO) and not name.startswith(".") and path != self.skip:
+                        # Dossier arrivé d'un bloc : ses fichiers n'émettront pas d'événement
+                        try:
+                            self._watch_tree(path)
+                        except OSError:
+                            return None
+                        changed.add(path)
+                elif _is_candidate(name):
+                    changed.add(path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# ───────────────────────── Surveillance ─────────────────────────────
+class FolderWatcher:
+    """
+    Convertit les .docx de source vers l'arborescence miroir dest.
+    run() tourne jusqu'à stop() ; step() fait un seul tour (tests, scripts).
+    """
+
+    def __init__(
+        self,
+        source: str,
+        dest: str,
+        config: Optional[ProcessingConfig] = None,
+        legend_bytes: Optional[bytes] = None,
+        workers: Optional[int] = None,
+        settle_s: float = DEFAULT_SETTLE_S,
+        poll_s: float = DEFAULT_POLL_S,
+        rescan_s: float = DEFAULT_RESCAN_S,
+        state_path: Optional[str] = None,
+        use_inotify: bool = True,
+        index: Optional[FicheIndex] = None,
+    ):
+        self.source = os.path.abspath(source)
+        self.dest = os.path.abspath(dest)
+        self.config = config or ProcessingConfig()
+        self.legend_bytes = legend_bytes
+        self.index = index
+        self.settle_s = settle_s
+        self.rescan_s = rescan_s
+        self.state_path = state_path or os.path.join(self.dest, STATE_NAME)
+        self.fingerprint = config_fingerprint(self.config, legend_bytes)
+        os.makedirs(self.dest, exist_ok=True)
+        self.files: Dict[str, dict] = self._load_state()
+        # chemin relatif → (signature observée, instant de son dernier changement)
+        self.pending: Dict[str, Tuple[Signature, float]] = {}
+        self.inflight: Dict[Future, Tuple[str, Signature, str, ProcessPoolExecutor]] = {}
+        # Workers tués par fiche : seconde tentative, puis échec (comme fiches_batch)
+        self._crashes: Dict[str, int] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._rescan_at = 0.0
+        self._stop = threading.Event()
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.events = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self.events = _Inotify(self.source, skip=self.dest)
+            except (OSError, AttributeError) as e:
+                log.warning("inotify indisponible (%s) : surveillance par scrutation", e)
+        if self.events is None:
+            self.events = _Poller(poll_s)
+
+    # ── État persistant ──
+    def _load_state(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning("état illisible (%s) : tout sera reconverti", e)
+            return {}
+        if state.get("version") != STATE_VERSION or state.get("config") != self.fingerprint:
+            log.info("réglages modifiés depuis le dernier passage : tout sera reconverti")
+            return {}
+        return state.get("files", {})
+
+    def _save_state(self, force: bool = False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < _STATE_SAVE_EVERY_S):
+            return
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "config": self.fingerprint, "files": self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+        self._dirty, self._saved_at = False, time.monotonic()
+
+    # ── Détection ──
+    def _rel(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        if path == self.dest or path.startswith(self.dest + os.sep):
+            return None
+        rel = os.path.relpath(path, self.source)
+        return None if rel.startswith(os.pardir) else rel
+
+    def _scan(self, top: Optional[str] = None) -> List[str]:
+        found = []
+        for dirpath, dirnames, filenames in os.walk(top or self.source):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")
+                           and os.path.join(dirpath, d) != self.dest]
+            found.extend(os.path.join(dirpath, n) for n in filenames if _is_candidate(n))
+        return found
+
+    def _full_scan(self, now: float):
+        found = self._scan()
+        self._observe(found, now)
+        # Sources disparues sans événement (dossier supprimé d'un bloc, scrutation)
+        present = {self._rel(p) for p in found}
+        for rel in [r for r in self.files if r not in present]:
+            del self.files[rel]
+            self._dirty = True
+
+    def _observe(self, paths: List[str], now: float):
+        for path in paths:
+            rel = self._rel(path)
+            if rel is None:
+                continue
+            sig = _signature(path)
+            if sig is None:
+                # Supprimé : oublié (sa sortie reste dans le miroir)
+                self.pending.pop(rel, None)
+                if self.files.pop(rel, None) is not None:
+                    self._dirty = True
+                continue
+            known = self.files.get(rel)
+            if known is not None and tuple(known["sig"]) == sig:
+                self.pending.pop(rel, None)
+                continue
+            prev = self.pending.get(rel)
+            if prev is None or prev[0] != sig:
+                self.pending[rel] = (sig, now)
+
+    # ── Conversion ──
+    def _output_rel(self, rel: str) -> str:
+        """
+        Sortie de rel dans le miroir : celle déjà attribuée, sinon son nom
+        nettoyé, suffixé « (2) »… s'il est pris par une autre source du même
+        dossier (« X.docx » et « X actu.docx » donnent tous deux « X.docx »).
+        """
+        known = self.files.get(rel, {}).get("output")
+        if known:
+            return known
+        d, name = os.path.split(rel)
+        taken = [os.path.basename(e["output"]) for r, e in self.files.items()
+                 if r != rel and e.get("output") and os.path.dirname(e["output"]) == d]
+        return os.path.join(d, unique_names([cleaned_filename(name)], taken)[0])
+
+    def _submit_ready(self, now: float):
+        busy = {rel for rel, _, _, _ in self.inflight.values()}
+        ready = list(self.pending)
+        suspects = [rel for rel in ready if rel in self._crashes]
+        if suspects or busy & self._crashes.keys():
+            # Une fiche qui a tué son worker est rejouée seule, pool vidé :
+            # si elle recasse, elle n'emporte qu'elle-même
+            if self.inflight:
+                return
+            ready = suspects[:1]
+        for rel in ready:
+            sig, since = self.pending[rel]
+            if rel in busy or now - since < self.settle_s:
+                continue
+            path = os.path.join(self.source, rel)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if _signature(path) != sig:
+                # Modifié pendant la lecture : on attend un nouvel état stable
+                self.pending[rel] = (_signature(path) or sig, now)
+                continue
+            del self.pending[rel]
+            digest = hashlib.sha1(data).hexdigest()
+            known = self.files.get(rel)
+            if known is not None and known.get("sha1") == digest:
+                # Simple changement de date (copie, synchronisation) : rien à refaire
+                known["sig"] = list(sig)
+                self._dirty = True
+                continue
+            if not zipfile.is_zipfile(path):
+                self._record(rel, sig, digest, error="pas une archive DOCX")
+                continue
+            fut = self.pool.submit(_convert, (data, self.config, self.legend_bytes, self.index is not None))
+            self.inflight[fut] = (rel, sig, digest, self.pool)
+
+    def _record(self, rel: str, sig: Signature, digest: str,
+                output: Optional[str] = None, error: Optional[str] = None):
+        entry = {"sig": list(sig), "sha1": digest}
+        if output is not None:
+            entry["output"] = output
+        if error is not None:
+            entry["error"] = error
+            log.error("%s : %s", rel, error)
+        self.files[rel] = entry
+        self._crashes.pop(rel, None)
+        self._dirty = True
+        metrics.inc("fiches_watch_files_total", outcome="failed" if error else "processed")
+
+    def _collect(self):
+        for fut in [f for f in self.inflight if f.done()]:
+            rel, sig, digest, pool = self.inflight.pop(fut)
+            try:
+                out, error, text, delta = fut.result()
+            except BrokenProcessPool as e:
+                # Worker tué (mémoire, signal) : toutes les fiches en cours sont
+                # perdues ; chacune est retentée une fois, celle qui recasse est en échec
+                self._replace_pool(pool)
+                self._crashes[rel] = self._crashes.get(rel, 0) + 1
+                if self._crashes[rel] < 2:
+                    self.pending.setdefault(rel, (sig, time.monotonic()))
+                else:
+                    self._record(rel, sig, digest, error=f"worker interrompu : {e}")
+                continue
+            metrics.merge(delta)
+            if error is not None:
+                self._record(rel, sig, digest, error=error)
+                continue
+            out_rel = self._output_rel(rel)
+            target = os.path.join(self.dest, out_rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = target + ".part"
+            with open(tmp, "wb") as f:
+                f.write(out)
+            os.replace(tmp, target)
+            # Texte vide : fiche déjà tamponnée, rendue telle quelle ; son entrée reste
+            if self.index is not None and text is not None and text.body:
+                self.index.add(out_rel, text)
+            self._record(rel, sig, digest, output=out_rel)
+            log.info("%s → %s", rel, out_rel)
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Un pool neuf par casse, quel que soit le nombre de fiches touchées."""
+        if self.pool is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        if not self._stop.is_set():
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    # ── Boucle ──
+    def step(self, timeout: Optional[float] = 0.0):
+        """Un tour : attend des changements (au plus timeout s), lance et récolte les conversions."""
+        now = time.monotonic()
+        if now >= self._rescan_at:
+            self._full_scan(now)
+            self._rescan_at = now + self.rescan_s
+        else:
+            changed = self.events.wait(timeout)
+            now = time.monotonic()
+            if changed is None:
+                self._full_scan(now)
+            else:
+                paths: List[str] = []
+                for path in changed:
+                    paths.extend(self._scan(path) if os.path.isdir(path) else [path])
+                self._observe(paths, now)
+        self._collect()
+        self._submit_ready(now)
+        self._save_state(force=not self.inflight)
+
+    def run(self):
+        log.info("surveillance de %s → %s (%s)", self.source, self.dest, type(self.events).__name__.strip("_"))
+        try:
+            while not self._stop.is_set():
+                # Réveils fréquents tant qu'il y a du travail en cours, sinon attente longue
+                busy = self.pending or self.inflight
+                self.step(timeout=0.25 if busy else min(_IDLE_WAIT_S, max(0.0, self._rescan_at - time.monotonic())))
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self._stop.set()
+        self.pool.shutdown(wait=True)
+        self._collect()
+        self._save_state(force=True)
+        self.events.close()
+
+def main(argv: Optional[List[str]] = None):
+    # Import tardif : le service n'est utile ici que pour lire --config
+    from fiches_service import config_from_query
+
+    parser = argparse.ArgumentParser(description="Harmonise automatiquement les fiches déposées dans un dossier")
+    parser.add_argument("source", help="dossier surveillé")
+    parser.add_argument("dest", help="arborescence miroir des fiches harmonisées")
+    parser.add_argument("--config", default="", help="réglages au format query string (footer_size=10&…)")
+    parser.add_argument("--legend", default=None, help="image de légende (défaut : assets/Legende.png)")
+    parser.add_argument("--workers", type=int, default=None, help="processus de conversion (défaut : un par cœur)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_S, help="secondes de stabilité avant conversion")
+    parser.add_argument("--poll", action="store_true", help="scrutation au lieu d'inotify (partages réseau)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_S)
+    parser.add_argument("--rescan", type=float, default=DEFAULT_RESCAN_S, help="secondes entre deux reparcours complets")
+    parser.add_argument("--state", default=None, help=f"fichier d'état (défaut : MIROIR/{STATE_NAME})")
+    parser.add_argument("--index", default=None, help="index plein texte à alimenter (fiches_index)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="expose /metrics sur ce port")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        cfg = config_from_query(args.config, remote=False)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.legend:
+        with open(args.legend, "rb") as f:
+            legend_bytes = f.read()
+    else:
+        legend_bytes = _default_legend_bytes()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    try:
+        index = FicheIndex(args.index) if args.index else None
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+    watcher = FolderWatcher(
+        args.source, args.dest, config=cfg, legend_bytes=legend_bytes, workers=args.workers,
+        settle_s=args.settle, poll_s=args.poll_interval, rescan_s=args.rescan,
+        state_path=args.state, use_inotify=not args.poll, index=index,
+    )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: watcher.stop())
+    watcher.run()
+
+if __name__ == "__main__":
+    main()
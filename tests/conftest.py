@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Corpus de fiches synthétiques pour les tests.
+
+Chaque fiche est un DOCX minimal mais complet (types de contenu, relations,
+styles, numérotation, thème, en-tête, pied) construit en mémoire : les tests
+ne dépendent d'aucun fichier réel. Les variantes couvrent ce que les passes
+touchent — numérotation et puces colorées, tableaux imbriqués à en-tête
+sombre, SVG Annonce / Cible, mégaphones, zones de texte mc:AlternateContent,
+espaces de noms propres au document.
+"""
+import io
+import os
+import sys
+import zipfile
+from typing import Dict, Optional, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+ASSETS = os.path.join(ROOT, "assets")
+
+def asset(name: str) -> bytes:
+    with open(os.path.join(ASSETS, name), "rb") as f:
+        return f.read()
+
+_ROOT_NS = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture" '
+    'xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" '
+    'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" '
+    'xmlns:w14="http://schemas.microsoft.com/office/word/2010/wordml" '
+    'xmlns:wp14="http://schemas.microsoft.com/office/word/2010/wordprocessingDrawing"'
+)
+# Espace de noms inconnu d'ElementTree : sérialisé en ns0, ns1…
+_CUSTOM_NS = 'xmlns:fx="urn:fiches:test-extension"'
+
+def _para(text: str, ppr: str = "", rpr: str = "") -> str:
+    return (f"<w:p>{f'<w:pPr>{ppr}</w:pPr>' if ppr else ''}"
+            f"<w:r>{f'<w:rPr>{rpr}</w:rPr>' if rpr else ''}"
+            f'<w:t xml:space="preserve">{text}</w:t></w:r></w:p>')
+
+def _image(rid: str, pid: int, name: str) -> str:
+    return (
+        "<w:p><w:r><w:drawing><wp:inline>"
+        '<wp:extent cx="540000" cy="540000"/>'
+        f'<wp:docPr id="{pid}" name="{name}"/>'
+        '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{pid}" name="{name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="540000" cy="540000"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+        "</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>"
+    )
+
+def _vml_image(rid: str) -> str:
+    return (f'<w:p><w:r><w:pict><v:shape style="width:20pt;height:20pt">'
+            f'<v:imagedata r:id="{rid}"/></v:shape></w:pict></w:r></w:p>')
+
+def _textbox(text: str, fill: str, pid: int) -> str:
+    """Zone de texte ancrée, avec son repli VML (mc:AlternateContent)."""
+    title = _para(text, rpr='<w:sz w:val="40"/>')
+    return (
+        '<w:p><w:r><mc:AlternateContent><mc:Choice Requires="wps"><w:drawing>'
+        '<wp:anchor distT="0" distB="0" distL="0" distR="0" simplePos="0" relativeHeight="2" '
+        'behindDoc="1" locked="0" layoutInCell="1" allowOverlap="1">'
+        '<wp:simplePos x="0" y="0"/>'
+        '<wp:positionH relativeFrom="page"><wp:posOffset>360000</wp:posOffset></wp:positionH>'
+        '<wp:positionV relativeFrom="page"><wp:posOffset>720000</wp:posOffset></wp:positionV>'
+        '<wp:extent cx="6840000" cy="1800000"/><wp:wrapNone/>'
+        f'<wp:docPr id="{pid}" name="Zone {pid}"/>'
+        '<a:graphic><a:graphicData uri="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">'
+        '<wps:wsp><wps:cNvSpPr/><wps:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="6840000" cy="1800000"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:solidFill><a:srgbClr val="{fill}"/></a:solidFill></wps:spPr>'
+        f'<wps:txbx><w:txbxContent>{title}</w:txbxContent></wps:txbx>'
+        '<wps:bodyPr/></wps:wsp></a:graphicData></a:graphic></wp:anchor></w:drawing></mc:Choice>'
+        f'<mc:Fallback><w:pict><v:rect style="width:540pt;height:140pt" fillcolor="#{fill}">'
+        f'<v:textbox><w:txbxContent>{_para(text)}</w:txbxContent></v:textbox></v:rect></w:pict></mc:Fallback>'
+        "</mc:AlternateContent></w:r></w:p>"
+    )
+
+def _cell(content: str, fill: Optional[str] = None) -> str:
+    shd = f'<w:tcPr><w:shd w:val="clear" w:color="auto" w:fill="{fill}"/></w:tcPr>' if fill else ""
+    return f"<w:tc>{shd}{content}</w:tc>"
+
+def _table(rows) -> str:
+    return "<w:tbl><w:tblPr><w:tblW w:w=\"0\" w:type=\"auto\"/></w:tblPr>" + "".join(
+        f"<w:tr>{''.join(row)}</w:tr>" for row in rows) + "</w:tbl>"
+
+_STYLES = (
+    f'<w:styles {_ROOT_NS}>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Listepuces"><w:name w:val="List Bullet"/>'
+    '<w:rPr><w:color w:val="FF0000"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Citation"><w:name w:val="Quote"/>'
+    '<w:rPr><w:color w:val="2F5496"/></w:rPr></w:style>'
+    "</w:styles>"
+)
+
+_NUMBERING = (
+    f'<w:numbering {_ROOT_NS}>'
+    '<w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0"><w:numFmt w:val="bullet"/>'
+    '<w:lvlText w:val="&#8226;"/><w:rPr><w:color w:val="C00000"/></w:rPr></w:lvl>'
+    '<w:lvl w:ilvl="1"><w:numFmt w:val="decimal"/><w:lvlText w:val="%2."/>'
+    '<w:rPr><w:color w:themeColor="accent1"/></w:rPr></w:lvl></w:abstractNum>'
+    '<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>'
+    "</w:numbering>"
+)
+
+_THEME = (
+    '<a:theme xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" name="Test">'
+    '<a:themeElements><a:clrScheme name="Test">'
+    '<a:dk1><a:sysClr val="windowText" lastClr="000000"/></a:dk1>'
+    '<a:lt1><a:sysClr val="window" lastClr="FFFFFF"/></a:lt1>'
+    '<a:dk2><a:srgbClr val="44546A"/></a:dk2><a:lt2><a:srgbClr val="E7E6E6"/></a:lt2>'
+    '<a:accent1><a:srgbClr val="4472C4"/></a:accent1><a:accent2><a:srgbClr val="ED7D31"/></a:accent2>'
+    '<a:accent3><a:srgbClr val="A5A5A5"/></a:accent3><a:accent4><a:srgbClr val="FFC000"/></a:accent4>'
+    '<a:accent5><a:srgbClr val="5B9BD5"/></a:accent5><a:accent6><a:srgbClr val="70AD47"/></a:accent6>'
+    '<a:hlink><a:srgbClr val="0563C1"/></a:hlink><a:folHlink><a:srgbClr val="954F72"/></a:folHlink>'
+    "</a:clrScheme></a:themeElements></a:theme>"
+)
+
+_REL_BASE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+
+def build_docx(body: str, media: Optional[Dict[str, Tuple[str, bytes]]] = None, custom_ns: bool = False,
+               header: str = "", footer: str = "") -> bytes:
+    """
+    Fiche minimale autour de body (contenu de w:body, sans sectPr). media :
+    {rId: (nom sous word/media/, octets)} référencés par les dessins du corps.
+    """
+    media = media or {}
+    root_ns = _ROOT_NS + (" " + _CUSTOM_NS if custom_ns else "")
+    sect = ('<w:sectPr><w:headerReference w:type="default" r:id="rIdH"/>'
+            '<w:footerReference w:type="default" r:id="rIdF"/>'
+            '<w:pgSz w:w="11906" w:h="16838"/></w:sectPr>')
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<w:document {root_ns} mc:Ignorable="w14 wp14"><w:body>{body}{sect}</w:body></w:document>')
+    rels = [
+        ("rIdS", "styles", "styles.xml"),
+        ("rIdN", "numbering", "numbering.xml"),
+        ("rIdT", "theme", "theme/theme1.xml"),
+        ("rIdH", "header", "header1.xml"),
+        ("rIdF", "footer", "footer1.xml"),
+    ] + [(rid, "image", f"media/{name}") for rid, (name, _) in media.items()]
+    doc_rels = ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + "".join(f'<Relationship Id="{rid}" Type="{_REL_BASE}{kind}" Target="{target}"/>'
+                          for rid, kind, target in rels)
+                + "</Relationships>")
+    main = "application/vnd.openxmlformats-officedocument.wordprocessingml"
+    content_types = (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Default Extension="png" ContentType="image/png"/>'
+        '<Default Extension="svg" ContentType="image/svg+xml"/>'
+        f'<Override PartName="/word/document.xml" ContentType="{main}.document.main+xml"/>'
+        f'<Override PartName="/word/styles.xml" ContentType="{main}.styles+xml"/>'
+        f'<Override PartName="/word/numbering.xml" ContentType="{main}.numbering+xml"/>'
+        f'<Override PartName="/word/header1.xml" ContentType="{main}.header+xml"/>'
+        f'<Override PartName="/word/footer1.xml" ContentType="{main}.footer+xml"/>'
+        '<Override PartName="/word/theme/theme1.xml" ContentType="application/vnd.openxmlformats-officedocument.theme+xml"/>'
+        "</Types>"
+    )
+    package_rels = ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    f'<Relationship Id="rId1" Type="{_REL_BASE}officeDocument" Target="word/document.xml"/>'
+                    "</Relationships>")
+    header = header or _para("Tutorat 2023 - 2024")
+    footer = footer or _para("Page", rpr='<w:sz w:val="16"/>')
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", content_types)
+        z.writestr("_rels/.rels", package_rels)
+        z.writestr("word/document.xml", document)
+        z.writestr("word/_rels/document.xml.rels", doc_rels)
+        z.writestr("word/styles.xml", _STYLES)
+        z.writestr("word/numbering.xml", _NUMBERING)
+        z.writestr("word/theme/theme1.xml", _THEME)
+        z.writestr("word/header1.xml", f"<w:hdr {_ROOT_NS}>{header}</w:hdr>")
+        z.writestr("word/footer1.xml", f"<w:ftr {_ROOT_NS}>{footer}</w:ftr>")
+        for name, data in media.values():
+            z.writestr(f"word/media/{name}", data)
+    return buf.getvalue()
+
+def _cover() -> str:
+    return (
+        _textbox("FICHE DE COURS", "1F3864", 100)
+        + _para("Anatomie générale", rpr='<w:b/><w:sz w:val="56"/>')
+        + _para("Année universitaire 2023 – 2024", rpr='<w:color w:val="FF0000"/>')
+        + _para("Actualisation : aucun changement notable")
+        + '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+    )
+
+def corpus() -> Dict[str, bytes]:
+    """Fiches représentatives, par nom."""
+    numbered = (
+        _para("Puce rouge", ppr='<w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr>'
+                                 '<w:rPr><w:color w:val="FF0000"/></w:rPr>')
+        + _para("Puce de thème", ppr='<w:pStyle w:val="Listepuces"/><w:numPr><w:ilvl w:val="1"/>'
+                                     '<w:numId w:val="1"/></w:numPr>')
+        # Couleur de paragraphe sans numérotation : laissée telle quelle
+        + _para("Paragraphe coloré", ppr='<w:rPr><w:color w:val="0000FF"/></w:rPr>')
+        + _para("Lien", rpr='<w:color w:themeColor="hyperlink"/><w:u w:val="single"/>')
+    )
+    inner = _table([
+        [_cell(_para("Sous-en-tête"), "1F3864"), _cell(_para("Valeur"))],
+        [_cell(_para("Ligne interne")), _cell(_para("2024 - 2025"))],
+    ])
+    tables = _table([
+        [_cell(_para("I. Introduction"), "1F3864"), _cell(_para("Notions", rpr="<w:b/>"), "1F3864")],
+        [_cell(_para("Texte courant")), _cell(_para("Imbriqué") + inner + _para(""))],
+        [_cell(_para("II. Suite"), "262626"), _cell(_para("Fin", rpr='<w:color w:val="1F4E79"/>'))],
+    ])
+    media = {
+        "rId20": ("image1.svg", asset("Annonce.svg")),
+        "rId21": ("image2.svg", asset("Cible.svg")),
+        "rId22": ("image3.png", asset("Annonce1.png")),
+        "rId23": ("image4.png", asset("Annonce2.png")),
+    }
+    pictures = (
+        _image("rId20", 20, "Annonce") + _image("rId21", 21, "Cible")
+        + _image("rId22", 22, "Mégaphone") + _vml_image("rId23")
+        + _textbox("Encadré gris", "808080", 24)
+    )
+    # Texte délicat pour la sérialisation lxml : tabulation, retour chariot,
+    # guillemets suivis de =, texte vide, attribut d'un espace de noms inconnu
+    tricky = (
+        '<w:p><w:r><w:t xml:space="preserve">a\tb</w:t><w:tab/><w:t>c&#13;d</w:t></w:r>'
+        '<w:r><w:t>x:y="z" &amp; &lt;w:t&gt;</w:t></w:r><w:r><w:t></w:t></w:r></w:p>'
+        '<w:p fx:mark="1" w14:paraId="1A2B3C4D"><w:r><w:t>Extension</w:t></w:r>'
+        '<fx:note fx:kind="info&#9;tab&#10;ligne">note 2023-2024</fx:note></w:p>'
+    )
+    return {
+        "numbering": build_docx(_cover() + numbered),
+        "tables": build_docx(_cover() + tables),
+        "svg_megaphones": build_docx(_cover() + pictures, media),
+        "custom_namespaces": build_docx(_cover() + tricky + numbered, custom_ns=True),
+        "complete": build_docx(_cover() + numbered + tables + pictures + tricky, media, custom_ns=True),
+    }
+
+@pytest.fixture(scope="session")
+def fiches() -> Dict[str, bytes]:
+    return corpus()
+
+@pytest.fixture(scope="session")
+def megaphone_samples():
+    return [asset("Annonce1.png"), asset("Annonce2.png")]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Intermédiaires structurels : un passage par le cache (ou par un worker) ne change aucun octet."""
+import io
+import zipfile
+
+import pytest
+
+from fiches_engine import IntermediateCache, ProcessingConfig, process_bytes
+from conftest import _para, build_docx
+
+FICHES = ["numbering", "tables", "svg_megaphones", "custom_namespaces", "complete"]
+
+def _parts(data: bytes):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+@pytest.mark.parametrize("fiche", FICHES)
+def test_cache_hit_matches_uncached_output(fiches, fiche):
+    direct = process_bytes(fiches[fiche])
+    cache = IntermediateCache()
+    # Premier passage avec une autre taille : seule la mise en page diffère
+    process_bytes(fiches[fiche], config=ProcessingConfig(footer_size=12), cache=cache)
+    cached = process_bytes(fiches[fiche], cache=cache)
+    assert cache.hits == 1
+    assert _parts(cached) == _parts(direct)
+
+def test_parts_from_pass_workers_keep_carriage_returns():
+    # En-tête et pied partent dans le pool de processus (le corps reste sur place)
+    cr = '<w:p><w:r><w:t xml:space="preserve">c&#13;d</w:t></w:r></w:p>'
+    data = build_docx(_para("Corps"), header=cr, footer=cr + _para("Page"))
+    direct = process_bytes(data)
+    pooled = process_bytes(data, config=ProcessingConfig(pass_workers=2, pass_executor="process"))
+    assert _parts(pooled) == _parts(direct)
+    assert b"c\rd" in _parts(direct)["word/header1.xml"]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Moteur : comportements de process_bytes vus de l'extérieur."""
+import logging
+
+from fiches_engine import NS, W, process_bytes, set_run_props
+from fiches_xml import fromstring, tostring
+
+def test_conversion_is_silent_on_stdout(fiches, capsys, caplog):
+    with caplog.at_level(logging.DEBUG, logger="fiches_engine"):
+        process_bytes(fiches["svg_megaphones"])
+    assert capsys.readouterr().out == ""
+    assert any("SVG" in r.getMessage() for r in caplog.records)
+
+def _run(inner: str):
+    return fromstring(f'<w:r xmlns:w="{W}">{inner}</w:r>'.encode())
+
+def test_run_patch_merges_duplicate_rpr_keeping_first_of_each_property():
+    run = _run('<w:rPr><w:u w:val="single"/><w:sz w:val="20"/></w:rPr><w:t>a</w:t>'
+               '<w:rPr><w:u w:val="double"/><w:highlight w:val="yellow"/><w:sz w:val="30"/></w:rPr>')
+    set_run_props(run, size=12)
+    rprs = run.findall("w:rPr", NS)
+    assert len(rprs) == 1 and run[0] is rprs[0]
+    tags = [el.tag for el in rprs[0]]
+    assert len(tags) == len(set(tags))
+    assert rprs[0].find("w:u", NS).get(f"{{{W}}}val") == "single"
+    assert rprs[0].find("w:highlight", NS) is not None
+    assert rprs[0].find("w:sz", NS).get(f"{{{W}}}val") == "24"
+
+def test_run_patch_inserts_missing_rpr_first():
+    run = _run('<w:t>a</w:t><w:br/>')
+    set_run_props(run, size=10, bold=True)
+    assert run[0].tag == f"{{{W}}}rPr"
+
+def test_repeated_run_patches_keep_xml_size_flat():
+    run = _run('<w:rPr><w:b/></w:rPr><w:t>a</w:t>')
+    set_run_props(run, size=10, bold=False, color="000000", calibri=True)
+    size = len(tostring(run))
+    for i in range(50):
+        set_run_props(run, size=(10, 11)[i % 2], bold=bool(i % 2), color="000000", calibri=True)
+        set_run_props(run, size=10, bold=False, color="000000", calibri=True)
+    assert len(tostring(run)) == size
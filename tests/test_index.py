@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Index plein texte : une fiche déjà harmonisée ne vide pas son entrée."""
+import pytest
+
+import fiches_batch
+from fiches_engine import FicheText, process_bytes
+from fiches_index import FicheIndex
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = str(tmp_path / "fiches.sqlite3")
+    try:
+        FicheIndex(path).close()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    return path
+
+def test_stamped_input_yields_no_text(fiches):
+    once = process_bytes(fiches["complete"])
+    text = FicheText()
+    assert process_bytes(once, text_sink=text) is once
+    assert not text.body
+
+def test_stamped_input_keeps_its_index_entry(fiches, tmp_path, index_path):
+    src = tmp_path / "source"
+    src.mkdir()
+    (src / "complete.docx").write_bytes(fiches["complete"])
+    first = fiches_batch.run_batch([str(src)], str(tmp_path / "lot1"), index_path=index_path, workers=1)
+    assert first.converted == 1 and not first.failed
+    index = FicheIndex(index_path)
+    try:
+        before = [(h.name, h.course, h.plan) for h in index.search("cours")]
+    finally:
+        index.close()
+    assert before
+
+    # Sortie remise dans un lot : rendue telle quelle (tampon), sans texte
+    (src / "complete.docx").write_bytes((tmp_path / "lot1" / "complete.docx").read_bytes())
+    second = fiches_batch.run_batch([str(src)], str(tmp_path / "lot2"), index_path=index_path, workers=1)
+    assert second.converted == 1 and not second.failed
+    index = FicheIndex(index_path)
+    try:
+        assert len(index) == 1
+        assert [(h.name, h.course, h.plan) for h in index.search("cours")] == before
+    finally:
+        index.close()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Limites d'ingestion : archive refusée avant décompression, le reste du lot continue."""
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+import fiches_service
+from fiches_engine import IngestionError, IngestionLimits, process_bytes
+
+def _with_entry(data: bytes, name: str, content: bytes) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin, zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            zout.writestr(info, zin.read(info))
+        zout.writestr(name, content)
+    return buf.getvalue()
+
+def _bomb(fiche: bytes) -> bytes:
+    # 8 Mio de zéros : quelques Kio une fois compressés
+    return _with_entry(fiche, "word/media/zeros.bin", bytes(8 << 20))
+
+def test_too_many_entries(fiches):
+    with pytest.raises(IngestionError, match="entrées"):
+        process_bytes(fiches["numbering"], limits=IngestionLimits(max_entries=5))
+
+def test_entry_too_large(fiches):
+    with pytest.raises(IngestionError, match="décompressé ferait"):
+        process_bytes(fiches["numbering"], limits=IngestionLimits(max_entry_bytes=1000))
+
+def test_total_too_large(fiches):
+    with pytest.raises(IngestionError, match="décompressée"):
+        process_bytes(fiches["numbering"], limits=IngestionLimits(max_total_bytes=5000))
+
+def test_compression_ratio(fiches):
+    with pytest.raises(IngestionError, match="compressé plus de"):
+        process_bytes(_bomb(fiches["numbering"]))
+
+def test_small_repetitive_parts_are_not_ratio_checked(fiches):
+    # Sous ratio_floor_bytes, un XML très répétitif se compresse légitimement bien
+    process_bytes(_with_entry(fiches["numbering"], "customXml/item9.xml", b"<a/>" * 20000))
+
+def test_rejected_file_does_not_fail_the_batch(fiches):
+    app = fiches_service.FichesService(workers=1)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("bombe.docx", _bomb(fiches["numbering"]))
+        z.writestr("tables.docx", fiches["tables"])
+    messages = [{"type": "http.request", "body": buf.getvalue(), "more_body": False}]
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    scope = {"type": "http", "method": "POST", "path": "/batch", "query_string": b"",
+             "headers": [(b"content-type", b"application/zip")]}
+    try:
+        asyncio.run(app(scope, receive, send))
+    finally:
+        app.shutdown()
+    assert response["status"] == 200
+    with zipfile.ZipFile(io.BytesIO(response["body"])) as z:
+        assert sorted(z.namelist()) == [fiches_service.ERRORS_NAME, "tables.docx"]
+        errors = z.read(fiches_service.ERRORS_NAME).decode("utf-8")
+    assert errors.startswith("bombe.docx") and "compressé plus de" in errors
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""File d'arrière-plan : un worker tué ne fait échouer que le fichier fautif."""
+import os
+import time
+
+import pytest
+
+import fiches_jobs
+import fiches_metrics as metrics
+from fiches_engine import ProcessingConfig
+
+def _fake_convert(args):
+    job_dir, idx, name = args
+    if name.startswith("bombe"):
+        os._exit(1)  # comme un worker tué par le noyau (OOM)
+    time.sleep(0.2)
+    with open(os.path.join(job_dir, "out", str(idx)), "wb") as f:
+        f.write(name.encode())
+    return name, False, 0, None, None
+
+def _wait(queue, *job_ids, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        statuses = [queue.status(j) for j in job_ids]
+        if not any(s.active for s in statuses):
+            return statuses
+        time.sleep(0.1)
+    pytest.fail("lots toujours en cours")
+
+@pytest.mark.skipif(os.name != "posix", reason="workers créés par fork")
+def test_worker_crash_fails_only_the_offending_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(fiches_jobs, "_convert_file", _fake_convert)
+    queue = fiches_jobs.JobQueue(root=str(tmp_path), workers=3)
+    try:
+        alice = queue.submit("alice", [(f"a{i}.docx", b"") for i in range(4)] + [("bombe.docx", b"")],
+                             ProcessingConfig())
+        bob = queue.submit("bob", [(f"b{i}.docx", b"") for i in range(4)], ProcessingConfig())
+        a, b = _wait(queue, alice, bob)
+        assert a.done == 5 and len(a.errors) == 1 and a.errors[0].startswith("bombe.docx")
+        assert b.done == 4 and b.errors == []
+        # Le pool remplacé sert encore
+        c, = _wait(queue, queue.submit("carol", [("c.docx", b"")], ProcessingConfig()))
+        assert c.errors == [] and queue.result_path(c.id) is not None
+    finally:
+        queue.close()
+
+def test_layout_only_resubmit_hits_the_shared_intermediate(fiches, tmp_path):
+    def hits():
+        return metrics.REGISTRY.value("fiches_cache_requests_total", cache="intermediate", result="hit")
+
+    docs = [("complete.docx", fiches["complete"])]
+    queue = fiches_jobs.JobQueue(root=str(tmp_path), workers=2)
+    try:
+        first, = _wait(queue, queue.submit("alice", docs, ProcessingConfig()))
+        assert first.errors == []
+    finally:
+        queue.close()
+    # Nouvelle file, nouveaux workers : seul le cache sur disque peut servir
+    before = hits()
+    queue = fiches_jobs.JobQueue(root=str(tmp_path), workers=2)
+    try:
+        second, = _wait(queue, queue.submit("alice", docs, ProcessingConfig(footer_size=12)))
+        assert second.errors == []
+    finally:
+        queue.close()
+    assert hits() == before + 1
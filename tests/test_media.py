@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Médias : optimisation à la taille d'affichage et fusion des copies, relations toujours cohérentes."""
+import io
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+
+from PIL import Image
+
+from fiches_engine import MediaReport, ProcessingConfig, process_bytes
+from conftest import _REL_BASE, _cover, _image, _para, build_docx
+
+P_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+def _photo(size=(1600, 1200)) -> bytes:
+    """PNG opaque photographique : dégradé bruité, des milliers de couleurs."""
+    w, h = size
+    noise = Image.effect_noise(size, 24)
+    gradient = Image.linear_gradient("L").resize(size)
+    im = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    buf = io.BytesIO()
+    im.save(buf, "PNG")
+    return buf.getvalue()
+
+def _add_header_image(data: bytes, target: str) -> bytes:
+    """Même image affichée aussi dans l'en-tête, par sa propre relation."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin, zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            content = zin.read(info)
+            if info.filename == "word/header1.xml":
+                content = content.replace(b"</w:hdr>", _image("rIdX", 90, "Logo").encode() + b"</w:hdr>")
+            zout.writestr(info, content)
+        zout.writestr("word/_rels/header1.xml.rels",
+                      f'<Relationships xmlns="{P_REL}"><Relationship Id="rIdX" '
+                      f'Type="{_REL_BASE}image" Target="{target}"/></Relationships>')
+    return buf.getvalue()
+
+def _image_targets(z: zipfile.ZipFile):
+    """(partie .rels, cible résolue) de chaque relation d'image du paquet."""
+    targets = []
+    for name in z.namelist():
+        if not name.endswith(".rels") or name.startswith("_rels/"):
+            continue
+        owner_dir = posixpath.dirname(posixpath.dirname(name))
+        for rel in ET.fromstring(z.read(name)).iter(f"{{{P_REL}}}Relationship"):
+            if rel.get("Type") == _REL_BASE + "image":
+                targets.append((name, posixpath.normpath(posixpath.join(owner_dir, rel.get("Target")))))
+    return targets
+
+def _content_types(z: zipfile.ZipFile):
+    types = ET.fromstring(z.read("[Content_Types].xml"))
+    defaults = {d.get("Extension").lower(): d.get("ContentType") for d in types.iter(f"{{{CT}}}Default")}
+    overrides = {o.get("PartName") for o in types.iter(f"{{{CT}}}Override")}
+    return defaults, overrides
+
+def _assert_consistent(z: zipfile.ZipFile):
+    names = set(z.namelist())
+    defaults, overrides = _content_types(z)
+    for rels, target in _image_targets(z):
+        assert target in names, f"{rels} vise {target}, absent du paquet"
+    for name in names:
+        ext = name.rsplit(".", 1)[-1].lower()
+        assert ext in defaults or "/" + name in overrides or name == "[Content_Types].xml", name
+    for part in overrides:
+        assert part[1:] in names, f"Override orphelin {part}"
+
+def test_large_photo_is_downsampled_and_retargeted():
+    photo = _photo()
+    docx = _add_header_image(
+        build_docx(_cover() + _para("Schéma") + _image("rId30", 30, "Photo"),
+                   {"rId30": ("photo.png", photo)}),
+        "media/photo.png",
+    )
+    report = MediaReport()
+    out = process_bytes(docx, config=ProcessingConfig(enable_media_optimization=True), media_report=report)
+    assert report.resized >= 1 and report.converted_to_jpeg == 1
+    assert report.bytes_saved > 0
+    with zipfile.ZipFile(io.BytesIO(out)) as z:
+        _assert_consistent(z)
+        assert "word/media/photo.png" not in z.namelist()
+        targets = {target for _, target in _image_targets(z)}
+        assert "word/media/photo.jpeg" in targets
+        # Les deux parties (corps et en-tête) suivent le renommage
+        assert {rels for rels, target in _image_targets(z) if target == "word/media/photo.jpeg"} == {
+            "word/_rels/document.xml.rels", "word/_rels/header1.xml.rels"}
+        defaults, _ = _content_types(z)
+        assert defaults["jpeg"] == "image/jpeg"
+        with Image.open(io.BytesIO(z.read("word/media/photo.jpeg"))) as im:
+            # Cadre carré de 540000 EMU (0,59 pouce) : ~130 pixels à 220 ppp, proportions gardées
+                assert im.format == "JPEG" and im.size == (173, 130)
+
+def test_optimization_off_keeps_media_untouched():
+    photo = _photo((400, 300))
+    out = process_bytes(build_docx(_cover() + _image("rId30", 30, "Photo"), {"rId30": ("photo.png", photo)}))
+    with zipfile.ZipFile(io.BytesIO(out)) as z:
+        assert z.read("word/media/photo.png") == photo
+
+def _declare_override(data: bytes, part: str, content_type: str) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin, zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            content = zin.read(info)
+            if info.filename == "[Content_Types].xml":
+                content = content.replace(
+                    b"</Types>", f'<Override PartName="/{part}" ContentType="{content_type}"/></Types>'.encode())
+            zout.writestr(info, content)
+    return buf.getvalue()
+
+def test_identical_media_share_one_copy():
+    logo = _photo((64, 48))
+    other = bytearray(logo)
+    other[-20] ^= 0xFF  # même taille, octets différents : à garder
+    docx = build_docx(
+        _cover() + _image("rId31", 31, "Logo") + _image("rId32", 32, "Logo bis") + _image("rId33", 33, "Autre"),
+        {"rId31": ("logo.png", logo), "rId32": ("logo_copie.png", logo), "rId33": ("autre.png", bytes(other))},
+    )
+    docx = _declare_override(_add_header_image(docx, "media/logo_copie.png"), "word/media/logo_copie.png", "image/png")
+    out = process_bytes(docx)
+    with zipfile.ZipFile(io.BytesIO(out)) as z:
+        _assert_consistent(z)
+        media = sorted(n for n in z.namelist() if n.startswith("word/media/"))
+        assert media == ["word/media/autre.png", "word/media/logo.png"]
+        assert z.read("word/media/logo.png") == logo
+        targets = _image_targets(z)
+        assert ("word/_rels/header1.xml.rels", "word/media/logo.png") in targets
+        assert sorted(t for rels, t in targets if rels == "word/_rels/document.xml.rels") == [
+            "word/media/autre.png", "word/media/logo.png", "word/media/logo.png"]
+
+def test_dedup_off_keeps_every_copy():
+    logo = _photo((64, 48))
+    docx = build_docx(_cover() + _image("rId31", 31, "Logo") + _image("rId32", 32, "Logo bis"),
+                      {"rId31": ("logo.png", logo), "rId32": ("logo_copie.png", logo)})
+    out = process_bytes(docx, config=ProcessingConfig(enable_media_dedup=False))
+    with zipfile.ZipFile(io.BytesIO(out)) as z:
+        assert {"word/media/logo.png", "word/media/logo_copie.png"} <= set(z.namelist())
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Tampon d'idempotence : une fiche déjà harmonisée revient telle quelle, et seulement elle."""
+import io
+import zipfile
+
+from fiches_engine import (
+    IngestionLimits,
+    ProcessingConfig,
+    config_fingerprint,
+    is_already_harmonized,
+    process_bytes,
+)
+
+def _rewrite(data: bytes, name: str, transform) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as zin, zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            content = zin.read(info)
+            zout.writestr(info, transform(content) if info.filename == name else content)
+    return buf.getvalue()
+
+def test_stamped_output_is_returned_unchanged(fiches):
+    once = process_bytes(fiches["complete"])
+    assert is_already_harmonized(once, config_fingerprint(ProcessingConfig()))
+    assert process_bytes(once) is once
+
+def test_other_settings_reprocess_and_restamp(fiches):
+    once = process_bytes(fiches["complete"])
+    cfg = ProcessingConfig(footer_size=12)
+    again = process_bytes(once, config=cfg)
+    assert again is not once
+    assert is_already_harmonized(again, config_fingerprint(cfg))
+    assert not is_already_harmonized(again, config_fingerprint(ProcessingConfig()))
+
+def test_settings_without_effect_on_output_keep_the_stamp(fiches):
+    once = process_bytes(fiches["numbering"])
+    assert process_bytes(once, config=ProcessingConfig(pass_workers=2)) is once
+
+def test_edited_content_invalidates_the_stamp(fiches):
+    once = process_bytes(fiches["numbering"])
+    edited = _rewrite(once, "word/document.xml", lambda xml: xml.replace(b"Puce rouge", b"Puce noire"))
+    assert not is_already_harmonized(edited, config_fingerprint(ProcessingConfig()))
+    assert process_bytes(edited) is not edited
+
+def test_stamp_check_respects_the_caller_limits(fiches):
+    once = process_bytes(fiches["numbering"])
+    tight = IngestionLimits(max_entries=3)
+    assert not is_already_harmonized(once, config_fingerprint(ProcessingConfig()), tight)
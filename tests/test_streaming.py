@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Corps en flux : même document que le traitement en arbre, préfixes mis à part."""
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+from dataclasses import replace
+
+import pytest
+
+import fiches_engine
+import fiches_metrics
+from fiches_engine import ProcessingConfig, process_bytes
+from conftest import _cover, _para, build_docx
+
+STREAMING = ProcessingConfig(enable_streaming_body=True)
+
+def _document(data: bytes) -> ET.Element:
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return ET.fromstring(z.read("word/document.xml"))
+
+def _shape(elem: ET.Element):
+    """Arbre comparable indépendamment des préfixes choisis à la sérialisation."""
+    return (elem.tag, sorted(elem.attrib.items()), elem.text or "", elem.tail or "",
+            [_shape(child) for child in elem])
+
+@pytest.mark.parametrize("fiche", ["numbering", "tables", "custom_namespaces"])
+def test_streamed_body_matches_tree_mode(fiches, fiche):
+    tree = _document(process_bytes(fiches[fiche]))
+    streamed = _document(process_bytes(fiches[fiche], config=STREAMING))
+    assert _shape(streamed) == _shape(tree)
+
+@pytest.mark.parametrize("fiche", ["svg_megaphones", "complete"])
+def test_streamed_body_matches_tree_mode_outside_cover_typography(fiches, fiche):
+    # L'encadré gris de ces fiches est ancré après la couverture : en flux, la
+    # typographie de couverture (passe spatiale) ne voit que la couverture
+    cfg = ProcessingConfig(enable_cover_typo_cleanup=False)
+    tree = _document(process_bytes(fiches[fiche], config=cfg))
+    streamed = _document(process_bytes(fiches[fiche], config=replace(cfg, enable_streaming_body=True)))
+    assert _shape(streamed) == _shape(tree)
+
+def test_public_serializer_fallback(fiches, monkeypatch):
+    expected = _shape(_document(process_bytes(fiches["complete"], config=STREAMING)))
+    monkeypatch.setattr(fiches_engine, "_ET_SERIALIZE_XML", None)
+    assert _shape(_document(process_bytes(fiches["complete"], config=STREAMING))) == expected
+
+def test_pass_timings_observed_once_per_document(monkeypatch):
+    observed = []
+    monkeypatch.setattr(fiches_metrics, "observe", lambda name, value, **labels: observed.append(name))
+
+    def observations(paragraphs: int) -> int:
+        observed.clear()
+        body = _cover() + "".join(_para(f"Paragraphe {i}") for i in range(paragraphs))
+        process_bytes(build_docx(body), config=STREAMING)
+        return observed.count("fiches_pass_seconds")
+
+    assert observations(20) == observations(400)
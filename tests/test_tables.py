@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Tableaux imbriqués : chaque run prend le rôle de la ligne de son tableau le plus proche."""
+import io
+import zipfile
+from collections import Counter
+
+import fiches_engine
+from fiches_engine import NS, W, ProcessingConfig, fromstring, get_text, process_bytes, tables_and_numbering
+
+def _run_props(root):
+    """Texte du run → (taille en demi-points, gras) ; chaque run une seule fois."""
+    props = {}
+    for r in root.iter(f"{{{W}}}r"):
+        sz = r.find("w:rPr/w:sz", NS)
+        props[get_text(r)] = (sz.get(f"{{{W}}}val") if sz is not None else None,
+                              r.find("w:rPr/w:b", NS) is not None)
+    return props
+
+def _document(data: bytes):
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        return fromstring(z.read("word/document.xml"))
+
+def test_inner_header_row_is_a_header(fiches):
+    props = _run_props(_document(process_bytes(fiches["tables"])))
+    header, body = ("24", True), ("18", False)
+    # Tableau externe
+    assert props["Notions"] == header
+    assert props["Texte courant"] == body
+    assert props["Imbriqué"] == body
+    # Tableau interne, dans une cellule de corps du tableau externe
+    assert props["Sous-en-tête"] == header
+    assert props["Valeur"] == header
+    assert props["Ligne interne"] == body
+    # Titre romain sur cellule sombre : bloc sombre, prioritaire sur l'en-tête
+    assert props["I. Introduction"] == ("20", True)
+
+def test_each_table_run_is_patched_once(fiches, monkeypatch):
+    root = _document(fiches["tables"])
+    cfg = ProcessingConfig()
+    # Seuls les rôles de ligne comptent : les titres romains sont repris ensuite, exprès
+    roles = {fiches_engine.run_patch(size=cfg.table_header_size, bold=True),
+             fiches_engine.run_patch(size=cfg.table_body_size)}
+    calls = Counter()
+    original = fiches_engine.apply_run_patch
+
+    def counting(run, patch):
+        if patch in roles:
+            calls[id(run)] += 1
+        return original(run, patch)
+
+    monkeypatch.setattr(fiches_engine, "apply_run_patch", counting)
+    tables_and_numbering(root, cfg)
+    outer = root.find(".//w:tbl", NS)
+    assert set(calls.values()) == {1}
+    assert len(calls) == sum(1 for _ in outer.iter(f"{{{W}}}r"))
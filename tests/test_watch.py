@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Dossier surveillé : un worker tué ne fait échouer que le fichier fautif."""
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+import fiches_watch
+
+def _fake_convert(args):
+    data = args[0]
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        name = z.read("nom").decode()
+    if name == "bombe":
+        os._exit(1)  # comme un worker tué par le noyau (OOM)
+    time.sleep(0.2)
+    return name.encode(), None, None, None
+
+def _drop(folder, name: str):
+    with zipfile.ZipFile(os.path.join(folder, name + ".docx"), "w") as z:
+        z.writestr("nom", name)
+
+@pytest.mark.skipif(os.name != "posix", reason="workers créés par fork")
+def test_worker_crash_fails_only_the_offending_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(fiches_watch, "_convert", _fake_convert)
+    source, dest = tmp_path / "source", tmp_path / "miroir"
+    source.mkdir()
+    for name in ["a", "b", "c", "bombe"]:
+        _drop(source, name)
+    watcher = fiches_watch.FolderWatcher(str(source), str(dest), workers=2, settle_s=0.0, use_inotify=False)
+    pools = {id(watcher.pool)}
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline and (len(watcher.files) < 4 or watcher.inflight):
+            watcher.step(timeout=0.05)
+            pools.add(id(watcher.pool))
+        assert watcher.files["bombe.docx"]["error"].startswith("worker interrompu")
+        for name in ["a", "b", "c"]:
+            assert "error" not in watcher.files[name + ".docx"]
+            assert (dest / (name + ".docx")).read_bytes() == name.encode()
+        # Un pool neuf par casse (la bombe casse deux fois), pas un par fiche perdue
+        assert len(pools) <= 3
+    finally:
+        watcher.close()
+
+def test_colliding_cleaned_names_keep_both_outputs(monkeypatch, tmp_path):
+    monkeypatch.setattr(fiches_watch, "_convert", _fake_convert)
+    source, dest = tmp_path / "source", tmp_path / "miroir"
+    source.mkdir()
+    for name in ["X", "X actu"]:
+        _drop(source, name)
+    watcher = fiches_watch.FolderWatcher(str(source), str(dest), workers=1, settle_s=0.0, use_inotify=False)
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline and (len(watcher.files) < 2 or watcher.inflight):
+            watcher.step(timeout=0.05)
+        outputs = {rel: entry["output"] for rel, entry in watcher.files.items()}
+        assert sorted(outputs.values()) == ["X (2).docx", "X.docx"]
+        assert {(dest / out).read_bytes() for out in outputs.values()} == {b"X", b"X actu"}
+        # Une source reconvertie garde sa sortie
+        assert watcher._output_rel("X actu.docx") == outputs["X actu.docx"]
+    finally:
+        watcher.close()
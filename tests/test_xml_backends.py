@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Les deux backends de fiches_xml produisent des fiches identiques octet pour octet."""
+import io
+import zipfile
+
+import pytest
+
+import fiches_xml
+from fiches_engine import ProcessingConfig, process_bytes
+from conftest import asset
+
+pytestmark = pytest.mark.skipif(fiches_xml._lx is None, reason="lxml absent")
+
+CONFIGS = {
+    "défaut": ProcessingConfig(),
+    "fusion_et_styles": ProcessingConfig(enable_run_coalescing=True, enable_style_promotion=True),
+    "parties_en_parallèle": ProcessingConfig(pass_workers=4),
+}
+
+def _convert(monkeypatch, backend: str, data: bytes, cfg: ProcessingConfig, samples) -> bytes:
+    monkeypatch.setattr(fiches_xml, "BACKEND", backend)
+    return process_bytes(data, legend_bytes=asset("Legende.png"), megaphone_samples=samples, config=cfg)
+
+@pytest.mark.parametrize("cfg_name", sorted(CONFIGS))
+@pytest.mark.parametrize("fiche", ["numbering", "tables", "svg_megaphones", "custom_namespaces", "complete"])
+def test_same_bytes_on_both_backends(monkeypatch, fiches, megaphone_samples, fiche, cfg_name):
+    cfg = CONFIGS[cfg_name]
+    with_stdlib = _convert(monkeypatch, "stdlib", fiches[fiche], cfg, megaphone_samples)
+    with_lxml = _convert(monkeypatch, "lxml", fiches[fiche], cfg, megaphone_samples)
+    # Parties comparées une à une : l'horodatage des entrées ZIP suit l'horloge
+    a, b = zipfile.ZipFile(io.BytesIO(with_stdlib)), zipfile.ZipFile(io.BytesIO(with_lxml))
+    assert a.namelist() == b.namelist()
+    for name in a.namelist():
+        assert a.read(name) == b.read(name), name
+
+def test_lxml_tree_serializes_like_stdlib(fiches):
+    with zipfile.ZipFile(io.BytesIO(fiches["complete"])) as z:
+        for name in z.namelist():
+            if name.endswith((".xml", ".rels")):
+                data = z.read(name)
+                expected = fiches_xml.ET.tostring(fiches_xml.ET.fromstring(data), encoding="utf-8",
+                                                  xml_declaration=True)
+                assert fiches_xml.tostring(fiches_xml._lx.fromstring(data, fiches_xml._PARSER)) == expected, name